@@ -0,0 +1,117 @@
+"""
+Serie temporal de actividad con rollups diarios pre-agregados.
+
+Cada evento (notificaciones y altas de publicadores) incrementa el
+contador de su día y tipo en el momento en que ocurre, así que una
+consulta de 365 días recorre 365 buckets y nunca las filas originales.
+Las notificaciones automáticas que acompañan a un alta no se cuentan: el
+alta ya está contada como TIPO_ALTA_PUBLICADOR.
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from db import parsear_fecha
+
+AGRUPACIONES = ("dia", "semana")
+
+# Tipo de evento derivado del created_at de la tabla publicadores
+TIPO_ALTA_PUBLICADOR = "alta_publicador"
+
+# Tipos de notificación que repiten un alta de publicador
+TIPOS_ESPEJO_ALTA = frozenset({"publicador_agregado", "publicadores_importados"})
+
+
+class RollupActividad:
+    def __init__(self, dias_retencion: int = 400):
+        self.dias_retencion = dias_retencion
+        self._dias = {}
+        self.reconstruido_en = None
+        # Eventos registrados mientras corre cada reconstrucción, para reaplicarlos al terminar
+        self._durante_reconstruccion = []
+
+    def registrar(self, tipo: str, fecha: Optional[datetime] = None, cantidad: int = 1):
+        if tipo in TIPOS_ESPEJO_ALTA:
+            return
+        fecha = fecha or datetime.now(timezone.utc)
+        for pendientes in self._durante_reconstruccion:
+            pendientes.append((tipo, fecha, cantidad))
+        dia = fecha.astimezone(timezone.utc).date() if fecha.tzinfo else fecha.date()
+        if dia < self._dia_minimo():
+            return
+        self._dias.setdefault(dia, Counter())[tipo] += cantidad
+
+    def _dia_minimo(self) -> date:
+        return datetime.now(timezone.utc).date() - timedelta(days=self.dias_retencion)
+
+    def podar(self):
+        """Descartar buckets fuera de la ventana de retención"""
+        minimo = self._dia_minimo()
+        for dia in [d for d in self._dias if d < minimo]:
+            del self._dias[dia]
+
+    async def reconstruir(self, eventos):
+        """Reconstruir los rollups desde un iterador asíncrono de (tipo, fecha).
+        La memoria usada depende del número de buckets, no del de eventos.
+        Los eventos registrados mientras se lee el historial se guardan aparte y se
+        aplican al rollup nuevo antes de reemplazar el actual; del historial solo se
+        toman los anteriores al inicio, para no contarlos dos veces."""
+        corte = datetime.now(timezone.utc)
+        pendientes = []
+        self._durante_reconstruccion.append(pendientes)
+        try:
+            nuevo = RollupActividad(self.dias_retencion)
+            async for tipo, fecha in eventos:
+                if _comparable(fecha) < corte:
+                    nuevo.registrar(tipo, fecha)
+            for tipo, fecha, cantidad in pendientes:
+                nuevo.registrar(tipo, fecha, cantidad)
+            # Sin await entre el reaplicado y el reemplazo: ningún registrar queda afuera
+            self._dias = nuevo._dias
+            self.reconstruido_en = datetime.now(timezone.utc)
+        finally:
+            self._durante_reconstruccion.remove(pendientes)
+
+    def serie(self, desde: date, hasta: date, agrupacion: str = "dia", tipos=None) -> dict:
+        if agrupacion not in AGRUPACIONES:
+            raise ValueError(f"Agrupación no válida: {agrupacion}")
+
+        buckets = {}
+        dia = desde
+        while dia <= hasta:
+            inicio = dia - timedelta(days=dia.weekday()) if agrupacion == "semana" else dia
+            acumulado = buckets.setdefault(inicio, Counter())
+            acumulado.update(self._dias.get(dia, {}))
+            dia += timedelta(days=1)
+
+        etiquetas = sorted(buckets)
+        nombres = sorted(tipos or {t for c in buckets.values() for t in c})
+        series = {t: [buckets[e].get(t, 0) for e in etiquetas] for t in nombres}
+        return {
+            "desde": desde.isoformat(),
+            "hasta": hasta.isoformat(),
+            "agrupacion": agrupacion,
+            "labels": [e.isoformat() for e in etiquetas],
+            "series": series,
+            "total": [sum(s[i] for s in series.values()) for i in range(len(etiquetas))],
+        }
+
+
+def _comparable(fecha: datetime) -> datetime:
+    # Las fechas sin zona horaria se toman como UTC
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+
+
+async def eventos_historicos(db, desde: datetime):
+    """Generador de eventos (tipo, fecha) leídos por páginas keyset"""
+    async for fila in db.iterar_keyset(
+        "notificaciones", columnas="tipo", columna_orden="fecha_creacion",
+        filtros=lambda q: q.gte("fecha_creacion", desde.isoformat()),
+    ):
+        yield fila["tipo"], parsear_fecha(fila["fecha_creacion"])
+
+    async for fila in db.iterar_keyset(
+        "publicadores", columnas="created_at",
+        filtros=lambda q: q.gte("created_at", desde.isoformat()),
+    ):
+        yield TIPO_ALTA_PUBLICADOR, parsear_fecha(fila["created_at"])
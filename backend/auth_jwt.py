@@ -0,0 +1,121 @@
+"""
+Verificación local de los JWT emitidos por Supabase Auth.
+
+Evita una llamada de red al servidor de autenticación en cada request:
+la firma, la expiración, la audiencia y el emisor se comprueban en el
+proceso, usando el secreto JWT del proyecto (HS256) o las claves públicas
+publicadas en el JWKS del proyecto (RS256/ES256).
+"""
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+from jose import jwt
+from jose.exceptions import JWTError, ExpiredSignatureError, JWTClaimsError
+
+ALGORITMOS_ASIMETRICOS = ["RS256", "ES256"]
+
+
+class TokenInvalido(Exception):
+    """El token fue rechazado (firma, expiración, audiencia o emisor)"""
+
+
+class VerificacionNoDisponible(Exception):
+    """No hay clave local con la que verificar el token (se puede usar el fallback remoto)"""
+
+
+class VerificadorJWT:
+    def __init__(
+        self,
+        supabase_url: str,
+        jwt_secret: Optional[str] = None,
+        audiencia: str = "authenticated",
+        jwks_ttl: int = 600,
+        jwks_intervalo_minimo: int = 30,
+        margen_segundos: int = 30,
+        http: Optional[httpx.AsyncClient] = None,
+    ):
+        self.emisor = f"{supabase_url.rstrip('/')}/auth/v1"
+        self.jwks_url = f"{self.emisor}/.well-known/jwks.json"
+        self.jwt_secret = jwt_secret
+        self.audiencia = audiencia
+        self.jwks_ttl = jwks_ttl
+        self.jwks_intervalo_minimo = jwks_intervalo_minimo
+        self.margen_segundos = margen_segundos
+        self._claves = {}
+        self._jwks_cargado_en = 0.0
+        # Cliente HTTP asíncrono compartido (el pool de la API); sin él se abre uno por descarga
+        self._http = http
+        # Se crea al primer uso, dentro del event loop del servidor
+        self._lock = None
+
+    async def _descargar_jwks(self):
+        """Descargar el JWKS sin bloquear el event loop; se limita la frecuencia para que
+        un kid desconocido no lo fuerce en cada request"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Si otra corrutina lo descargó mientras se esperaba el lock, no se repite
+            ahora = time.monotonic()
+            if ahora - self._jwks_cargado_en < self.jwks_intervalo_minimo:
+                return
+            try:
+                if self._http is not None:
+                    response = await self._http.get(self.jwks_url, timeout=5)
+                else:
+                    async with httpx.AsyncClient(timeout=5) as http:
+                        response = await http.get(self.jwks_url)
+                response.raise_for_status()
+                claves = {k["kid"]: k for k in response.json().get("keys", []) if "kid" in k}
+            except Exception as e:
+                print(f"Error al descargar JWKS: {str(e)}")
+                # Conservar las claves anteriores y no reintentar hasta el intervalo mínimo
+                self._jwks_cargado_en = ahora
+                return
+            self._claves = claves
+            self._jwks_cargado_en = ahora
+
+    async def _clave_publica(self, kid: Optional[str]):
+        if not kid:
+            raise TokenInvalido("Token sin 'kid'")
+        expirado = time.monotonic() - self._jwks_cargado_en > self.jwks_ttl
+        if expirado or kid not in self._claves:
+            # Un kid desconocido suele indicar rotación de claves
+            await self._descargar_jwks()
+        clave = self._claves.get(kid)
+        if clave is None:
+            raise VerificacionNoDisponible(f"Clave '{kid}' no encontrada en el JWKS")
+        return clave
+
+    async def verificar(self, token: str) -> dict:
+        """Verificar el token y devolver sus claims"""
+        try:
+            encabezado = jwt.get_unverified_header(token)
+        except JWTError:
+            raise TokenInvalido("Token mal formado")
+
+        algoritmo = encabezado.get("alg")
+        if algoritmo == "HS256":
+            if not self.jwt_secret:
+                raise VerificacionNoDisponible("SUPABASE_JWT_SECRET no configurado")
+            clave = self.jwt_secret
+        elif algoritmo in ALGORITMOS_ASIMETRICOS:
+            clave = await self._clave_publica(encabezado.get("kid"))
+        else:
+            raise TokenInvalido(f"Algoritmo no permitido: {algoritmo}")
+
+        try:
+            claims = jwt.decode(
+                token,
+                clave,
+                algorithms=[algoritmo],
+                audience=self.audiencia,
+                issuer=self.emisor,
+                options={"leeway": self.margen_segundos, "require_exp": True, "require_sub": True},
+            )
+        except ExpiredSignatureError:
+            raise TokenInvalido("Token expirado")
+        except (JWTClaimsError, JWTError) as e:
+            raise TokenInvalido(str(e))
+        return claims
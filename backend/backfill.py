@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Rellenar columnas derivadas en filas existentes.
+
+Comandos:
+  geohash       marcaciones sin geohash (necesario para GET /marcaciones?bbox=)
+  territorios   territorios sin bbox, área, centroide ni número de vértices
+
+Usa las mismas variables de entorno que la API (SUPABASE_URL y
+SUPABASE_SERVICE_KEY). Escribe por lotes con upsert sobre id.
+
+Uso: python backfill.py {geohash,territorios} [--lote 500]
+"""
+import argparse
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from db import ClienteDB
+from geo import geohash, metadatos_poligonos, poligonos_geojson, validar_poligonos
+from teselas import PRECISION_GEOHASH
+
+
+async def backfill_geohash(db: ClienteDB, lote: int) -> int:
+    pendientes = []
+    total = 0
+    filas = db.iterar_keyset("marcaciones", lote=lote, filtros=lambda q: q.is_("geohash", "null"))
+    async for fila in filas:
+        fila["geohash"] = geohash(float(fila["latitud"]), float(fila["longitud"]), PRECISION_GEOHASH)
+        pendientes.append(fila)
+        if len(pendientes) >= lote:
+            await db.table("marcaciones").upsert(pendientes, on_conflict="id").execute()
+            total += len(pendientes)
+            pendientes = []
+    if pendientes:
+        await db.table("marcaciones").upsert(pendientes, on_conflict="id").execute()
+        total += len(pendientes)
+    return total
+
+
+async def backfill_territorios(db: ClienteDB, lote: int) -> int:
+    """Los territorios son pocos: se escriben todos en un solo upsert al final.
+    Los polígonos que no pasarían la validación de la API se informan igual."""
+    actualizados = []
+    filas = db.iterar_keyset("territorios", lote=lote, filtros=lambda q: q.is_("num_vertices", "null"))
+    async for fila in filas:
+        try:
+            poligonos = poligonos_geojson(fila["geojson_data"])
+        except ValueError as e:
+            print(f"Territorio {fila['id']} omitido: {str(e)}")
+            continue
+        try:
+            validar_poligonos(poligonos)
+        except ValueError as e:
+            print(f"Territorio {fila['id']} con geometría a corregir: {str(e)}")
+        actualizados.append({**fila, **metadatos_poligonos(poligonos)})
+    for i in range(0, len(actualizados), lote):
+        await db.table("territorios").upsert(actualizados[i:i + lote], on_conflict="id").execute()
+    return len(actualizados)
+
+
+COMANDOS = {"geohash": backfill_geohash, "territorios": backfill_territorios}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("comando", choices=sorted(COMANDOS))
+    parser.add_argument("--lote", type=int, default=500)
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = ClienteDB(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+    try:
+        total = await COMANDOS[args.comando](db, args.lote)
+        print(f"{args.comando}: {total} filas actualizadas")
+    finally:
+        await db.cerrar()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
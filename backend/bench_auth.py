@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark del costo de autenticación por request: verificación remota
+(supabase.auth.get_user) contra verificación local del JWT.
+
+Uso: python bench_auth.py [--requests 500] [--latencia-ms 5]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from supabase import create_client
+
+from auth_jwt import VerificadorJWT
+from stub_supabase import JWT_SECRET, SERVICE_KEY, crear_token, iniciar_stub
+
+
+def medir(nombre: str, funcion, n: int):
+    tiempos = []
+    for _ in range(n):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    p50 = tiempos[len(tiempos) // 2] * 1000
+    p99 = tiempos[int(len(tiempos) * 0.99) - 1] * 1000
+    print(f"{nombre:<28} p50={p50:8.3f} ms  p99={p99:8.3f} ms  total={sum(tiempos):7.3f} s")
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latencia-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    servidor, url = iniciar_stub(latencia=args.latencia_ms / 1000)
+    token = crear_token(url, str(uuid.uuid4()))
+    print(f"Stub de Supabase en {url} (latencia simulada {args.latencia_ms} ms), {args.requests} requests\n")
+
+    cliente = create_client(url, SERVICE_KEY)
+    verificador = VerificadorJWT(url, jwt_secret=JWT_SECRET)
+
+    remoto = medir("Remoto (auth.get_user)", lambda: cliente.auth.get_user(token), args.requests)
+    loop = asyncio.new_event_loop()
+    local = medir(
+        "Local (VerificadorJWT)", lambda: loop.run_until_complete(verificador.verificar(token)), args.requests
+    )
+    loop.close()
+    print(f"\nAceleración p50: {remoto / local:.0f}x")
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
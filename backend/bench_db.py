@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark de concurrencia: cliente síncrono de supabase llamado desde
+corrutinas (bloquea el event loop) contra la capa asíncrona de db.py,
+ambos contra un PostgREST local con latencia simulada.
+
+Uso: python bench_db.py [--latencia-ms 20] [--consultas 200]
+"""
+import argparse
+import asyncio
+import time
+
+from supabase import create_client
+
+from db import ClienteDB
+from stub_supabase import SERVICE_KEY, iniciar_stub, tablas
+
+CONCURRENCIAS = [1, 5, 10, 25, 50]
+
+
+async def correr(consulta, concurrencia: int, total: int) -> float:
+    """Ejecutar `total` consultas repartidas en `concurrencia` clientes; devuelve consultas/s"""
+    por_cliente = max(total // concurrencia, 1)
+
+    async def cliente():
+        for _ in range(por_cliente):
+            await consulta()
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+    return por_cliente * concurrencia / (time.perf_counter() - inicio)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latencia-ms", type=float, default=20.0)
+    parser.add_argument("--consultas", type=int, default=200)
+    args = parser.parse_args()
+
+    servidor, url = iniciar_stub(latencia=args.latencia_ms / 1000)
+    tablas["publicadores"] = [{"id": str(i), "nombre": f"Publicador {i}", "grupo": i % 5} for i in range(50)]
+    print(f"PostgREST local en {url} (latencia simulada {args.latencia_ms} ms)\n")
+
+    sincrono = create_client(url, SERVICE_KEY)
+    asincrono = ClienteDB(url, SERVICE_KEY, max_conexiones=max(CONCURRENCIAS))
+
+    async def consulta_sincrona():
+        sincrono.table("publicadores").select("*").eq("grupo", 1).execute()
+
+    async def consulta_asincrona():
+        await asincrono.table("publicadores").select("*").eq("grupo", 1).execute()
+
+    print(f"{'clientes':>8} | {'síncrono (req/s)':>17} | {'asíncrono (req/s)':>18}")
+    for concurrencia in CONCURRENCIAS:
+        antes = await correr(consulta_sincrona, concurrencia, args.consultas)
+        despues = await correr(consulta_asincrona, concurrencia, args.consultas)
+        print(f"{concurrencia:>8} | {antes:>17.1f} | {despues:>18.1f}")
+
+    await asincrono.cerrar()
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de la ingesta GPS: simula N dispositivos concurrentes que
+envían lotes de fixes a POST /ubicaciones/lote contra la API real
+(uvicorn) conectada a un Supabase local (stub_supabase.py). El stub, la
+API y los clientes comparten un proceso, así que las cifras absolutas son
+conservadoras; lo relevante es cuántas filas e INSERTs llegan a la base.
+
+Uso: python bench_gps.py [--dispositivos 200] [--envios 10] [--fixes 10]
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from stub_supabase import JWT_SECRET, SERVICE_KEY, crear_token, iniciar_stub, tablas
+
+
+def track(inicio_lat: float, inicio_lng: float, n: int, desde: datetime):
+    """Caminata simulada: un fix por segundo a ~1.4 m/s con ruido y algunos fixes imprecisos"""
+    rumbo = random.uniform(0, 2 * math.pi)
+    lat, lng = inicio_lat, inicio_lng
+    for i in range(n):
+        rumbo += random.uniform(-0.3, 0.3)
+        paso = 1.4 if random.random() > 0.3 else 0.0
+        lat += paso * math.cos(rumbo) / 111_320
+        lng += paso * math.sin(rumbo) / (111_320 * math.cos(math.radians(lat)))
+        yield {
+            "latitud": lat,
+            "longitud": lng,
+            "precision_gps": random.choice([5, 8, 12, 15, 80]),
+            "velocidad": paso * 3.6,
+            "fecha": (desde + timedelta(seconds=i)).isoformat(),
+        }, (lat, lng)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dispositivos", type=int, default=200)
+    parser.add_argument("--envios", type=int, default=10, help="lotes que envía cada dispositivo")
+    parser.add_argument("--fixes", type=int, default=10, help="fixes por lote (1 por segundo)")
+    parser.add_argument("--puerto", type=int, default=8799)
+    args = parser.parse_args()
+
+    servidor_stub, url = iniciar_stub()
+    os.environ.update(
+        SUPABASE_URL=url,
+        SUPABASE_ANON_KEY=SERVICE_KEY,
+        SUPABASE_SERVICE_KEY=SERVICE_KEY,
+        SUPABASE_JWT_SECRET=JWT_SECRET,
+        UBICACIONES_INTERVALO="1",
+    )
+    import uvicorn
+    import main as api
+
+    usuarios = [str(uuid.uuid4()) for _ in range(args.dispositivos)]
+    tablas["usuarios"] = [
+        {"id": u, "email": f"{u}@example.com", "nombre": f"Dispositivo {i}", "rol": "publicador",
+         "is_superuser": False, "grupo_asignado": i % 5}
+        for i, u in enumerate(usuarios)
+    ]
+
+    servidor = uvicorn.Server(uvicorn.Config(api.app, port=args.puerto, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        await asyncio.sleep(0.05)
+
+    latencias = []
+    base = f"http://127.0.0.1:{args.puerto}"
+
+    async def dispositivo(cliente: httpx.AsyncClient, usuario_id: str):
+        headers = {"Authorization": f"Bearer {crear_token(url, usuario_id)}"}
+        lat, lng = 4.60 + random.uniform(-0.05, 0.05), -74.08 + random.uniform(-0.05, 0.05)
+        desde = datetime.now(timezone.utc)
+        for envio in range(args.envios):
+            fixes = []
+            for fix, (lat, lng) in track(lat, lng, args.fixes, desde + timedelta(seconds=envio * args.fixes)):
+                fixes.append(fix)
+            inicio = time.perf_counter()
+            respuesta = await cliente.post(f"{base}/ubicaciones/lote", json={"fixes": fixes}, headers=headers)
+            respuesta.raise_for_status()
+            latencias.append(time.perf_counter() - inicio)
+
+    limites = httpx.Limits(max_connections=args.dispositivos)
+    inicio = time.perf_counter()
+    async with httpx.AsyncClient(limits=limites, timeout=30) as cliente:
+        await asyncio.gather(*(dispositivo(cliente, u) for u in usuarios))
+    duracion = time.perf_counter() - inicio
+
+    # Esperar el último vaciado del escritor
+    await asyncio.sleep(api.UBICACIONES_INTERVALO + 0.5)
+    metricas = api.escritor_ubicaciones.metricas()
+    latencias.sort()
+    total_fixes = args.dispositivos * args.envios * args.fixes
+    print(f"Dispositivos: {args.dispositivos}, lotes: {len(latencias)}, fixes enviados: {total_fixes}")
+    print(f"Duración: {duracion:.2f} s  ->  {len(latencias) / duracion:.0f} lotes/s, {total_fixes / duracion:.0f} fixes/s")
+    print(f"Latencia p50={latencias[len(latencias) // 2] * 1000:.1f} ms  "
+          f"p99={latencias[int(len(latencias) * 0.99) - 1] * 1000:.1f} ms")
+    print(f"Filas en ubicaciones: {len(tablas.get('ubicaciones', []))} "
+          f"({len(tablas.get('ubicaciones', [])) / total_fixes:.0%} de los fixes) "
+          f"en {metricas['total_lotes']} INSERTs multi-fila")
+
+    servidor.should_exit = True
+    await asyncio.sleep(0.5)
+    servidor_stub.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Caché en memoria con tamaño acotado (LRU) y expiración por tiempo (TTL)
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        # Aumenta con cada invalidación: una carga que empezó antes no debe guardarse
+        self.generacion = 0
+
+    def get(self, clave, default=None):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None:
+                    del self._datos[clave]
+                self.misses += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return entrada[1]
+
+    def set(self, clave, valor, ttl: float = None, generacion: int = None):
+        """Con `generacion` (leída antes de cargar el valor) no se guarda si hubo una
+        invalidación mientras tanto"""
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generacion is not None and generacion != self.generacion:
+                return
+            self._datos[clave] = (expira, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def invalidate(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+            self.generacion += 1
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self.generacion += 1
+
+    def __len__(self):
+        return len(self._datos)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._datos),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,147 @@
+"""
+Índice KD-tree sobre la última posición de cada usuario para consultas
+"quién está cerca" (k vecinos más cercanos y dentro de un radio).
+
+Las posiciones se guardan como vectores unitarios 3D, así la distancia
+euclídea (cuerda) es monótona con la distancia sobre la esfera y no hay
+problemas cerca del antimeridiano. El árbol es implícito sobre un array
+ordenado (sin objetos nodo). Las posiciones que cambian después de
+construirlo quedan en una lista de pendientes que se revisa por fuerza
+bruta; cuando crece demasiado, el árbol se reconstruye.
+"""
+import heapq
+import math
+
+import numpy as np
+
+from geo import RADIO_TIERRA_M
+
+TAMANO_HOJA = 8
+
+
+def _vector(lat: float, lng: float):
+    p, l = math.radians(lat), math.radians(lng)
+    return math.cos(p) * math.cos(l), math.cos(p) * math.sin(l), math.sin(p)
+
+
+def _cuerda_a_metros(cuerda: float) -> float:
+    return 2 * RADIO_TIERRA_M * math.asin(min(1.0, cuerda / 2))
+
+
+def _metros_a_cuerda(metros: float) -> float:
+    return 2 * math.sin(min(math.pi, metros / RADIO_TIERRA_M) / 2)
+
+
+class IndiceCercanos:
+    def __init__(self, min_pendientes: int = 64):
+        self.min_pendientes = min_pendientes
+        # {usuario_id: ((x, y, z), grupo)} con la posición vigente de cada usuario
+        self._actual = {}
+        # Árbol: puntos reordenados, sus usuarios y la dimensión de corte de cada nodo (su mediana)
+        self._puntos = []
+        self._ids = []
+        self._dims = []
+        # Usuarios que se movieron o llegaron después de construir el árbol
+        self._pendientes = set()
+        self.reconstrucciones = 0
+
+    def actualizar(self, usuario_id: str, lat: float, lng: float, grupo=None):
+        self._actual[usuario_id] = (_vector(lat, lng), grupo)
+        self._pendientes.add(usuario_id)
+        if len(self._pendientes) > max(self.min_pendientes, len(self._actual) // 8):
+            self.reconstruir()
+
+    def quitar(self, usuario_id: str):
+        self._actual.pop(usuario_id, None)
+        self._pendientes.discard(usuario_id)
+
+    def reconstruir(self):
+        ids = list(self._actual)
+        puntos = np.array([self._actual[u][0] for u in ids], dtype=float).reshape(-1, 3)
+        orden = np.arange(len(ids))
+        dims = [0] * len(ids)
+        pila = [(0, len(ids))]
+        while pila:
+            inicio, fin = pila.pop()
+            if fin - inicio <= TAMANO_HOJA:
+                continue
+            rango = orden[inicio:fin]
+            # Cortar por la dimensión de mayor extensión, en la mediana
+            dim = int(np.argmax(np.ptp(puntos[rango], axis=0)))
+            medio = (fin - inicio) // 2
+            orden[inicio:fin] = rango[np.argpartition(puntos[rango, dim], medio)]
+            dims[inicio + medio] = dim
+            pila.append((inicio, inicio + medio))
+            pila.append((inicio + medio + 1, fin))
+        self._puntos = [tuple(p) for p in puntos[orden].tolist()]
+        self._ids = [ids[i] for i in orden]
+        self._dims = dims
+        self._pendientes = set()
+        self.reconstrucciones += 1
+
+    def _vigente(self, usuario_id: str, grupo) -> bool:
+        actual = self._actual.get(usuario_id)
+        if actual is None or usuario_id in self._pendientes:
+            return False
+        return grupo is None or actual[1] == grupo
+
+    def _buscar(self, q, k: int, radio: float, grupo):
+        """Recorre el árbol y los pendientes; devuelve [(cuerda, usuario_id)] ordenado"""
+        mejores = []  # heap de (-distancia, usuario_id) con los k mejores
+
+        def limite():
+            return -mejores[0][0] if len(mejores) >= k else radio
+
+        def considerar(distancia: float, usuario_id: str):
+            if distancia > limite():
+                return
+            heapq.heappush(mejores, (-distancia, usuario_id))
+            if len(mejores) > k:
+                heapq.heappop(mejores)
+
+        # (inicio, fin, distancia mínima posible al rango según el plano de corte)
+        pila = [(0, len(self._ids), 0.0)]
+        while pila:
+            inicio, fin, minima = pila.pop()
+            if minima > limite():
+                continue
+            if fin - inicio <= TAMANO_HOJA:
+                for i in range(inicio, fin):
+                    if self._vigente(self._ids[i], grupo):
+                        considerar(math.dist(q, self._puntos[i]), self._ids[i])
+                continue
+            medio = inicio + (fin - inicio) // 2
+            p = self._puntos[medio]
+            if self._vigente(self._ids[medio], grupo):
+                considerar(math.dist(q, p), self._ids[medio])
+            dim = self._dims[medio]
+            diferencia = q[dim] - p[dim]
+            lejana = max(minima, abs(diferencia))
+            if diferencia < 0:
+                cerca, lejos = (inicio, medio, minima), (medio + 1, fin, lejana)
+            else:
+                cerca, lejos = (medio + 1, fin, minima), (inicio, medio, lejana)
+            # Se apila primero el lado lejano para visitar antes el cercano
+            pila.append(lejos)
+            pila.append(cerca)
+
+        for usuario_id in self._pendientes:
+            vector, grupo_usuario = self._actual[usuario_id]
+            if grupo is None or grupo_usuario == grupo:
+                considerar(math.dist(q, vector), usuario_id)
+        return sorted((-d, u) for d, u in mejores)
+
+    def k_cercanos(self, lat: float, lng: float, k: int, radio_m: float = None, grupo=None):
+        """[(usuario_id, distancia_m)] de los k usuarios más cercanos (opcionalmente dentro de radio_m)"""
+        radio = _metros_a_cuerda(radio_m) if radio_m is not None else 2.0
+        return [(u, _cuerda_a_metros(d)) for d, u in self._buscar(_vector(lat, lng), k, radio, grupo)]
+
+    def en_radio(self, lat: float, lng: float, radio_m: float, grupo=None):
+        return self.k_cercanos(lat, lng, len(self._actual) or 1, radio_m, grupo)
+
+    def metricas(self) -> dict:
+        return {
+            "usuarios": len(self._actual),
+            "pendientes": len(self._pendientes),
+            "reconstrucciones": self.reconstrucciones,
+        }
@@ -0,0 +1,138 @@
+"""
+Clustering jerárquico de marcaciones por nivel de zoom (estilo supercluster).
+
+Para cada zoom entre `zoom_min` y `zoom_max` las marcaciones se agrupan
+en celdas de `radio_px` píxeles en coordenadas Web Mercator, con su
+conteo, suma de coordenadas (para el centroide) y conteo por tipo. Como
+cada celda de un zoom se divide exactamente en 4 del siguiente, la
+jerarquía queda implícita en los índices de celda: agregar o quitar una
+marcación cuesta O(niveles) y consultar un viewport recorre solo las
+celdas visibles, sin importar cuántas marcaciones haya.
+"""
+from geo import desde_mercator, mercator
+
+
+class ClustersMarcaciones:
+    def __init__(self, tipos, zoom_min: int = 0, zoom_max: int = 16, radio_px: int = 60):
+        self.tipos = list(tipos)
+        self.zoom_min = zoom_min
+        self.zoom_max = zoom_max
+        # Celdas de radio_px en teselas de 256 px: 2^z * 256 / radio_px celdas por lado
+        self._celdas_por_lado = {z: 2 ** z * 256 / radio_px for z in range(zoom_min, zoom_max + 1)}
+        # Por zoom: {(cx, cy): [total, suma_x, suma_y, conteo por tipo...]}
+        self._niveles = {z: {} for z in range(zoom_min, zoom_max + 1)}
+        # Ids de las marcaciones de cada celda del zoom más detallado
+        self._ids = {}
+        # {marcacion_id: (x, y, tipo)} para poder quitar o mover una marcación
+        self._puntos = {}
+        self.lista = False
+
+    def _celda(self, zoom: int, x: float, y: float):
+        n = self._celdas_por_lado[zoom]
+        return int(x * n), int(y * n)
+
+    def _aplicar(self, x: float, y: float, tipo: str, signo: int):
+        indice_tipo = 3 + self.tipos.index(tipo) if tipo in self.tipos else None
+        for zoom, celdas in self._niveles.items():
+            celda = self._celda(zoom, x, y)
+            acumulado = celdas.get(celda)
+            if acumulado is None:
+                acumulado = celdas[celda] = [0, 0.0, 0.0] + [0] * len(self.tipos)
+            acumulado[0] += signo
+            acumulado[1] += signo * x
+            acumulado[2] += signo * y
+            if indice_tipo is not None:
+                acumulado[indice_tipo] += signo
+            if acumulado[0] <= 0:
+                del celdas[celda]
+
+    def agregar(self, marcacion: dict):
+        marcacion_id = marcacion["id"]
+        if marcacion_id in self._puntos:
+            self.quitar(marcacion_id)
+        x, y = mercator(float(marcacion["latitud"]), float(marcacion["longitud"]))
+        self._puntos[marcacion_id] = (x, y, marcacion.get("tipo"))
+        self._aplicar(x, y, marcacion.get("tipo"), 1)
+        self._ids.setdefault(self._celda(self.zoom_max, x, y), set()).add(marcacion_id)
+
+    def quitar(self, marcacion_id: str):
+        punto = self._puntos.pop(marcacion_id, None)
+        if punto is None:
+            return
+        x, y, tipo = punto
+        self._aplicar(x, y, tipo, -1)
+        celda = self._celda(self.zoom_max, x, y)
+        ids = self._ids.get(celda)
+        if ids is not None:
+            ids.discard(marcacion_id)
+            if not ids:
+                del self._ids[celda]
+
+    def _descender(self, zoom: int, celda):
+        """Seguir la celda hacia zooms mayores mientras no se divida.
+        Devuelve (zoom en que se divide o None, celda del zoom máximo si nunca se divide)."""
+        cx, cy = celda
+        for z in range(zoom + 1, self.zoom_max + 1):
+            hijas = [
+                (hx, hy)
+                for hx in (2 * cx, 2 * cx + 1) for hy in (2 * cy, 2 * cy + 1)
+                if (hx, hy) in self._niveles[z]
+            ]
+            if len(hijas) != 1:
+                return z, None
+            cx, cy = hijas[0]
+        return None, (cx, cy)
+
+    def consultar(self, bbox, zoom: int):
+        """Clusters y marcaciones sueltas visibles en el bbox (min_lng, min_lat, max_lng, max_lat)"""
+        zoom = max(self.zoom_min, min(self.zoom_max, zoom))
+        celdas = self._niveles[zoom]
+        x0, y0 = mercator(bbox[3], bbox[0])
+        x1, y1 = mercator(bbox[1], bbox[2])
+        (cx0, cy0), (cx1, cy1) = self._celda(zoom, x0, y0), self._celda(zoom, x1, y1)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= len(celdas):
+            visibles = (
+                ((cx, cy), celdas[(cx, cy)])
+                for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1) if (cx, cy) in celdas
+            )
+        else:
+            visibles = (
+                (celda, a) for celda, a in celdas.items()
+                if cx0 <= celda[0] <= cx1 and cy0 <= celda[1] <= cy1
+            )
+        resultado = []
+        for celda, acumulado in visibles:
+            total = acumulado[0]
+            lat, lng = desde_mercator(acumulado[1] / total, acumulado[2] / total)
+            if total == 1:
+                _, celda_max = self._descender(zoom, celda)
+                ids = self._ids.get(celda_max, ())
+                if len(ids) == 1:
+                    marcacion_id = next(iter(ids))
+                    resultado.append({
+                        "cluster": False,
+                        "id": marcacion_id,
+                        "latitud": round(lat, 7),
+                        "longitud": round(lng, 7),
+                        "tipo": self._puntos[marcacion_id][2],
+                    })
+                    continue
+            zoom_expansion, _ = self._descender(zoom, celda)
+            resultado.append({
+                "cluster": True,
+                "id": f"{zoom}/{celda[0]}/{celda[1]}",
+                "latitud": round(lat, 7),
+                "longitud": round(lng, 7),
+                "total": total,
+                "por_tipo": {t: acumulado[3 + i] for i, t in enumerate(self.tipos) if acumulado[3 + i]},
+                # None: siguen juntas en el zoom máximo (mismo punto o casi)
+                "zoom_expansion": zoom_expansion,
+            })
+        return resultado
+
+    def metricas(self) -> dict:
+        return {
+            "marcaciones": len(self._puntos),
+            "celdas": sum(len(c) for c in self._niveles.values()),
+            "lista": self.lista,
+        }
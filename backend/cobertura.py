@@ -0,0 +1,149 @@
+"""
+Cobertura de territorios: qué parte de cada territorio ya se trabajó.
+
+Cada territorio se rasteriza una vez en una grilla de celdas de tamaño
+fijo en metros (solo cuentan las celdas cuyo centro cae dentro del
+polígono). Cada marcación marca su celda como cubierta, así que el
+porcentaje cuesta O(1) por marcación y no hace falta volver a leer la
+tabla marcaciones. La grilla solo se recalcula si cambia el geojson_data.
+"""
+import hashlib
+import json
+import math
+
+import numpy as np
+
+from geo import bbox_poligonos, poligonos_geojson, puntos_en_poligonos
+
+METROS_POR_GRADO = 111320.0
+
+
+def huella_geojson(geojson) -> str:
+    if isinstance(geojson, str):
+        geojson = json.loads(geojson)
+    return hashlib.sha1(json.dumps(geojson, sort_keys=True).encode()).hexdigest()
+
+
+class GrillaTerritorio:
+    def __init__(self, poligonos, celda_m: float, max_celdas: int):
+        min_lng, min_lat, max_lng, max_lat = bbox_poligonos(poligonos)
+        cos_lat = max(0.01, math.cos(math.radians((min_lat + max_lat) / 2)))
+        ancho_m = (max_lng - min_lng) * METROS_POR_GRADO * cos_lat
+        alto_m = (max_lat - min_lat) * METROS_POR_GRADO
+        # Territorios muy grandes usan celdas más grandes para acotar la memoria
+        celda_m = max(celda_m, math.sqrt(ancho_m * alto_m / max_celdas))
+        self.celda_m = celda_m
+        self.min_lat, self.min_lng = min_lat, min_lng
+        self.dlat = celda_m / METROS_POR_GRADO
+        self.dlng = celda_m / (METROS_POR_GRADO * cos_lat)
+        self.filas = max(1, math.ceil((max_lat - min_lat) / self.dlat))
+        self.columnas = max(1, math.ceil((max_lng - min_lng) / self.dlng))
+        centros_lat = min_lat + (np.arange(self.filas) + 0.5) * self.dlat
+        centros_lng = min_lng + (np.arange(self.columnas) + 0.5) * self.dlng
+        lats, lngs = np.meshgrid(centros_lat, centros_lng, indexing="ij")
+        self.dentro = puntos_en_poligonos(lats.ravel(), lngs.ravel(), poligonos).reshape(self.filas, self.columnas)
+        self.total = int(self.dentro.sum())
+        self.cubiertas = np.zeros_like(self.dentro)
+        self.num_cubiertas = 0
+
+    def marcar(self, lat: float, lng: float) -> bool:
+        fila = math.floor((lat - self.min_lat) / self.dlat)
+        columna = math.floor((lng - self.min_lng) / self.dlng)
+        if not (0 <= fila < self.filas and 0 <= columna < self.columnas):
+            return False
+        if not self.dentro[fila, columna] or self.cubiertas[fila, columna]:
+            return False
+        self.cubiertas[fila, columna] = True
+        self.num_cubiertas += 1
+        return True
+
+    def sin_cubrir_geojson(self) -> dict:
+        """Celdas sin cubrir como un MultiPolygon; las celdas contiguas de una misma
+        fila se unen en un solo rectángulo para reducir el tamaño de la respuesta"""
+        pendientes = self.dentro & ~self.cubiertas
+        rectangulos = []
+        for fila in range(self.filas):
+            columnas = np.flatnonzero(pendientes[fila])
+            if not len(columnas):
+                continue
+            # Cortes donde la secuencia de columnas deja de ser consecutiva
+            cortes = np.flatnonzero(np.diff(columnas) > 1)
+            inicios = np.concatenate(([columnas[0]], columnas[cortes + 1]))
+            finales = np.concatenate((columnas[cortes], [columnas[-1]]))
+            lat0 = round(self.min_lat + fila * self.dlat, 7)
+            lat1 = round(lat0 + self.dlat, 7)
+            for inicio, final in zip(inicios.tolist(), finales.tolist()):
+                lng0 = round(self.min_lng + inicio * self.dlng, 7)
+                lng1 = round(self.min_lng + (final + 1) * self.dlng, 7)
+                rectangulos.append([[[lng0, lat0], [lng1, lat0], [lng1, lat1], [lng0, lat1], [lng0, lat0]]])
+        return {"type": "MultiPolygon", "coordinates": rectangulos}
+
+
+class MotorCobertura:
+    def __init__(self, celda_m: float = 25.0, max_celdas: int = 250000):
+        self.celda_m = celda_m
+        self.max_celdas = max_celdas
+        # {territorio_id: (huella del geojson, GrillaTerritorio)}
+        self._territorios = {}
+        # True cuando terminó la carga inicial de marcaciones
+        self.lista = False
+
+    def preparar(self, territorio: dict) -> bool:
+        """Rasterizar el territorio si es nuevo o cambió su geojson_data.
+        Devuelve True si la grilla se creó de cero (hay que volver a cargar sus marcaciones)."""
+        if territorio.get("estado", "activo") != "activo":
+            self.quitar(territorio["id"])
+            return False
+        try:
+            huella = huella_geojson(territorio["geojson_data"])
+            actual = self._territorios.get(territorio["id"])
+            if actual is not None and actual[0] == huella:
+                return False
+            grilla = GrillaTerritorio(poligonos_geojson(territorio["geojson_data"]), self.celda_m, self.max_celdas)
+        except (ValueError, json.JSONDecodeError) as e:
+            print(f"Territorio {territorio['id']} sin cobertura, GeoJSON no válido: {str(e)}")
+            self.quitar(territorio["id"])
+            return False
+        self._territorios[territorio["id"]] = (huella, grilla)
+        return True
+
+    def quitar(self, territorio_id: str):
+        self._territorios.pop(territorio_id, None)
+
+    def marcar(self, marcacion: dict) -> bool:
+        actual = self._territorios.get(marcacion.get("territorio_id"))
+        if actual is None:
+            return False
+        return actual[1].marcar(float(marcacion["latitud"]), float(marcacion["longitud"]))
+
+    async def cargar(self, marcaciones):
+        """Marcar las celdas recorriendo un iterador asíncrono de marcaciones"""
+        async for marcacion in marcaciones:
+            self.marcar(marcacion)
+
+    def porcentaje(self, territorio_id: str):
+        actual = self._territorios.get(territorio_id)
+        if actual is None:
+            return None
+        grilla = actual[1]
+        return {
+            "territorio_id": territorio_id,
+            "celda_m": round(grilla.celda_m, 1),
+            "celdas": grilla.total,
+            "cubiertas": grilla.num_cubiertas,
+            "porcentaje": round(100 * grilla.num_cubiertas / grilla.total, 1) if grilla.total else 0.0,
+        }
+
+    def resumen(self):
+        return [self.porcentaje(territorio_id) for territorio_id in self._territorios]
+
+    def sin_cubrir(self, territorio_id: str):
+        actual = self._territorios.get(territorio_id)
+        return actual[1].sin_cubrir_geojson() if actual is not None else None
+
+    def metricas(self) -> dict:
+        return {
+            "territorios": len(self._territorios),
+            "celdas": sum(g.total for _, g in self._territorios.values()),
+            "lista": self.lista,
+        }
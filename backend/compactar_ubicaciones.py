@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Compactar las ubicaciones crudas de días anteriores en `recorridos`
+(una polilínea codificada por usuario y día) y borrar las filas crudas.
+
+Pensado para correr una vez al día (cron). Usa las mismas variables de
+entorno que la API (SUPABASE_URL y SUPABASE_SERVICE_KEY).
+
+Uso: python compactar_ubicaciones.py [--dias-crudos 1] [--sin-borrar]
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from db import ClienteDB
+from recorridos import compactar
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dias-crudos", type=int, default=1,
+                        help="días recientes (incluido hoy) que se dejan sin compactar")
+    parser.add_argument("--sin-borrar", action="store_true", help="generar recorridos sin borrar las filas crudas")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = ClienteDB(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+    hasta = datetime.now(timezone.utc).date() - timedelta(days=args.dias_crudos - 1)
+    try:
+        for resultado in await compactar(db, hasta, borrar=not args.sin_borrar):
+            print(f"{resultado['fecha']}: {resultado['fixes']} fixes -> {resultado['usuarios']} recorridos")
+    finally:
+        await db.cerrar()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
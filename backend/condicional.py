@@ -0,0 +1,165 @@
+"""
+GET condicional para listados: ETag, Last-Modified, 304 y compresión.
+
+El validador de cada recurso (publicadores, notificaciones, usuarios) se
+deriva de los datos: el máximo de su columna de última modificación y la
+cantidad de filas, leídos en una sola consulta que devuelve una fila. Así
+cambia con cualquier escritura, venga de este proceso, de otro worker o de
+un cambio directo en la base (altas y ediciones mueven el máximo, las bajas
+la cantidad). El ETag combina ese validador con el usuario, su rol y la
+query string. Si el cliente manda If-None-Match con ese ETag se responde 304
+sin llamar al endpoint, es decir sin leer el listado ni serializar. Como el
+ETag solo se entrega en respuestas 200 y es propio del usuario y su rol, que
+coincida prueba que el usuario ya tenía permiso; por eso If-Modified-Since
+(que no lo prueba) no se usa para responder 304 y Last-Modified es solo
+informativo.
+Las respuestas 200 grandes se comprimen con brotli (si el paquete está
+instalado) o gzip.
+"""
+import gzip
+import hashlib
+from email.utils import formatdate
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from db import parsear_fecha
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ValidadoresRecursos:
+    """`columnas` es {recurso: (tabla, columna de última modificación)}"""
+
+    def __init__(self, db, columnas: dict):
+        self.db = db
+        self.columnas = columnas
+        self.respuestas_304 = 0
+        self.errores = 0
+
+    async def validador(self, recurso: str):
+        """(máximo de la columna o None si la tabla está vacía, cantidad de filas)"""
+        tabla, columna = self.columnas[recurso]
+        response = await (
+            self.db.table(tabla).select(columna, count="exact").order(columna, desc=True).limit(1).execute()
+        )
+        maximo = response.data[0][columna] if response.data else None
+        return maximo, response.count or 0
+
+    def etag(self, recurso: str, validador, perfil: dict, query: bytes) -> str:
+        maximo, cantidad = validador
+        clave = "|".join(str(v) for v in (
+            recurso, maximo, cantidad,
+            perfil.get("id"), perfil.get("rol"), perfil.get("is_superuser"), perfil.get("grupo_asignado"),
+            query.decode("latin-1")
+        ))
+        # Débil: el mismo ETag vale para la versión comprimida y sin comprimir
+        return 'W/"' + hashlib.sha1(clave.encode()).hexdigest()[:20] + '"'
+
+    def metricas(self) -> dict:
+        return {
+            "respuestas_304": self.respuestas_304,
+            "errores_validador": self.errores,
+            "brotli": brotli is not None,
+        }
+
+
+def etag_coincide(if_none_match: str, etag: str) -> bool:
+    # Comparación débil; "*" no se acepta porque no prueba que el usuario vio esta respuesta
+    valor = etag.removeprefix("W/")
+    return any(e.strip().removeprefix("W/") == valor for e in if_none_match.split(","))
+
+
+class CondicionalGET:
+    """Middleware ASGI. `rutas` es {path: recurso}; `autenticar(token)` devuelve el perfil
+    o lanza una excepción (en ese caso el request sigue sin tocar y el endpoint responde)."""
+
+    def __init__(self, app, rutas: dict, validadores: ValidadoresRecursos, autenticar, min_comprimir: int = 1024):
+        self.app = app
+        self.rutas = rutas
+        self.validadores = validadores
+        self.autenticar = autenticar
+        self.min_comprimir = min_comprimir
+
+    async def __call__(self, scope, receive, send):
+        recurso = self.rutas.get(scope.get("path")) if scope["type"] == "http" else None
+        if recurso is None or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        esquema, _, token = headers.get("authorization", "").partition(" ")
+        if esquema.lower() != "bearer" or not token:
+            await self.app(scope, receive, send)
+            return
+        try:
+            perfil = await self.autenticar(token)
+        except Exception:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            validador = await self.validadores.validador(recurso)
+        except Exception as e:
+            # Sin validador no se puede probar que nada cambió: respuesta completa
+            print(f"Error al leer el validador de {recurso}: {str(e)}")
+            self.validadores.errores += 1
+            await self.app(scope, receive, send)
+            return
+
+        # El ETag se calcula antes de ejecutar el endpoint: si hay una escritura mientras tanto,
+        # la respuesta queda con el validador viejo y el próximo request la vuelve a pedir
+        etag = self.validadores.etag(recurso, validador, perfil, scope.get("query_string", b""))
+        encabezados = [
+            (b"etag", etag.encode()),
+            (b"cache-control", b"private, no-cache"),
+            (b"vary", b"Authorization, Accept-Encoding"),
+        ]
+        if validador[0] is not None:
+            modificado_en = parsear_fecha(validador[0]).timestamp()
+            encabezados.append((b"last-modified", formatdate(modificado_en, usegmt=True).encode()))
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None and etag_coincide(if_none_match, etag):
+            self.validadores.respuestas_304 += 1
+            await send({"type": "http.response.start", "status": 304, "headers": encabezados})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        inicio = {}
+        partes = []
+
+        async def capturar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                inicio.update(mensaje)
+                return
+            if mensaje["type"] != "http.response.body":
+                await send(mensaje)
+                return
+            partes.append(mensaje.get("body", b""))
+            if mensaje.get("more_body", False):
+                return
+            cuerpo = b"".join(partes)
+            respuesta = MutableHeaders(raw=inicio["headers"])
+            if inicio["status"] == 200:
+                for nombre, valor in encabezados:
+                    respuesta[nombre.decode()] = valor.decode()
+                cuerpo = self._comprimir(cuerpo, headers.get("accept-encoding", ""), respuesta)
+            await send(inicio)
+            await send({"type": "http.response.body", "body": cuerpo})
+
+        await self.app(scope, receive, capturar)
+
+    def _comprimir(self, cuerpo: bytes, accept_encoding: str, respuesta: MutableHeaders) -> bytes:
+        if len(cuerpo) < self.min_comprimir or "content-encoding" in respuesta:
+            return cuerpo
+        aceptadas = {c.split(";")[0].strip().lower() for c in accept_encoding.split(",")}
+        if brotli is not None and "br" in aceptadas:
+            cuerpo, codificacion = brotli.compress(cuerpo, quality=5), "br"
+        elif "gzip" in aceptadas:
+            cuerpo, codificacion = gzip.compress(cuerpo, compresslevel=6), "gzip"
+        else:
+            return cuerpo
+        respuesta["content-encoding"] = codificacion
+        respuesta["content-length"] = str(len(cuerpo))
+        return cuerpo
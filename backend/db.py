@@ -0,0 +1,281 @@
+"""
+Capa de acceso a datos asíncrona sobre PostgREST (Supabase).
+
+Imita la interfaz encadenable del cliente de supabase
+(`table(...).select(...).eq(...).execute()`), pero `execute()` es una
+corrutina y todas las consultas comparten un pool de conexiones
+keep-alive de httpx, así que una consulta lenta no bloquea el event loop.
+"""
+import base64
+import json
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+
+
+class ErrorDB(Exception):
+    """Error devuelto por PostgREST"""
+
+    def __init__(self, status_code: int, detalle: str):
+        super().__init__(f"{status_code}: {detalle}")
+        self.status_code = status_code
+        self.detalle = detalle
+
+
+def error_permanente(error: Exception) -> bool:
+    """4xx de PostgREST: reintentar la misma escritura fallaría igual (408 y 429 son transitorios)"""
+    return isinstance(error, ErrorDB) and 400 <= error.status_code < 500 and error.status_code not in (408, 429)
+
+
+def es_uuid(valor) -> bool:
+    """True si el valor es un UUID en texto (lo que aceptan las columnas uuid de Postgres)"""
+    if not isinstance(valor, str):
+        return False
+    try:
+        uuid.UUID(valor)
+    except ValueError:
+        return False
+    return True
+
+
+class RespuestaDB:
+    def __init__(self, data, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _valor(valor) -> str:
+    """Formatear un valor para un filtro de PostgREST"""
+    if valor is None:
+        return "null"
+    if isinstance(valor, bool):
+        return "true" if valor else "false"
+    return str(valor)
+
+
+def _lista(valores) -> str:
+    partes = []
+    for v in valores:
+        texto = _valor(v)
+        if any(c in texto for c in ',()"'):
+            texto = '"' + texto.replace('"', '\\"') + '"'
+        partes.append(texto)
+    return "(" + ",".join(partes) + ")"
+
+
+def parsear_fecha(texto: str) -> datetime:
+    """Parsear un timestamp de PostgREST ('Z' u offset, 0-6 decimales) como datetime con zona"""
+    texto = texto.replace("Z", "+00:00").replace(" ", "T")
+    # fromisoformat (< 3.11) solo acepta 3 o 6 decimales
+    texto = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), texto)
+    fecha = datetime.fromisoformat(texto)
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+
+
+def codificar_cursor(valor, id_fila) -> str:
+    """Cursor opaco para paginación keyset sobre (columna de orden, id)"""
+    texto = json.dumps([valor, id_fila], separators=(",", ":"))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str):
+    """Devuelve (valor, id); lanza ValueError si el cursor no es válido"""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valor, id_fila = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    return valor, id_fila
+
+
+def validar_posicion_fecha(valor, id_fila):
+    """Lanza ValueError si (valor, id) no es (timestamp ISO, UUID). Los valores de un cursor
+    van dentro de un filtro or= de PostgREST: uno mal formado haría fallar la consulta (o
+    cambiaría el filtro) en lugar de responder 400."""
+    if not isinstance(valor, str) or not es_uuid(id_fila):
+        raise ValueError("Cursor inválido")
+    parsear_fecha(valor)
+
+
+def decodificar_cursor_fecha(cursor: str):
+    """decodificar_cursor para cursores sobre (columna timestamp, id)"""
+    valor, id_fila = decodificar_cursor(cursor)
+    validar_posicion_fecha(valor, id_fila)
+    return valor, id_fila
+
+
+class ConsultaAsync:
+    def __init__(self, cliente: "ClienteDB", tabla: str):
+        self._cliente = cliente
+        self._tabla = tabla
+        self._metodo = "GET"
+        self._params = []
+        self._cuerpo = None
+        self._prefer = []
+        self._orden = []
+
+    # --- Operaciones ---
+    def select(self, columnas: str = "*", count: Optional[str] = None):
+        self._metodo = "GET"
+        self._params.append(("select", columnas))
+        if count:
+            self._prefer.append(f"count={count}")
+        return self
+
+    def insert(self, filas, upsert: bool = False, on_conflict: Optional[str] = None,
+               ignore_duplicates: bool = False, returning: str = "representation"):
+        self._metodo = "POST"
+        self._cuerpo = filas
+        self._prefer.append(f"return={returning}")
+        if upsert or ignore_duplicates:
+            self._prefer.append(
+                "resolution=ignore-duplicates" if ignore_duplicates else "resolution=merge-duplicates"
+            )
+        if on_conflict:
+            self._params.append(("on_conflict", on_conflict))
+        return self
+
+    def upsert(self, filas, on_conflict: Optional[str] = None, ignore_duplicates: bool = False):
+        return self.insert(filas, upsert=True, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates)
+
+    def update(self, datos: dict):
+        self._metodo = "PATCH"
+        self._cuerpo = datos
+        self._prefer.append("return=representation")
+        return self
+
+    def delete(self):
+        self._metodo = "DELETE"
+        self._prefer.append("return=representation")
+        return self
+
+    # --- Filtros ---
+    def _filtro(self, columna: str, operador: str, valor):
+        self._params.append((columna, f"{operador}.{_valor(valor)}"))
+        return self
+
+    def eq(self, columna: str, valor):
+        return self._filtro(columna, "eq", valor)
+
+    def neq(self, columna: str, valor):
+        return self._filtro(columna, "neq", valor)
+
+    def gt(self, columna: str, valor):
+        return self._filtro(columna, "gt", valor)
+
+    def gte(self, columna: str, valor):
+        return self._filtro(columna, "gte", valor)
+
+    def lt(self, columna: str, valor):
+        return self._filtro(columna, "lt", valor)
+
+    def lte(self, columna: str, valor):
+        return self._filtro(columna, "lte", valor)
+
+    def like(self, columna: str, patron: str):
+        return self._filtro(columna, "like", patron)
+
+    def is_(self, columna: str, valor):
+        return self._filtro(columna, "is", valor)
+
+    def in_(self, columna: str, valores):
+        self._params.append((columna, f"in.{_lista(valores)}"))
+        return self
+
+    def or_(self, condiciones: str):
+        """Condiciones en sintaxis PostgREST, ej: 'a.lt.1,and(a.eq.1,b.lt.2)'"""
+        self._params.append(("or", f"({condiciones})"))
+        return self
+
+    def despues_de(self, columna: str, valor, id_fila, desc: bool = True):
+        """Filtro keyset: filas posteriores a (valor, id) en el orden (columna, id)"""
+        op = "lt" if desc else "gt"
+        v = _valor(valor)
+        return self.or_(f"{columna}.{op}.{v},and({columna}.eq.{v},id.{op}.{_valor(id_fila)})")
+
+    # --- Modificadores ---
+    def order(self, columna: str, desc: bool = False):
+        self._orden.append(f"{columna}.{'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, n: int):
+        self._params.append(("limit", str(n)))
+        return self
+
+    async def execute(self) -> RespuestaDB:
+        params = list(self._params)
+        if self._orden:
+            params.append(("order", ",".join(self._orden)))
+        headers = {"Prefer": ",".join(self._prefer)} if self._prefer else {}
+        response = await self._cliente.http.request(
+            self._metodo, f"/rest/v1/{self._tabla}", params=params, json=self._cuerpo, headers=headers
+        )
+        if response.status_code >= 400:
+            raise ErrorDB(response.status_code, response.text)
+
+        count = None
+        rango = response.headers.get("Content-Range")
+        if rango and "/" in rango:
+            total = rango.split("/")[-1]
+            count = int(total) if total.isdigit() else None
+        data = response.json() if response.content else []
+        return RespuestaDB(data, count)
+
+
+class ClienteDB:
+    def __init__(self, url: str, key: str, max_conexiones: int = 50, timeout: float = 10.0):
+        self.url = url.rstrip("/")
+        self.key = key
+        self.http = httpx.AsyncClient(
+            base_url=self.url,
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            limits=httpx.Limits(max_connections=max_conexiones, max_keepalive_connections=max_conexiones),
+            timeout=timeout,
+        )
+
+    def table(self, nombre: str) -> ConsultaAsync:
+        return ConsultaAsync(self, nombre)
+
+    async def iterar_keyset(self, tabla: str, columnas: str = "*", columna_orden: str = "created_at",
+                            lote: int = 1000, desc: bool = False, filtros=None):
+        """Recorrer una tabla completa por páginas keyset sobre (columna_orden, id).
+        `filtros` recibe la consulta y devuelve la consulta filtrada."""
+        if columnas != "*":
+            columnas = ",".join(dict.fromkeys([columna_orden, "id", *columnas.split(",")]))
+        cursor = None
+        while True:
+            query = self.table(tabla).select(columnas)
+            if filtros:
+                query = filtros(query)
+            if cursor:
+                query = query.despues_de(columna_orden, cursor[0], cursor[1], desc=desc)
+            response = await query.order(columna_orden, desc=desc).order("id", desc=desc).limit(lote).execute()
+            for fila in response.data:
+                yield fila
+            if len(response.data) < lote:
+                break
+            ultima = response.data[-1]
+            cursor = (ultima[columna_orden], ultima["id"])
+
+    async def contar(self, tabla: str, filtros=None) -> int:
+        """Total de filas (count=exact) sin traer datos"""
+        query = self.table(tabla).select("id", count="exact")
+        if filtros:
+            query = filtros(query)
+        response = await query.limit(1).execute()
+        return response.count or 0
+
+    async def auth_user(self, token: str) -> Optional[dict]:
+        """Validar un access token contra Supabase Auth (GET /auth/v1/user)"""
+        response = await self.http.get(
+            "/auth/v1/user", headers={"Authorization": f"Bearer {token}"}
+        )
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    async def cerrar(self):
+        await self.http.aclose()
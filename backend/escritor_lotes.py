@@ -0,0 +1,134 @@
+"""
+Escritor en segundo plano que agrupa filas y las inserta por lotes.
+
+Los endpoints encolan la fila y responden de inmediato; una tarea de
+fondo hace un INSERT multi-fila cuando la cola alcanza `max_lote` filas o
+cuando pasan `intervalo` segundos, lo que ocurra primero.
+
+Si la base rechaza el lote por su contenido (4xx), se divide en mitades
+hasta aislar las filas malas, que se descartan; solo los errores de red o
+5xx devuelven el lote a la cola para reintentarlo.
+"""
+import asyncio
+import time
+from collections import deque
+
+from db import error_permanente
+
+
+class EscritorPorLotes:
+    def __init__(self, db, tabla: str, max_lote: int = 100, intervalo: float = 1.0,
+                 max_cola: int = 10000, al_escribir=None):
+        self.db = db
+        self.tabla = tabla
+        self.max_lote = max_lote
+        self.intervalo = intervalo
+        self.max_cola = max_cola
+        # Callback opcional con las filas ya insertadas
+        self.al_escribir = al_escribir
+        self._cola = deque()
+        # Se crea en iniciar(), dentro del event loop del servidor
+        self._despertar = None
+        self._tarea = None
+        self._detenido = False
+        self.total_escritas = 0
+        self.total_lotes = 0
+        self.errores = 0
+        self.descartadas = 0
+        self.rechazadas = 0
+        self.ultima_latencia_ms = 0.0
+        self.latencia_max_ms = 0.0
+
+    def encolar(self, fila: dict):
+        if len(self._cola) >= self.max_cola:
+            # Cola llena (base de datos caída o lenta): se descarta la fila más antigua
+            self._cola.popleft()
+            self.descartadas += 1
+        self._cola.append(fila)
+        if len(self._cola) >= self.max_lote and self._despertar is not None:
+            self._despertar.set()
+
+    def iniciar(self):
+        if self._tarea is None:
+            self._despertar = asyncio.Event()
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        """Detener la tarea de fondo y escribir todo lo pendiente"""
+        if self._tarea is not None:
+            # No se cancela la tarea: así no se pierde un lote a mitad del INSERT
+            self._detenido = True
+            self._despertar.set()
+            await self._tarea
+            self._tarea = None
+        while self._cola:
+            if not await self.vaciar():
+                break
+
+    async def _bucle(self):
+        while not self._detenido:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            while self._cola:
+                if not await self.vaciar() or len(self._cola) < self.max_lote:
+                    break
+
+    async def vaciar(self) -> bool:
+        """Insertar hasta `max_lote` filas pendientes; devuelve False si falló"""
+        if not self._cola:
+            return True
+        lote = [self._cola.popleft() for _ in range(min(self.max_lote, len(self._cola)))]
+        inicio = time.perf_counter()
+        escritas, reintentar = await self._insertar(lote)
+        if escritas:
+            self.ultima_latencia_ms = (time.perf_counter() - inicio) * 1000
+            self.latencia_max_ms = max(self.latencia_max_ms, self.ultima_latencia_ms)
+            self.total_escritas += len(escritas)
+            self.total_lotes += 1
+            if self.al_escribir:
+                self.al_escribir(escritas)
+        if reintentar:
+            # Devolver a la cola las filas no escritas; si no caben, se pierden las más antiguas
+            self._cola.extendleft(reversed(reintentar))
+            while len(self._cola) > self.max_cola:
+                self._cola.popleft()
+                self.descartadas += 1
+            return False
+        return True
+
+    async def _insertar(self, lote):
+        """Devuelve (filas insertadas, filas a reintentar). Un rechazo 4xx divide el lote
+        en mitades; una fila que la base rechaza sola se descarta."""
+        try:
+            response = await self.db.table(self.tabla).insert(lote).execute()
+            return response.data, []
+        except Exception as e:
+            if not error_permanente(e):
+                print(f"Error al escribir lote en {self.tabla}: {str(e)}")
+                self.errores += 1
+                return [], lote
+            if len(lote) == 1:
+                print(f"Fila rechazada en {self.tabla}, se descarta: {str(e)}")
+                self.rechazadas += 1
+                return [], []
+        mitad = len(lote) // 2
+        escritas, reintentar = await self._insertar(lote[:mitad])
+        if reintentar:
+            return escritas, reintentar + lote[mitad:]
+        resto, reintentar = await self._insertar(lote[mitad:])
+        return escritas + resto, reintentar
+
+    def metricas(self) -> dict:
+        return {
+            "profundidad": len(self._cola),
+            "total_escritas": self.total_escritas,
+            "total_lotes": self.total_lotes,
+            "errores": self.errores,
+            "descartadas": self.descartadas,
+            "rechazadas": self.rechazadas,
+            "ultima_latencia_ms": round(self.ultima_latencia_ms, 2),
+            "latencia_max_ms": round(self.latencia_max_ms, 2),
+        }
@@ -0,0 +1,77 @@
+"""
+Estadísticas de publicadores mantenidas de forma incremental.
+
+Los contadores por grupo se actualizan en cada alta, edición o baja, así
+que el dashboard cuesta O(grupos) en lugar de O(publicadores). Se recalcula
+todo al arrancar y, como mucho una vez por intervalo de verificación, para
+corregir desviaciones en cualquiera de los agregados (total, precursores,
+con ánimo o reparto por grupo): dos ediciones concurrentes de la misma fila
+o un cambio directo en la base pueden desviarlos sin cambiar el total.
+"""
+import time
+
+
+class EstadisticasPublicadores:
+    def __init__(self):
+        self._grupos = {}
+        self.lista = False
+        self.recalculado_en = None
+        self.verificado_en = 0.0
+
+    def _grupo(self, grupo):
+        if grupo not in self._grupos:
+            self._grupos[grupo] = {"total": 0, "precursores": 0, "conAnimo": 0}
+        return self._grupos[grupo]
+
+    def _aplicar(self, fila: dict, signo: int):
+        contadores = self._grupo(fila.get("grupo"))
+        contadores["total"] += signo
+        if fila.get("precursor"):
+            contadores["precursores"] += signo
+        if fila.get("animo"):
+            contadores["conAnimo"] += signo
+        if contadores["total"] <= 0:
+            del self._grupos[fila.get("grupo")]
+
+    def agregar(self, fila: dict):
+        self._aplicar(fila, 1)
+
+    def quitar(self, fila: dict):
+        if fila.get("grupo") in self._grupos:
+            self._aplicar(fila, -1)
+
+    async def recalcular(self, filas) -> bool:
+        """Reemplazar los contadores recorriendo un iterador asíncrono de filas.
+        Devuelve True si los contadores anteriores estaban desviados."""
+        nuevas = EstadisticasPublicadores()
+        async for fila in filas:
+            nuevas.agregar(fila)
+        desviadas = self.lista and nuevas._grupos != self._grupos
+        self._grupos = nuevas._grupos
+        self.lista = True
+        self.recalculado_en = time.time()
+        self.verificado_en = time.monotonic()
+        return desviadas
+
+    @property
+    def total(self) -> int:
+        return sum(c["total"] for c in self._grupos.values())
+
+    def resumen(self) -> dict:
+        por_grupo = []
+        for grupo in sorted(self._grupos, key=lambda g: (g is None, g)):
+            c = self._grupos[grupo]
+            por_grupo.append({
+                "grupo": grupo,
+                "total": c["total"],
+                "precursores": c["precursores"],
+                "conAnimo": c["conAnimo"],
+                "porcentajePrecursor": round(c["precursores"] / c["total"] * 100) if c["total"] else 0,
+            })
+        return {
+            "total": self.total,
+            "precursores": sum(g["precursores"] for g in por_grupo),
+            "conAnimo": sum(g["conAnimo"] for g in por_grupo),
+            "gruposUnicos": len(por_grupo),
+            "porGrupo": por_grupo,
+        }
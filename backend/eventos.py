@@ -0,0 +1,114 @@
+"""
+Bus de eventos en memoria para el canal push (SSE y WebSocket).
+
+Cada suscriptor tiene una cola acotada: si un cliente lento no consume,
+se descartan sus eventos más antiguos en lugar de hacer crecer la
+memoria. Los eventos se filtran por rol y grupo_asignado al publicarse,
+así que un suscriptor inactivo no cuesta nada más que su cola vacía.
+El perfil de cada suscriptor se reemplaza cuando cambia su rol; si deja de
+tener un rol activo la suscripción se cierra.
+"""
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+ROLES_PUBLICADORES = ["anciano", "siervo"]
+ROLES_NOTIFICACIONES = ["anciano", "siervo", "publicador"]
+
+
+def puede_suscribirse(usuario: dict) -> bool:
+    return bool(usuario.get("is_superuser")) or usuario.get("rol") in ROLES_NOTIFICACIONES
+
+
+class Suscriptor:
+    def __init__(self, usuario: dict, max_eventos: int, solo_mi_grupo: bool = False):
+        self.usuario = usuario
+        self.solo_mi_grupo = solo_mi_grupo
+        self.cola = deque(maxlen=max_eventos)
+        self.descartados = 0
+        # True cuando el usuario perdió los permisos: el endpoint debe cortar la conexión
+        self.cerrado = False
+        self._hay_eventos = asyncio.Event()
+
+    def puede_ver(self, evento: dict) -> bool:
+        if self.cerrado:
+            return False
+        superusuario = self.usuario.get("is_superuser")
+        rol = self.usuario.get("rol")
+        if evento["canal"] == "publicadores":
+            if not superusuario and rol not in ROLES_PUBLICADORES:
+                return False
+            # Filtro opcional: solo cambios del grupo asignado al usuario
+            grupo = self.usuario.get("grupo_asignado")
+            if self.solo_mi_grupo and grupo is not None:
+                return evento.get("grupo") == grupo
+            return True
+        return superusuario or rol in ROLES_NOTIFICACIONES
+
+    def actualizar_usuario(self, usuario: Optional[dict]):
+        """Reemplazar el perfil usado para filtrar; sin perfil o sin rol activo se cierra"""
+        if usuario is None or not puede_suscribirse(usuario):
+            self.cerrado = True
+            self.cola.clear()
+            self._hay_eventos.set()
+            return
+        self.usuario = usuario
+
+    def entregar(self, evento: dict):
+        if len(self.cola) == self.cola.maxlen:
+            self.descartados += 1
+        self.cola.append(evento)
+        self._hay_eventos.set()
+
+    async def siguiente(self, timeout: float):
+        """Esperar el próximo evento; devuelve None si pasa `timeout` (momento del heartbeat)
+        o si la suscripción se cerró"""
+        if not self.cola and not self.cerrado:
+            self._hay_eventos.clear()
+            try:
+                await asyncio.wait_for(self._hay_eventos.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.cola.popleft() if self.cola else None
+
+
+class BusEventos:
+    def __init__(self, max_eventos_por_suscriptor: int = 100):
+        self.max_eventos = max_eventos_por_suscriptor
+        self._suscriptores = set()
+        self.publicados = 0
+
+    def suscribir(self, usuario: dict, solo_mi_grupo: bool = False) -> Suscriptor:
+        suscriptor = Suscriptor(usuario, self.max_eventos, solo_mi_grupo)
+        self._suscriptores.add(suscriptor)
+        return suscriptor
+
+    def desuscribir(self, suscriptor: Suscriptor):
+        self._suscriptores.discard(suscriptor)
+
+    def actualizar_usuario(self, usuario_id: str, usuario: Optional[dict]):
+        """Aplicar un cambio de perfil (o su baja, con None) a las suscripciones del usuario"""
+        for suscriptor in list(self._suscriptores):
+            if suscriptor.usuario.get("id") == usuario_id:
+                suscriptor.actualizar_usuario(usuario)
+
+    def publicar(self, canal: str, tipo: str, datos: dict, grupo=None):
+        evento = {
+            "canal": canal,
+            "tipo": tipo,
+            "grupo": grupo,
+            "datos": datos,
+            "fecha": datetime.now(timezone.utc).isoformat(),
+        }
+        self.publicados += 1
+        for suscriptor in list(self._suscriptores):
+            if suscriptor.puede_ver(evento):
+                suscriptor.entregar(evento)
+
+    def metricas(self) -> dict:
+        return {
+            "suscriptores": len(self._suscriptores),
+            "publicados": self.publicados,
+            "descartados": sum(s.descartados for s in self._suscriptores),
+        }
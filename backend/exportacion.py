@@ -0,0 +1,49 @@
+"""
+Serialización en streaming de filas a CSV o NDJSON para las exportaciones.
+
+Las filas llegan de un iterador asíncrono (páginas keyset) y se envían al
+cliente en bloques, sin construir nunca la respuesta completa en memoria.
+"""
+import csv
+import io
+import json
+
+FORMATOS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _celda(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, bool):
+        return "true" if valor else "false"
+    return valor
+
+
+async def stream_csv(filas, columnas, filas_por_bloque: int = 200):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    pendientes = 0
+    async for fila in filas:
+        escritor.writerow([_celda(fila.get(c)) for c in columnas])
+        pendientes += 1
+        if pendientes >= filas_por_bloque:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    yield buffer.getvalue().encode()
+
+
+async def stream_ndjson(filas, columnas, filas_por_bloque: int = 200):
+    bloque = []
+    async for fila in filas:
+        bloque.append(json.dumps({c: fila.get(c) for c in columnas}, ensure_ascii=False))
+        if len(bloque) >= filas_por_bloque:
+            yield ("\n".join(bloque) + "\n").encode()
+            bloque = []
+    if bloque:
+        yield ("\n".join(bloque) + "\n").encode()
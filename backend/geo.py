@@ -0,0 +1,375 @@
+"""
+Utilidades geométricas compartidas (distancias, simplificación de líneas y polígonos)
+"""
+import json
+import math
+
+import numpy as np
+
+RADIO_TIERRA_M = 6371008.8
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distancia en metros sobre la esfera"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _a_metros(puntos, lat_ref: float):
+    """Proyección equirectangular local (lat, lng) -> (x, y) en metros"""
+    k = math.cos(math.radians(lat_ref))
+    escala = math.pi / 180 * RADIO_TIERRA_M
+    return [(lng * k * escala, lat * escala) for lat, lng in puntos]
+
+
+def _distancia_segmento(p, a, b) -> float:
+    (px, py), (ax, ay), (bx, by) = p, a, b
+    dx, dy = bx - ax, by - ay
+    largo2 = dx * dx + dy * dy
+    if largo2 == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / largo2))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def douglas_peucker(puntos, tolerancia_m: float):
+    """Índices de los puntos (lat, lng) que se conservan al simplificar la línea
+    con la tolerancia dada en metros. Siempre conserva el primero y el último."""
+    n = len(puntos)
+    if n <= 2:
+        return list(range(n))
+    xy = _a_metros(puntos, sum(p[0] for p in puntos) / n)
+    conservar = [False] * n
+    conservar[0] = conservar[-1] = True
+    # Versión iterativa para no depender del límite de recursión en tracks largos
+    pila = [(0, n - 1)]
+    while pila:
+        inicio, fin = pila.pop()
+        maxima, indice = 0.0, None
+        for i in range(inicio + 1, fin):
+            d = _distancia_segmento(xy[i], xy[inicio], xy[fin])
+            if d > maxima:
+                maxima, indice = d, i
+        if indice is not None and maxima > tolerancia_m:
+            conservar[indice] = True
+            pila.append((inicio, indice))
+            pila.append((indice, fin))
+    return [i for i in range(n) if conservar[i]]
+
+
+# --- POLÍGONOS (GeoJSON) ---
+def poligonos_geojson(geojson):
+    """Polígonos de un Feature, FeatureCollection, Polygon o MultiPolygon.
+    Cada polígono es una lista de anillos [(lng, lat), ...]; el primero es el exterior
+    y el resto son huecos. Lanza ValueError si no hay geometría poligonal."""
+    if isinstance(geojson, str):
+        geojson = json.loads(geojson)
+    if not isinstance(geojson, dict):
+        raise ValueError("GeoJSON no válido")
+    tipo = geojson.get("type")
+    if tipo == "FeatureCollection":
+        poligonos = []
+        for feature in geojson.get("features") or []:
+            poligonos.extend(poligonos_geojson(feature))
+        if not poligonos:
+            raise ValueError("FeatureCollection sin polígonos")
+        return poligonos
+    if tipo == "Feature":
+        return poligonos_geojson(geojson.get("geometry"))
+    coordenadas = geojson.get("coordinates")
+    if tipo == "Polygon":
+        coordenadas = [coordenadas]
+    elif tipo != "MultiPolygon":
+        raise ValueError(f"Geometría no soportada: {tipo}")
+    try:
+        return [
+            [[(float(p[0]), float(p[1])) for p in anillo] for anillo in poligono]
+            for poligono in coordenadas
+        ]
+    except (TypeError, IndexError, ValueError):
+        raise ValueError("Coordenadas de polígono no válidas")
+
+
+def bbox_poligonos(poligonos):
+    """(min_lng, min_lat, max_lng, max_lat) de los anillos exteriores"""
+    lngs = [p[0] for poligono in poligonos for p in poligono[0]]
+    lats = [p[1] for poligono in poligonos for p in poligono[0]]
+    return min(lngs), min(lats), max(lngs), max(lats)
+
+
+def _punto_en_anillo(lng: float, lat: float, anillo) -> bool:
+    """Ray casting: cuenta los cruces de una semirrecta horizontal hacia el este"""
+    dentro = False
+    x1, y1 = anillo[-1]
+    for x2, y2 in anillo:
+        if (y1 > lat) != (y2 > lat) and lng < (x2 - x1) * (lat - y1) / (y2 - y1) + x1:
+            dentro = not dentro
+        x1, y1 = x2, y2
+    return dentro
+
+
+def punto_en_poligonos(lat: float, lng: float, poligonos) -> bool:
+    for exterior, *huecos in poligonos:
+        if _punto_en_anillo(lng, lat, exterior) and not any(_punto_en_anillo(lng, lat, h) for h in huecos):
+            return True
+    return False
+
+
+def _puntos_en_anillo_np(lngs, lats, anillo):
+    """Ray casting vectorizado: recorre las aristas y evalúa todos los puntos a la vez"""
+    dentro = np.zeros(len(lngs), dtype=bool)
+    vertices = np.asarray(anillo, dtype=float)
+    x1, y1 = vertices[-1]
+    for x2, y2 in vertices:
+        if y1 != y2:
+            cruza = ((y1 > lats) != (y2 > lats)) & (lngs < (x2 - x1) * (lats - y1) / (y2 - y1) + x1)
+            dentro ^= cruza
+        x1, y1 = x2, y2
+    return dentro
+
+
+def puntos_en_poligonos(lats, lngs, poligonos):
+    """Máscara booleana de los puntos (arrays NumPy) que caen dentro de los polígonos"""
+    resultado = np.zeros(len(lngs), dtype=bool)
+    for exterior, *huecos in poligonos:
+        dentro = _puntos_en_anillo_np(lngs, lats, exterior)
+        for hueco in huecos:
+            dentro &= ~_puntos_en_anillo_np(lngs, lats, hueco)
+        resultado |= dentro
+    return resultado
+
+
+def area_centroide(poligonos):
+    """(área en m², (lat, lng) del centroide) con la fórmula del shoelace sobre una
+    proyección local; los huecos restan"""
+    lat_ref = sum(p[1] for poligono in poligonos for p in poligono[0]) / sum(len(p[0]) for p in poligonos)
+    area_total = cx = cy = 0.0
+    for poligono in poligonos:
+        for n, anillo in enumerate(poligono):
+            xy = _a_metros([(lat, lng) for lng, lat in anillo], lat_ref)
+            area = sx = sy = 0.0
+            for (x1, y1), (x2, y2) in zip(xy, xy[1:] + xy[:1]):
+                cruz = x1 * y2 - x2 * y1
+                area += cruz
+                sx += (x1 + x2) * cruz
+                sy += (y1 + y2) * cruz
+            # Exterior suma y huecos restan, sin importar la orientación de cada anillo
+            signo = 1 if n == 0 else -1
+            if area < 0:
+                area, sx, sy = -area, -sx, -sy
+            area_total += signo * area / 2
+            cx += signo * sx / 6
+            cy += signo * sy / 6
+    if area_total <= 0:
+        min_lng, min_lat, max_lng, max_lat = bbox_poligonos(poligonos)
+        return 0.0, ((min_lat + max_lat) / 2, (min_lng + max_lng) / 2)
+    escala = math.pi / 180 * RADIO_TIERRA_M
+    lat = cy / area_total / escala
+    lng = cx / area_total / escala / math.cos(math.radians(lat_ref))
+    return area_total, (lat, lng)
+
+
+def simplificar_poligonos(poligonos, tolerancia_m: float):
+    """Douglas-Peucker sobre cada anillo. Los huecos que colapsan se descartan y los
+    exteriores que colapsan se conservan sin simplificar."""
+    resultado = []
+    for exterior, *huecos in poligonos:
+        anillos = []
+        for n, anillo in enumerate([exterior, *huecos]):
+            indices = douglas_peucker([(lat, lng) for lng, lat in anillo], tolerancia_m)
+            simplificado = [anillo[i] for i in indices]
+            if len(simplificado) >= 4:
+                anillos.append(simplificado)
+            elif n == 0:
+                anillos.append(anillo)
+        resultado.append(anillos)
+    return resultado
+
+
+def _orientacion(o, a, b):
+    """Signo del producto cruz (a - o) x (b - o) para arrays de puntos"""
+    return np.sign((a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0]))
+
+
+def _sobre_segmento(p, a, b):
+    """p colineal con a-b: ¿cae dentro del rectángulo del segmento?"""
+    return (
+        (np.minimum(a[..., 0], b[..., 0]) <= p[..., 0]) & (p[..., 0] <= np.maximum(a[..., 0], b[..., 0]))
+        & (np.minimum(a[..., 1], b[..., 1]) <= p[..., 1]) & (p[..., 1] <= np.maximum(a[..., 1], b[..., 1]))
+    )
+
+
+def _cruce_entre_anillos(anillos):
+    """Índices (a, b) de dos anillos con aristas que se cortan o se tocan (a == b si el
+    anillo se corta a sí mismo), o None. Cada anillo es un array de vértices cerrado.
+    Barrido por x sobre las aristas de todos los anillos: cada arista solo se compara
+    con las que empiezan antes de que ella termine y cuyo rango en y se solapa."""
+    inicios = np.concatenate([v[:-1] for v in anillos])
+    finales = np.concatenate([v[1:] for v in anillos])
+    anillo = np.concatenate([np.full(len(v) - 1, n) for n, v in enumerate(anillos)])
+    posicion = np.concatenate([np.arange(len(v) - 1) for v in anillos])
+    largo = np.concatenate([np.full(len(v) - 1, len(v) - 1) for v in anillos])
+    min_x = np.minimum(inicios[:, 0], finales[:, 0])
+    max_x = np.maximum(inicios[:, 0], finales[:, 0])
+    min_y = np.minimum(inicios[:, 1], finales[:, 1])
+    max_y = np.maximum(inicios[:, 1], finales[:, 1])
+    orden = np.argsort(min_x, kind="stable")
+    min_x_orden = min_x[orden]
+    limites = np.searchsorted(min_x_orden, max_x[orden], side="right")
+    for k in range(len(inicios)):
+        i = orden[k]
+        j = orden[k + 1:limites[k]]
+        separadas = np.abs(posicion[j] - posicion[i])
+        # Aristas contiguas del mismo anillo (comparten vértice); la última es contigua a la primera.
+        # Anillos distintos no pueden tocarse en ningún punto.
+        contiguas = (anillo[j] == anillo[i]) & ((separadas <= 1) | (separadas >= largo[i] - 1))
+        j = j[~contiguas & (min_y[j] <= max_y[i]) & (max_y[j] >= min_y[i])]
+        if not len(j):
+            continue
+        a, b, c, d = inicios[i], finales[i], inicios[j], finales[j]
+        o1, o2 = _orientacion(a, b, c), _orientacion(a, b, d)
+        o3, o4 = _orientacion(c, d, a), _orientacion(c, d, b)
+        cruce = (o1 * o2 < 0) & (o3 * o4 < 0)
+        cruce |= (o1 == 0) & _sobre_segmento(c, a, b)
+        cruce |= (o2 == 0) & _sobre_segmento(d, a, b)
+        cruce |= (o3 == 0) & _sobre_segmento(np.broadcast_to(a, c.shape), c, d)
+        cruce |= (o4 == 0) & _sobre_segmento(np.broadcast_to(b, c.shape), c, d)
+        if cruce.any():
+            return int(anillo[i]), int(anillo[j[cruce][0]])
+    return None
+
+
+def validar_poligonos(poligonos):
+    """Lanza ValueError si algún anillo no está cerrado, tiene menos de 4 puntos,
+    coordenadas fuera de rango o aristas que se cortan (en el mismo anillo o entre
+    anillos distintos), si un hueco no está dentro de su exterior o dentro de otro
+    hueco, o si un polígono queda dentro de otro"""
+    nombres, anillos = [], []
+    for n, poligono in enumerate(poligonos, 1):
+        if not poligono:
+            raise ValueError(f"Polígono {n} sin anillos")
+        for m, anillo in enumerate(poligono, 1):
+            nombre = f"Polígono {n}, anillo {m}"
+            if len(anillo) < 4:
+                raise ValueError(f"{nombre}: se necesitan al menos 4 puntos")
+            if anillo[0] != anillo[-1]:
+                raise ValueError(f"{nombre}: el anillo no está cerrado")
+            if any(not (-180 <= lng <= 180 and -90 <= lat <= 90) for lng, lat in anillo):
+                raise ValueError(f"{nombre}: coordenadas fuera de rango")
+            # Los puntos repetidos consecutivos no cuentan como cruce
+            vertices = np.asarray([p for i, p in enumerate(anillo) if i == 0 or p != anillo[i - 1]], dtype=float)
+            if len(vertices) < 4:
+                raise ValueError(f"{nombre}: se necesitan al menos 4 puntos distintos")
+            nombres.append(nombre)
+            anillos.append(vertices)
+
+    cruce = _cruce_entre_anillos(anillos)
+    if cruce is not None:
+        a, b = cruce
+        if a == b:
+            raise ValueError(f"{nombres[a]}: el anillo se corta a sí mismo")
+        raise ValueError(f"{nombres[a]} y {nombres[b].lower()} se cortan o se tocan")
+
+    # Sin cruces entre anillos, un vértice cualquiera basta para decidir si un anillo está
+    # dentro de otro
+    bboxes = [bbox_poligonos([poligono]) for poligono in poligonos]
+    for n, (exterior, *huecos) in enumerate(poligonos, 1):
+        for m, hueco in enumerate(huecos, 2):
+            lng, lat = hueco[0]
+            if not _punto_en_anillo(lng, lat, exterior):
+                raise ValueError(f"Polígono {n}, anillo {m}: el hueco no está dentro del anillo exterior")
+            for otro, anillo in enumerate(huecos, 2):
+                if otro != m and _punto_en_anillo(lng, lat, anillo):
+                    raise ValueError(f"Polígono {n}, anillo {m}: el hueco está dentro del anillo {otro}")
+        lng, lat = exterior[0]
+        for k, poligono in enumerate(poligonos, 1):
+            min_lng, min_lat, max_lng, max_lat = bboxes[k - 1]
+            if k == n or not (min_lng <= lng <= max_lng and min_lat <= lat <= max_lat):
+                continue
+            # Un polígono dentro de un hueco de otro (una isla) es válido
+            if punto_en_poligonos(lat, lng, [poligono]):
+                raise ValueError(f"Polígono {n}: está dentro del polígono {k}")
+
+
+def metadatos_poligonos(poligonos) -> dict:
+    """Columnas derivadas que se guardan junto al geojson_data de un territorio"""
+    min_lng, min_lat, max_lng, max_lat = bbox_poligonos(poligonos)
+    area, (lat, lng) = area_centroide(poligonos)
+    return {
+        "min_lng": round(min_lng, 7),
+        "min_lat": round(min_lat, 7),
+        "max_lng": round(max_lng, 7),
+        "max_lat": round(max_lat, 7),
+        "area_m2": round(area, 1),
+        "centroide_lat": round(lat, 7),
+        "centroide_lng": round(lng, 7),
+        "num_vertices": sum(len(anillo) for poligono in poligonos for anillo in poligono),
+    }
+
+
+# --- GEOHASH ---
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat: float, lng: float, precision: int = 8) -> str:
+    min_lat, max_lat, min_lng, max_lng = -90.0, 90.0, -180.0, 180.0
+    resultado = []
+    bits = valor = 0
+    par = True
+    while len(resultado) < precision:
+        if par:
+            medio = (min_lng + max_lng) / 2
+            valor = valor * 2 + (lng >= medio)
+            min_lng, max_lng = (medio, max_lng) if lng >= medio else (min_lng, medio)
+        else:
+            medio = (min_lat + max_lat) / 2
+            valor = valor * 2 + (lat >= medio)
+            min_lat, max_lat = (medio, max_lat) if lat >= medio else (min_lat, medio)
+        par = not par
+        bits += 1
+        if bits == 5:
+            resultado.append(_BASE32[valor])
+            bits = valor = 0
+    return "".join(resultado)
+
+
+def geohashes_bbox(bbox, precision: int, maximo: int):
+    """Celdas geohash que cubren el bbox (min_lng, min_lat, max_lng, max_lat).
+    Lanza ValueError si harían falta más de `maximo` celdas."""
+    bits_lng = (5 * precision + 1) // 2
+    dlng = 360.0 / 2 ** bits_lng
+    dlat = 180.0 / 2 ** (5 * precision - bits_lng)
+    columnas = range(math.floor((bbox[0] + 180) / dlng), math.floor((min(bbox[2], 179.999999) + 180) / dlng) + 1)
+    filas = range(math.floor((bbox[1] + 90) / dlat), math.floor((min(bbox[3], 89.999999) + 90) / dlat) + 1)
+    if len(columnas) * len(filas) > maximo:
+        raise ValueError(f"el bbox cubre {len(columnas) * len(filas)} teselas (máximo {maximo})")
+    return [
+        geohash(-90 + (fila + 0.5) * dlat, -180 + (columna + 0.5) * dlng, precision)
+        for fila in filas for columna in columnas
+    ]
+
+
+# --- WEB MERCATOR ---
+LAT_MAX_MERCATOR = 85.05112878
+
+
+def mercator(lat: float, lng: float):
+    """(lat, lng) -> (x, y) normalizados a [0, 1), con y creciendo hacia el sur"""
+    lat = max(-LAT_MAX_MERCATOR, min(LAT_MAX_MERCATOR, lat))
+    seno = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + seno) / (1 - seno)) / (4 * math.pi)
+    return lng / 360 + 0.5, y
+
+
+def mercator_np(lats, lngs):
+    """Versión vectorizada de mercator para arrays NumPy"""
+    seno = np.sin(np.radians(np.clip(lats, -LAT_MAX_MERCATOR, LAT_MAX_MERCATOR)))
+    return lngs / 360 + 0.5, 0.5 - np.log((1 + seno) / (1 - seno)) / (4 * np.pi)
+
+
+def desde_mercator(x: float, y: float):
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, (x - 0.5) * 360
@@ -0,0 +1,112 @@
+"""
+Geometrías de territorios simplificadas por nivel de zoom para el mapa.
+
+Al crear o editar un territorio se calcula una vez su versión simplificada
+para cada nivel (Douglas-Peucker con una tolerancia de ~1 píxel en ese
+zoom) junto con bbox, centroide y área. La colección completa de cada
+nivel se serializa y comprime con gzip solo la primera vez que se pide
+después de un cambio, y se sirve con ETag.
+"""
+import gzip
+import hashlib
+import json
+
+from geo import metadatos_poligonos, poligonos_geojson, simplificar_poligonos
+
+# Metros por píxel en el ecuador con teselas de 256 px en zoom 0
+METROS_POR_PIXEL_Z0 = 156543.03
+NIVELES_ZOOM = (10, 12, 14, 16)
+
+
+def nivel_para_zoom(zoom: int):
+    """Nivel precalculado más detallado que haga falta para `zoom`; None = geometría completa"""
+    for nivel in NIVELES_ZOOM:
+        if zoom <= nivel:
+            return nivel
+    return None
+
+
+def _geometria(poligonos) -> dict:
+    coordenadas = [[[[round(x, 6), round(y, 6)] for x, y in anillo] for anillo in poligono] for poligono in poligonos]
+    if len(coordenadas) == 1:
+        return {"type": "Polygon", "coordinates": coordenadas[0]}
+    return {"type": "MultiPolygon", "coordinates": coordenadas}
+
+
+class ColeccionNivel:
+    def __init__(self, features):
+        self.cuerpo = json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode()
+        self.gzip = gzip.compress(self.cuerpo, compresslevel=6)
+        # Débil: se sirve tanto el cuerpo gzip como el sin comprimir, que no son iguales byte a byte
+        self.etag = 'W/"' + hashlib.sha1(self.cuerpo).hexdigest()[:20] + '"'
+
+
+class GeometriasTerritorios:
+    def __init__(self):
+        # {territorio_id: {nivel: feature}} (nivel None = geometría completa)
+        self._features = {}
+        # Colecciones serializadas por nivel; se invalidan en cada cambio
+        self._colecciones = {}
+
+    def actualizar(self, territorio: dict):
+        try:
+            poligonos = poligonos_geojson(territorio["geojson_data"])
+        except (ValueError, json.JSONDecodeError) as e:
+            print(f"Territorio {territorio['id']} sin geometría para el mapa: {str(e)}")
+            self.quitar(territorio["id"])
+            return
+        # Las filas escritas por la API ya traen bbox, área y centroide; las antiguas se calculan aquí
+        meta = territorio if territorio.get("num_vertices") is not None else metadatos_poligonos(poligonos)
+        propiedades = {
+            "id": territorio["id"],
+            "nombre": territorio.get("nombre"),
+            "estado": territorio.get("estado"),
+            "asignado_a": territorio.get("asignado_a"),
+            "bbox": [round(float(meta[c]), 6) for c in ("min_lng", "min_lat", "max_lng", "max_lat")],
+            "centroide": [round(float(meta["centroide_lng"]), 6), round(float(meta["centroide_lat"]), 6)],
+            "area_m2": round(float(meta["area_m2"]), 1),
+        }
+        niveles = {None: poligonos}
+        for nivel in NIVELES_ZOOM:
+            niveles[nivel] = simplificar_poligonos(poligonos, METROS_POR_PIXEL_Z0 / 2 ** nivel)
+        self._features[territorio["id"]] = {
+            nivel: {
+                "type": "Feature",
+                "properties": {**propiedades, "num_vertices": sum(len(a) for p in geometria for a in p)},
+                "geometry": _geometria(geometria),
+            }
+            for nivel, geometria in niveles.items()
+        }
+        self._colecciones.clear()
+
+    def quitar(self, territorio_id: str):
+        if self._features.pop(territorio_id, None) is not None:
+            self._colecciones.clear()
+
+    def reconstruir(self, territorios):
+        self._features = {}
+        for territorio in territorios:
+            self.actualizar(territorio)
+        self._colecciones.clear()
+
+    def centroide(self, territorio_id: str):
+        """(lat, lng) del centroide precalculado, o None"""
+        niveles = self._features.get(territorio_id)
+        if niveles is None:
+            return None
+        lng, lat = niveles[None]["properties"]["centroide"]
+        return lat, lng
+
+    def coleccion(self, zoom: int) -> ColeccionNivel:
+        nivel = nivel_para_zoom(zoom)
+        coleccion = self._colecciones.get(nivel)
+        if coleccion is None:
+            coleccion = ColeccionNivel([niveles[nivel] for niveles in self._features.values()])
+            self._colecciones[nivel] = coleccion
+        return coleccion
+
+    def metricas(self) -> dict:
+        return {
+            "territorios": len(self._features),
+            "colecciones": {str(n): len(c.cuerpo) for n, c in self._colecciones.items()},
+        }
@@ -0,0 +1,64 @@
+"""
+Filtrado y reducción de fixes GPS antes de escribirlos en `ubicaciones`.
+
+Se descartan los fixes con mala precisión y los que no representan
+movimiento respecto al último fix aceptado del usuario, y el resto del
+track se simplifica con Douglas-Peucker.
+"""
+import time
+from datetime import datetime, timezone
+
+from geo import douglas_peucker, haversine_m
+
+
+class FiltroGPS:
+    def __init__(self, precision_max_m: float = 50.0, distancia_min_m: float = 5.0,
+                 tolerancia_m: float = 10.0, intervalo_max_seg: float = 300.0):
+        self.precision_max_m = precision_max_m
+        self.distancia_min_m = distancia_min_m
+        self.tolerancia_m = tolerancia_m
+        # Aunque no haya movimiento se guarda un fix cada intervalo_max_seg
+        self.intervalo_max_seg = intervalo_max_seg
+        # Último fix aceptado por usuario: {usuario_id: (lat, lng, fecha)}
+        self._ultimo = {}
+        self._limpiado_en = time.monotonic()
+
+    def procesar(self, usuario_id: str, fixes):
+        """Recibe dicts con latitud, longitud, precision_gps y fecha (datetime).
+        Devuelve (fixes a guardar, resumen con los contadores de descarte)."""
+        resumen = {"recibidos": len(fixes), "descartados_precision": 0,
+                   "descartados_sin_movimiento": 0, "simplificados": 0}
+        ultimo = self._ultimo.get(usuario_id)
+        aceptados = []
+        for fix in sorted(fixes, key=lambda f: f["fecha"]):
+            precision = fix.get("precision_gps")
+            if precision is not None and precision > self.precision_max_m:
+                resumen["descartados_precision"] += 1
+                continue
+            if ultimo is not None:
+                distancia = haversine_m(ultimo[0], ultimo[1], fix["latitud"], fix["longitud"])
+                segundos = (fix["fecha"] - ultimo[2]).total_seconds()
+                if distancia < self.distancia_min_m and segundos < self.intervalo_max_seg:
+                    resumen["descartados_sin_movimiento"] += 1
+                    continue
+            aceptados.append(fix)
+            ultimo = (fix["latitud"], fix["longitud"], fix["fecha"])
+
+        if len(aceptados) > 2:
+            indices = douglas_peucker([(f["latitud"], f["longitud"]) for f in aceptados], self.tolerancia_m)
+            resumen["simplificados"] = len(aceptados) - len(indices)
+            aceptados = [aceptados[i] for i in indices]
+
+        if ultimo is not None:
+            self._ultimo[usuario_id] = ultimo
+        if time.monotonic() - self._limpiado_en > 600:
+            self.olvidar_inactivos()
+        resumen["aceptados"] = len(aceptados)
+        return aceptados, resumen
+
+    def olvidar_inactivos(self, segundos: float = 3600):
+        """Liberar el estado de usuarios sin fixes recientes"""
+        self._limpiado_en = time.monotonic()
+        limite = datetime.now(timezone.utc).timestamp() - segundos
+        for usuario_id in [u for u, f in self._ultimo.items() if f[2].timestamp() < limite]:
+            del self._ultimo[usuario_id]
@@ -0,0 +1,86 @@
+"""
+Lectura en streaming de archivos CSV o NDJSON para la importación masiva.
+
+Las filas se producen una a una a medida que llegan los bytes del
+request, así que la memoria no depende del tamaño del archivo.
+"""
+import codecs
+import csv
+import json
+
+FORMATOS = ("csv", "ndjson")
+
+VALORES_VERDADEROS = {"si", "sí", "x"}
+
+# Máximo de caracteres que se acumulan para una línea o un registro CSV. Una comilla
+# sin cerrar haría que el resto del archivo se guarde en memoria como un solo campo.
+MAX_REGISTRO = 1024 * 1024
+
+
+async def lineas(stream):
+    """Decodificar un stream de bytes (UTF-8, con o sin BOM) en líneas"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pendiente = ""
+    async for chunk in stream:
+        pendiente += decoder.decode(chunk)
+        *completas, pendiente = pendiente.split("\n")
+        for linea in completas:
+            yield linea.rstrip("\r")
+        if len(pendiente) > MAX_REGISTRO:
+            raise ValueError(f"Línea de más de {MAX_REGISTRO} caracteres, archivo rechazado")
+    pendiente += decoder.decode(b"", final=True)
+    if pendiente:
+        yield pendiente.rstrip("\r")
+
+
+async def filas_csv(stream):
+    """Producir (número de fila, dict) desde un CSV con encabezado"""
+    encabezado = None
+    registro = ""
+    numero = 0
+    async for linea in lineas(stream):
+        registro = f"{registro}\n{linea}" if registro else linea
+        # Un número impar de comillas indica un campo entre comillas con salto de línea
+        if registro.count('"') % 2:
+            if len(registro) > MAX_REGISTRO:
+                raise ValueError(f"Registro de más de {MAX_REGISTRO} caracteres (¿comillas sin cerrar?), archivo rechazado")
+            continue
+        texto, registro = registro, ""
+        if not texto.strip():
+            continue
+        valores = next(csv.reader([texto]))
+        if encabezado is None:
+            encabezado = [v.strip() for v in valores]
+            continue
+        numero += 1
+        yield numero, dict(zip(encabezado, valores))
+    if registro.strip():
+        numero += 1
+        yield numero, ValueError("Comillas sin cerrar al final del archivo")
+
+
+async def filas_ndjson(stream):
+    """Producir (número de fila, dict) desde NDJSON (un objeto JSON por línea)"""
+    numero = 0
+    async for linea in lineas(stream):
+        if not linea.strip():
+            continue
+        numero += 1
+        try:
+            fila = json.loads(linea)
+        except ValueError as e:
+            yield numero, ValueError(f"JSON inválido: {str(e)}")
+            continue
+        if not isinstance(fila, dict):
+            yield numero, ValueError("Cada línea debe ser un objeto JSON")
+            continue
+        yield numero, fila
+
+
+def normalizar_booleanos(fila: dict, campos) -> dict:
+    """Aceptar 'si'/'sí'/'x' además de los valores que ya acepta Pydantic"""
+    for campo in campos:
+        valor = fila.get(campo)
+        if isinstance(valor, str) and valor.strip().lower() in VALORES_VERDADEROS:
+            fila[campo] = True
+    return fila
@@ -1,14 +1,43 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, ValidationError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from supabase import create_client, Client
 import os
 from dotenv import load_dotenv
 from typing import Optional, List
 import uuid
-from datetime import datetime
+import time
+import json
+import asyncio
+from datetime import date, datetime, timedelta, timezone
 import requests
+from auth_jwt import VerificadorJWT, TokenInvalido, VerificacionNoDisponible
+from cache import TTLCache
+from db import (
+    ClienteDB, codificar_cursor, decodificar_cursor, decodificar_cursor_fecha, error_permanente, es_uuid,
+    parsear_fecha
+)
+from estadisticas import EstadisticasPublicadores
+from actividad import RollupActividad, eventos_historicos, TIPO_ALTA_PUBLICADOR
+from importacion import FORMATOS, filas_csv, filas_ndjson, normalizar_booleanos
+from exportacion import FORMATOS as FORMATOS_EXPORTACION, stream_csv, stream_ndjson
+from escritor_lotes import EscritorPorLotes
+from eventos import BusEventos, puede_suscribirse
+from gps import FiltroGPS
+from posiciones import PosicionesEnVivo, parsear_bbox
+from territorios import IndiceTerritorios
+from cobertura import MotorCobertura
+from geometrias import GeometriasTerritorios
+from clusters import ClustersMarcaciones
+from mapa_calor import CANALES as CANALES_CALOR, MapaCalor, a_json, a_png
+from recorridos import compactar, expandir_recorrido
+from cercanos import IndiceCercanos
+from geo import geohash, metadatos_poligonos, poligonos_geojson, validar_poligonos
+from teselas import CacheTeselas, PRECISION_GEOHASH
+from condicional import CondicionalGET, ValidadoresRecursos, etag_coincide
 
 # Cargar variables de entorno
 load_dotenv()
@@ -21,11 +50,176 @@ SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 if not all([SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_KEY]):
     raise ValueError("Faltan variables de entorno de Supabase")
 
-# Cliente de Supabase
+# Verificación de tokens: "local" (firma con JWT secret/JWKS) o "remoto" (auth.get_user)
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+AUTH_MODO = os.getenv("AUTH_MODO", "local")
+AUTH_FALLBACK_REMOTO = os.getenv("AUTH_FALLBACK_REMOTO", "false").lower() == "true"
+if AUTH_MODO == "local" and not SUPABASE_JWT_SECRET:
+    print("SUPABASE_JWT_SECRET no configurado: los tokens HS256 se verifican con Supabase Auth")
+
+# Caché de perfiles de la tabla usuarios
+PERFIL_CACHE_TTL = int(os.getenv("PERFIL_CACHE_TTL", "60"))
+PERFIL_CACHE_MAX = int(os.getenv("PERFIL_CACHE_MAX", "1024"))
+
+# Conexiones keep-alive del pool HTTP hacia PostgREST
+DB_MAX_CONEXIONES = int(os.getenv("DB_MAX_CONEXIONES", "50"))
+
+# Cada cuántos segundos se compara el total de las estadísticas con la tabla
+ESTADISTICAS_VERIFICACION_SEG = int(os.getenv("ESTADISTICAS_VERIFICACION_SEG", "300"))
+
+# Importación masiva: filas por INSERT y máximo de errores detallados en la respuesta
+IMPORTACION_LOTE = int(os.getenv("IMPORTACION_LOTE", "500"))
+IMPORTACION_MAX_ERRORES = int(os.getenv("IMPORTACION_MAX_ERRORES", "100"))
+
+# Escritura de notificaciones automáticas por lotes
+NOTIFICACIONES_LOTE = int(os.getenv("NOTIFICACIONES_LOTE", "100"))
+NOTIFICACIONES_INTERVALO = float(os.getenv("NOTIFICACIONES_INTERVALO", "1.0"))
+
+# Caché de la página más reciente de notificaciones y de los contadores del badge
+NOTIFICACIONES_CACHE_TTL = int(os.getenv("NOTIFICACIONES_CACHE_TTL", "30"))
+
+# Canal push: eventos en cola por suscriptor y segundos entre heartbeats
+EVENTOS_MAX_POR_SUSCRIPTOR = int(os.getenv("EVENTOS_MAX_POR_SUSCRIPTOR", "100"))
+EVENTOS_HEARTBEAT_SEG = float(os.getenv("EVENTOS_HEARTBEAT_SEG", "20"))
+
+# Ingesta de GPS: filtros, simplificación y escritura por lotes en ubicaciones
+GPS_PRECISION_MAX_M = float(os.getenv("GPS_PRECISION_MAX_M", "50"))
+GPS_DISTANCIA_MIN_M = float(os.getenv("GPS_DISTANCIA_MIN_M", "5"))
+GPS_TOLERANCIA_M = float(os.getenv("GPS_TOLERANCIA_M", "10"))
+UBICACIONES_LOTE = int(os.getenv("UBICACIONES_LOTE", "500"))
+UBICACIONES_INTERVALO = float(os.getenv("UBICACIONES_INTERVALO", "5"))
+
+# Mapa en vivo: segundos sin fixes para dejar de mostrar a un usuario y mínimo entre envíos
+POSICIONES_TTL_SEG = float(os.getenv("POSICIONES_TTL_SEG", "900"))
+MAPA_INTERVALO_SEG = float(os.getenv("MAPA_INTERVALO_SEG", "1.0"))
+
+# Tamaño de celda (en grados) de la grilla del índice de territorios
+TERRITORIOS_CELDA_GRADOS = float(os.getenv("TERRITORIOS_CELDA_GRADOS", "0.01"))
+
+# Lado en metros de las celdas con que se mide la cobertura de cada territorio
+COBERTURA_CELDA_M = float(os.getenv("COBERTURA_CELDA_M", "25"))
+
+# Teselas geohash de marcaciones para el mapa: precisión, teselas en caché y máximo por consulta
+MARCACIONES_TESELA_PRECISION = int(os.getenv("MARCACIONES_TESELA_PRECISION", "6"))
+MARCACIONES_TESELAS_CACHE = int(os.getenv("MARCACIONES_TESELAS_CACHE", "2048"))
+MARCACIONES_TESELAS_MAX = int(os.getenv("MARCACIONES_TESELAS_MAX", "100"))
+
+# Valores permitidos por los CHECK de territorios.estado y marcaciones.tipo
+ESTADOS_TERRITORIO = ["activo", "inactivo", "en_revision"]
+TIPOS_MARCACION = ["predicacion", "revisita", "estudio"]
+
+# Clustering de marcaciones: radio de agrupación en píxeles y zoom a partir del cual no se agrupa
+CLUSTERS_RADIO_PX = int(os.getenv("CLUSTERS_RADIO_PX", "60"))
+CLUSTERS_ZOOM_MAX = int(os.getenv("CLUSTERS_ZOOM_MAX", "16"))
+
+# Sincronización offline de marcaciones: ítems por lote y claves de idempotencia recordadas en memoria
+MARCACIONES_SYNC_MAX_ITEMS = int(os.getenv("MARCACIONES_SYNC_MAX_ITEMS", "500"))
+MARCACIONES_SYNC_CLAVES_MAX = int(os.getenv("MARCACIONES_SYNC_CLAVES_MAX", "100000"))
+MARCACIONES_SYNC_CLAVES_TTL = int(os.getenv("MARCACIONES_SYNC_CLAVES_TTL", "604800"))
+
+# Mapa de calor: celdas por lado de cada tesela y rango máximo de una consulta en días
+# (la caché de puntos guarda ese rango completo para cada fuente)
+MAPA_CALOR_RESOLUCION = int(os.getenv("MAPA_CALOR_RESOLUCION", "64"))
+MAPA_CALOR_MAX_DIAS = int(os.getenv("MAPA_CALOR_MAX_DIAS", "366"))
+
+# Sincronización incremental de publicadores: el cursor nunca avanza más allá de
+# ahora - margen, para no saltarse escrituras que confirmen con un updated_at anterior
+PUBLICADORES_CAMBIOS_MARGEN_SEG = float(os.getenv("PUBLICADORES_CAMBIOS_MARGEN_SEG", "5"))
+
+# GET condicional de listados: tamaño desde el que se comprime la respuesta
+CONDICIONAL_MIN_COMPRIMIR = int(os.getenv("CONDICIONAL_MIN_COMPRIMIR", "1024"))
+
+# Días de historia que se conservan en los rollups de actividad
+ACTIVIDAD_DIAS_RETENCION = int(os.getenv("ACTIVIDAD_DIAS_RETENCION", "400"))
+
+# Cliente de Supabase (solo para Supabase Auth; los datos van por la capa asíncrona)
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+db = ClienteDB(SUPABASE_URL, SUPABASE_SERVICE_KEY, max_conexiones=DB_MAX_CONEXIONES)
+verificador_jwt = VerificadorJWT(SUPABASE_URL, jwt_secret=SUPABASE_JWT_SECRET, http=db.http)
+perfil_cache = TTLCache(maxsize=PERFIL_CACHE_MAX, ttl=PERFIL_CACHE_TTL)
+estadisticas = EstadisticasPublicadores()
+actividad = RollupActividad(dias_retencion=ACTIVIDAD_DIAS_RETENCION)
+filtro_gps = FiltroGPS(
+    precision_max_m=GPS_PRECISION_MAX_M, distancia_min_m=GPS_DISTANCIA_MIN_M, tolerancia_m=GPS_TOLERANCIA_M
+)
+escritor_ubicaciones = EscritorPorLotes(
+    db, "ubicaciones", max_lote=UBICACIONES_LOTE, intervalo=UBICACIONES_INTERVALO, max_cola=50000
+)
+indice_cercanos = IndiceCercanos()
+posiciones = PosicionesEnVivo(
+    ttl_seg=POSICIONES_TTL_SEG, intervalo_min=MAPA_INTERVALO_SEG, al_quitar=indice_cercanos.quitar
+)
+indice_territorios = IndiceTerritorios(celda_grados=TERRITORIOS_CELDA_GRADOS)
+cobertura = MotorCobertura(celda_m=COBERTURA_CELDA_M)
+geometrias = GeometriasTerritorios()
+
+COLUMNAS_MARCACION_MAPA = "id,latitud,longitud,tipo,territorio_id,usuario_id,direccion,observaciones,created_at"
+
+async def cargar_tesela_marcaciones(prefijo: str):
+    filas = db.iterar_keyset(
+        "marcaciones", columnas=COLUMNAS_MARCACION_MAPA, filtros=lambda q: q.like("geohash", f"{prefijo}*")
+    )
+    return [fila async for fila in filas]
+
+clusters = ClustersMarcaciones(
+    TIPOS_MARCACION, zoom_max=CLUSTERS_ZOOM_MAX, radio_px=CLUSTERS_RADIO_PX
+)
+async def puntos_del_dia(fuente: str, dia: date):
+    inicio = datetime(dia.year, dia.month, dia.day, tzinfo=timezone.utc)
+    fin = inicio + timedelta(days=1)
+    filas = db.iterar_keyset(
+        fuente,
+        columnas="latitud,longitud,tipo" if fuente == "marcaciones" else "latitud,longitud",
+        filtros=lambda q: q.gte("created_at", inicio.isoformat()).lt("created_at", fin.isoformat())
+    )
+    puntos = [fila async for fila in filas]
+    if fuente == "ubicaciones":
+        # Los días ya compactados viven en recorridos
+        recorridos = await db.table("recorridos").select("inicio,polyline,tiempos").eq(
+            "fecha", dia.isoformat()
+        ).execute()
+        for recorrido in recorridos.data:
+            puntos.extend({"latitud": lat, "longitud": lng} for _, lat, lng in expandir_recorrido(recorrido))
+    return puntos
+
+mapa_calor = MapaCalor(puntos_del_dia, resolucion=MAPA_CALOR_RESOLUCION, max_dias=MAPA_CALOR_MAX_DIAS)
+teselas_marcaciones = CacheTeselas(
+    cargar_tesela_marcaciones, precision=MARCACIONES_TESELA_PRECISION,
+    maxsize=MARCACIONES_TESELAS_CACHE, max_teselas=MARCACIONES_TESELAS_MAX
+)
+# {(usuario_id, idempotency_key): marcacion_id} de lotes ya sincronizados
+claves_sync = TTLCache(maxsize=MARCACIONES_SYNC_CLAVES_MAX, ttl=MARCACIONES_SYNC_CLAVES_TTL)
+bus_eventos = BusEventos(max_eventos_por_suscriptor=EVENTOS_MAX_POR_SUSCRIPTOR)
+notificaciones_cache = TTLCache(maxsize=64, ttl=NOTIFICACIONES_CACHE_TTL)
+# Validador de cada listado con GET condicional: última modificación y cantidad de filas
+validadores = ValidadoresRecursos(db, {
+    "publicadores": ("publicadores", "updated_at"),
+    "notificaciones": ("notificaciones", "fecha_creacion"),
+    "usuarios": ("usuarios", "updated_at"),
+})
+
+def notificaciones_escritas(filas):
+    notificaciones_cache.clear()
+
+escritor_notificaciones = EscritorPorLotes(
+    db, "notificaciones", max_lote=NOTIFICACIONES_LOTE, intervalo=NOTIFICACIONES_INTERVALO,
+    al_escribir=notificaciones_escritas
+)
 
 app = FastAPI(title="API de Publicadores con Supabase Auth", version="2.0.0")
 security = HTTPBearer()
+# Para SSE/WebSocket, donde el navegador no puede enviar el header y el token va en ?token=
+security_opcional = HTTPBearer(auto_error=False)
+
+# ETag/Last-Modified, 304 y compresión en los listados. Se agrega antes que CORS
+# para quedar por dentro y que las respuestas 304 también lleven los headers CORS.
+app.add_middleware(
+    CondicionalGET,
+    rutas={"/publicadores": "publicadores", "/notificaciones/": "notificaciones", "/admin/users": "usuarios"},
+    validadores=validadores,
+    autenticar=lambda token: autenticar(token),
+    min_comprimir=CONDICIONAL_MIN_COMPRIMIR
+)
 
 # Configurar CORS
 app.add_middleware(
@@ -40,7 +234,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["*"]
+    expose_headers=["*", "X-Next-Cursor"]
 )
 
 # Modelos Pydantic
@@ -57,6 +251,9 @@ class PublicadorResponse(Publicador):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+# Columnas que se pueden pedir con ?fields= en GET /publicadores
+CAMPOS_PUBLICADOR = set(PublicadorResponse.model_fields)
+
 class Usuario(BaseModel):
     email: EmailStr
     nombre: str
@@ -93,36 +290,105 @@ class NotificacionOut(BaseModel):
     mensaje: str
     fecha_creacion: datetime
 
+# Función para verificar el JWT y obtener el ID del usuario
+async def verificar_token(token: str) -> str:
+    if AUTH_MODO == "local":
+        try:
+            claims = await verificador_jwt.verificar(token)
+            return claims["sub"]
+        except VerificacionNoDisponible as e:
+            # Sin clave local disponible: solo se consulta al servidor si está habilitado.
+            # Sin SUPABASE_JWT_SECRET se consulta siempre: los tokens HS256 de las
+            # instalaciones que no lo configuraron no se pueden verificar de otra forma.
+            if not AUTH_FALLBACK_REMOTO and verificador_jwt.jwt_secret:
+                raise
+            print(f"Verificación local no disponible, usando Supabase Auth: {str(e)}")
+
+    # Verificar token con Supabase
+    user = await db.auth_user(token)
+    if not user or not user.get("id"):
+        raise TokenInvalido("Token inválido")
+    return user["id"]
+
+# Función para obtener el perfil de la tabla usuarios (con caché)
+async def obtener_perfil(user_id: str) -> Optional[dict]:
+    perfil = perfil_cache.get(user_id)
+    if perfil is not None:
+        return perfil
+
+    # Si el perfil se invalida (cambio de rol) mientras se lee, la lectura puede traer el rol
+    # anterior: se devuelve pero no se guarda en la caché
+    generacion = perfil_cache.generacion
+    response = await db.table("usuarios").select("*").eq("id", user_id).execute()
+    if not response.data:
+        return None
+
+    # Asegurar que solo devolvemos un usuario
+    if len(response.data) > 1:
+        print(f"Advertencia: Múltiples usuarios encontrados para ID {user_id}")
+
+    perfil = response.data[0]
+    perfil_cache.set(user_id, perfil, generacion=generacion)
+    return perfil
+
+# --- MODELOS GPS ---
+class FixGPS(BaseModel):
+    latitud: float = Field(ge=-90, le=90)
+    longitud: float = Field(ge=-180, le=180)
+    # Rangos de las columnas DECIMAL(5, 2): un valor fuera de rango haría fallar el INSERT del lote
+    precision_gps: Optional[float] = Field(None, ge=0, le=999.99)
+    velocidad: Optional[float] = Field(None, ge=0, le=999.99)
+    direccion: Optional[str] = None
+    fecha: Optional[datetime] = None
+
+class LoteUbicaciones(BaseModel):
+    fixes: List[FixGPS] = Field(max_length=1000)
+
+# --- MODELOS TERRITORIOS Y MARCACIONES ---
+class Territorio(BaseModel):
+    nombre: str
+    descripcion: Optional[str] = None
+    geojson_data: dict
+    estado: str = "activo"
+    asignado_a: Optional[str] = None
+
+class Marcacion(BaseModel):
+    latitud: float = Field(ge=-90, le=90)
+    longitud: float = Field(ge=-180, le=180)
+    tipo: str
+    observaciones: Optional[str] = None
+    direccion: Optional[str] = None
+    territorio_id: Optional[str] = None
+
+class MarcacionSync(Marcacion):
+    # Generada por el cliente; reenviar el mismo ítem no crea otra marcación
+    idempotency_key: str = Field(min_length=1, max_length=100)
+    # Momento en que se marcó la casa en el dispositivo (puede ser horas antes del envío)
+    fecha: Optional[datetime] = None
+
+class LoteMarcaciones(BaseModel):
+    items: List[MarcacionSync] = Field(max_length=MARCACIONES_SYNC_MAX_ITEMS)
+
 # Función para verificar JWT de Supabase y obtener usuario
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await autenticar(credentials.credentials)
+
+async def autenticar(token: str) -> dict:
     try:
-        token = credentials.credentials
-        
-        # Verificar token con Supabase
-        user = supabase.auth.get_user(token)
-        
-        if not user or not user.user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token inválido"
-            )
+        user_id = await verificar_token(token)
         
         # Obtener datos del usuario desde la tabla usuarios
-        response = supabase.table("usuarios").select("*").eq("id", user.user.id).execute()
+        perfil = await obtener_perfil(user_id)
         
-        if not response.data or len(response.data) == 0:
+        if not perfil:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Usuario no encontrado en la base de datos"
             )
         
-        # Asegurar que solo devolvemos un usuario
-        if len(response.data) > 1:
-            print(f"Advertencia: Múltiples usuarios encontrados para ID {user.user.id}")
-        
-        return response.data[0]
+        return perfil
     except Exception as e:
-        print(f"Error en get_current_user: {str(e)}")
+        print(f"Error en autenticar: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido"
@@ -187,7 +453,7 @@ async def register(data: RegisterRequest):
     """Registrar un nuevo usuario"""
     try:
         # Crear usuario en Supabase Auth
-        auth_response = supabase.auth.sign_up({
+        auth_response = await run_in_threadpool(supabase.auth.sign_up, {
             "email": data.email,
             "password": data.password
         })
@@ -208,7 +474,7 @@ async def register(data: RegisterRequest):
             "grupo_asignado": data.grupo_asignado # Incluir grupo_asignado si se proporciona
         }
         
-        supabase.table("usuarios").insert(user_data).execute()
+        await db.table("usuarios").insert(user_data).execute()
         
         return {
             "message": "Usuario registrado exitosamente. Esperando asignación de rol por el superusuario.",
@@ -226,7 +492,7 @@ async def login(data: LoginRequest):
     """Iniciar sesión"""
     try:
         # Autenticar con Supabase
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await run_in_threadpool(supabase.auth.sign_in_with_password, {
             "email": data.email,
             "password": data.password
         })
@@ -238,16 +504,14 @@ async def login(data: LoginRequest):
             )
         
         # Obtener datos del usuario
-        user_response = supabase.table("usuarios").select("*").eq("id", auth_response.user.id).execute()
+        user_data = await obtener_perfil(auth_response.user.id)
         
-        if not user_response.data:
+        if not user_data:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Usuario no encontrado"
             )
         
-        user_data = user_response.data[0]
-        
         return {
             "access_token": auth_response.session.access_token,
             "refresh_token": auth_response.session.refresh_token,
@@ -270,7 +534,7 @@ async def login(data: LoginRequest):
 async def logout(current_user: dict = Depends(get_current_user)):
     """Cerrar sesión"""
     try:
-        supabase.auth.sign_out()
+        await run_in_threadpool(supabase.auth.sign_out)
         return {"message": "Sesión cerrada exitosamente"}
     except Exception as e:
         print(f"Error en logout: {str(e)}")
@@ -284,7 +548,7 @@ async def logout(current_user: dict = Depends(get_current_user)):
 async def list_users(superuser: dict = Depends(get_superuser)):
     """Listar todos los usuarios (solo superusuario)"""
     try:
-        response = supabase.table("usuarios").select("*").execute()
+        response = await db.table("usuarios").select("*").execute()
         return response.data
     except Exception as e:
         print(f"Error en list_users: {str(e)}")
@@ -313,12 +577,16 @@ async def update_user_role(
         # Permitir actualizar grupo_asignado si viene en el request
         if hasattr(role_data, "grupo_asignado") and role_data.grupo_asignado is not None:
             update_data["grupo_asignado"] = role_data.grupo_asignado
-        response = supabase.table("usuarios").update(update_data).eq("id", user_id).execute()
+        response = await db.table("usuarios").update(update_data).eq("id", user_id).execute()
+        # Los permisos cambiaron: el próximo request del usuario debe leer el perfil actualizado
+        perfil_cache.invalidate(user_id)
         if not response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Usuario no encontrado"
             )
+        # Y sus suscripciones SSE/WebSocket abiertas filtran con el perfil nuevo (o se cierran)
+        bus_eventos.actualizar_usuario(user_id, response.data[0])
         # Notificación automática
         usuario_actualizado = response.data[0]
         crear_notificacion(
@@ -338,10 +606,40 @@ async def update_user_role(
             detail="Error al actualizar rol o grupo"
         )
 
+@app.get("/admin/metricas")
+async def metricas(superuser: dict = Depends(get_superuser)):
+    """Métricas internas de cachés (solo superusuario)"""
+    return {
+        "perfil_cache": perfil_cache.stats(),
+        "notificaciones_cola": escritor_notificaciones.metricas(),
+        "notificaciones_cache": notificaciones_cache.stats(),
+        "eventos": bus_eventos.metricas(),
+        "ubicaciones_cola": escritor_ubicaciones.metricas(),
+        "mapa": posiciones.metricas(),
+        "cercanos": indice_cercanos.metricas(),
+        "territorios": indice_territorios.metricas(),
+        "cobertura": cobertura.metricas(),
+        "geometrias": geometrias.metricas(),
+        "marcaciones_teselas": teselas_marcaciones.metricas(),
+        "clusters": clusters.metricas(),
+        "mapa_calor": mapa_calor.metricas(),
+        "marcaciones_sync": claves_sync.stats(),
+        "condicional": validadores.metricas()
+    }
+
 # Rutas de publicadores
-@app.get("/publicadores", response_model=List[PublicadorResponse])
-async def listar_publicadores(current_user: dict = Depends(get_current_user)):
-    """Listar todos los publicadores"""
+@app.get("/publicadores")
+async def listar_publicadores(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    grupo: Optional[int] = None,
+    precursor: Optional[bool] = None,
+    animo: Optional[bool] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Listar publicadores paginados por (created_at, id), más recientes primero.
+    El cursor de la siguiente página se devuelve en el header X-Next-Cursor."""
     try:
         # Verificar que el usuario tenga rol válido
         if current_user["rol"] not in ["anciano", "siervo"] and not current_user.get("is_superuser"):
@@ -350,8 +648,41 @@ async def listar_publicadores(current_user: dict = Depends(get_current_user)):
                 detail="No tienes permiso para ver publicadores"
             )
         
-        response = supabase.table("publicadores").select("*").order("created_at", desc=True).execute()
-        return response.data
+        columnas = "*"
+        if fields:
+            pedidas = [c.strip() for c in fields.split(",") if c.strip()]
+            invalidas = [c for c in pedidas if c not in CAMPOS_PUBLICADOR]
+            if invalidas:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Campos no válidos: {', '.join(invalidas)}"
+                )
+            # id y created_at siempre van: son la clave del cursor
+            columnas = ",".join(dict.fromkeys(["id", "created_at", *pedidas]))
+        
+        query = db.table("publicadores").select(columnas)
+        if grupo is not None:
+            query = query.eq("grupo", grupo)
+        if precursor is not None:
+            query = query.eq("precursor", precursor)
+        if animo is not None:
+            query = query.eq("animo", animo)
+        if cursor:
+            try:
+                created_at, id_fila = decodificar_cursor_fecha(cursor)
+            except ValueError:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+            query = query.despues_de("created_at", created_at, id_fila, desc=True)
+        
+        # Se pide una fila extra para saber si hay página siguiente
+        response = await query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+        filas = response.data[:limit]
+        headers = {}
+        if len(response.data) > limit:
+            ultima = filas[-1]
+            headers["X-Next-Cursor"] = codificar_cursor(ultima["created_at"], ultima["id"])
+        # Las filas vienen de PostgREST ya serializadas: no se revalidan con Pydantic
+        return JSONResponse(content=filas, headers=headers)
     except HTTPException:
         raise
     except Exception as e:
@@ -361,10 +692,117 @@ async def listar_publicadores(current_user: dict = Depends(get_current_user)):
             detail="Error al obtener publicadores"
         )
 
+# Id mínimo para posiciones del cursor de cambios que no vienen de una fila: el
+# desempate por id necesita un UUID válido (PostgREST rechaza comparar con "")
+ID_CURSOR_INICIAL = "00000000-0000-0000-0000-000000000000"
+
+def _posicion_cambios(filas, columna: str, limite: str, anterior):
+    """Posición (fecha, id) del cursor de cambios después de leer `filas`"""
+    if not filas:
+        return anterior
+    ultima = filas[-1]
+    if parsear_fecha(ultima[columna]) > parsear_fecha(limite):
+        # Las filas más recientes que el margen se volverán a enviar en la próxima llamada
+        return [limite, ID_CURSOR_INICIAL]
+    return [ultima[columna], ultima["id"]]
+
+@app.get("/publicadores/changes")
+async def cambios_publicadores(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Publicadores creados o modificados y ids eliminados desde `since`, en orden de updated_at.
+    Sin `since` devuelve la lista completa (por páginas) como punto de partida. Si hay_mas es
+    true se vuelve a llamar con el cursor devuelto; un cliente puede recibir de nuevo filas
+    que ya tenía (las de los últimos segundos), así que debe aplicarlas por id."""
+    if current_user["rol"] not in ["anciano", "siervo"] and not current_user.get("is_superuser"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permiso para ver publicadores"
+        )
+    limite = (datetime.now(timezone.utc) - timedelta(seconds=PUBLICADORES_CAMBIOS_MARGEN_SEG)).isoformat()
+    if since:
+        try:
+            posicion, posicion_eliminados = decodificar_cursor(since)
+            parsear_fecha(posicion_eliminados[0])
+            if posicion is not None:
+                parsear_fecha(posicion[0])
+        except (ValueError, TypeError, IndexError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    else:
+        # Un cliente sin datos no necesita bajas anteriores a esta primera sincronización
+        posicion, posicion_eliminados = None, [limite, ID_CURSOR_INICIAL]
+    try:
+        query = db.table("publicadores").select("*")
+        if posicion:
+            query = query.despues_de("updated_at", posicion[0], posicion[1], desc=False)
+        cambios = await query.order("updated_at").order("id").limit(limit + 1).execute()
+        eliminados = await db.table("publicadores_eliminados").select("id,publicador_id,eliminado_en").despues_de(
+            "eliminado_en", posicion_eliminados[0], posicion_eliminados[1], desc=False
+        ).order("eliminado_en").order("id").limit(limit + 1).execute()
+    except Exception as e:
+        print(f"Error en cambios_publicadores: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al obtener cambios de publicadores"
+        )
+    filas, bajas = cambios.data[:limit], eliminados.data[:limit]
+    cursor = codificar_cursor(
+        _posicion_cambios(filas, "updated_at", limite, posicion),
+        _posicion_cambios(bajas, "eliminado_en", limite, posicion_eliminados)
+    )
+    return JSONResponse(content={
+        "cambios": filas,
+        "eliminados": [b["publicador_id"] for b in bajas],
+        "cursor": cursor,
+        "hay_mas": len(cambios.data) > limit or len(eliminados.data) > limit
+    })
+
+# --- ESTADÍSTICAS DE PUBLICADORES ---
+async def recalcular_estadisticas():
+    filas = db.iterar_keyset("publicadores", columnas="grupo,precursor,animo")
+    if await estadisticas.recalcular(filas):
+        print("Estadísticas desviadas respecto a la tabla, corregidas")
+
+@app.get("/publicadores/stats")
+async def estadisticas_publicadores(current_user: dict = Depends(get_current_user)):
+    """Totales, precursores, con ánimo y desglose por grupo"""
+    try:
+        if current_user["rol"] not in ["anciano", "siervo"] and not current_user.get("is_superuser"):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="No tienes permiso para ver publicadores"
+            )
+        
+        # Un count del total no detecta desviaciones en precursores, ánimo o grupos (la
+        # cantidad de filas puede coincidir): se recalcula completo una vez por intervalo
+        if not estadisticas.lista or time.monotonic() - estadisticas.verificado_en > ESTADISTICAS_VERIFICACION_SEG:
+            estadisticas.verificado_en = time.monotonic()
+            await recalcular_estadisticas()
+        
+        return estadisticas.resumen()
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error en estadisticas_publicadores: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al obtener estadísticas"
+        )
+
 # --- FUNCIÓN AUXILIAR PARA CREAR NOTIFICACIONES ---
+# Se encolan y se insertan por lotes en segundo plano: el endpoint no espera el INSERT
 def crear_notificacion(tipo: str, mensaje: str):
     try:
-        supabase.table("notificaciones").insert({"tipo": tipo, "mensaje": mensaje}).execute()
+        ahora = datetime.now(timezone.utc)
+        escritor_notificaciones.encolar({
+            "tipo": tipo,
+            "mensaje": mensaje,
+            "fecha_creacion": ahora.isoformat()
+        })
+        actividad.registrar(tipo, ahora)
+        bus_eventos.publicar("notificaciones", tipo, {"tipo": tipo, "mensaje": mensaje, "fecha_creacion": ahora.isoformat()})
     except Exception as e:
         print(f"Error al crear notificación automática: {str(e)}")
 
@@ -384,7 +822,7 @@ async def agregar_publicador(
             "creado_por": current_user["id"]
         }
         
-        result = supabase.table("publicadores").insert(publicador_data).execute()
+        result = await db.table("publicadores").insert(publicador_data).execute()
         
         if not result.data:
             raise HTTPException(
@@ -392,6 +830,10 @@ async def agregar_publicador(
                 detail="Error al crear publicador"
             )
         
+        estadisticas.agregar(result.data[0])
+        actividad.registrar(TIPO_ALTA_PUBLICADOR)
+        bus_eventos.publicar("publicadores", "publicador_agregado", result.data[0], grupo=pub.grupo)
+        
         # Notificación automática
         crear_notificacion(
             "publicador_agregado",
@@ -407,6 +849,112 @@ async def agregar_publicador(
             detail="Error al crear publicador"
         )
 
+@app.post("/publicadores/import")
+async def importar_publicadores(
+    request: Request,
+    formato: Optional[str] = None,
+    lote: int = Query(IMPORTACION_LOTE, ge=1, le=1000),
+    current_user: dict = Depends(check_role("anciano"))
+):
+    """Importar publicadores desde CSV o NDJSON en streaming (solo ancianos).
+    Las filas se validan con el modelo Publicador y se insertan por lotes."""
+    if formato is None:
+        tipo_contenido = request.headers.get("content-type", "")
+        formato = "ndjson" if "ndjson" in tipo_contenido or "jsonl" in tipo_contenido else "csv"
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato no válido (csv o ndjson)")
+    
+    filas = filas_csv(request.stream()) if formato == "csv" else filas_ndjson(request.stream())
+    insertados = 0
+    # {grupo: insertados}, para avisar a cada grupo por el canal push
+    insertados_por_grupo = {}
+    total_errores = 0
+    errores = []
+    pendientes = []
+    
+    def registrar_error(numero: int, mensaje: str):
+        nonlocal total_errores
+        total_errores += 1
+        # Solo se detallan los primeros errores para mantener la memoria acotada
+        if len(errores) < IMPORTACION_MAX_ERRORES:
+            errores.append({"fila": numero, "error": mensaje})
+    
+    async def insertar_filas(numeradas):
+        """Insertar [(número, fila)]; si la base rechaza el grupo por su contenido (4xx)
+        se divide en mitades hasta aislar las filas malas, que quedan como errores."""
+        nonlocal insertados
+        datos = [fila for _, fila in numeradas]
+        try:
+            await db.table("publicadores").insert(datos, returning="minimal").execute()
+        except Exception as e:
+            if error_permanente(e) and len(numeradas) > 1:
+                mitad = len(numeradas) // 2
+                await insertar_filas(numeradas[:mitad])
+                await insertar_filas(numeradas[mitad:])
+                return
+            print(f"Error al insertar lote de importación: {str(e)}")
+            mensaje = "La base de datos rechazó la fila" if error_permanente(e) else "Error al insertar en la base de datos"
+            for numero, _ in numeradas:
+                registrar_error(numero, mensaje)
+        else:
+            insertados += len(datos)
+            for fila in datos:
+                estadisticas.agregar(fila)
+                insertados_por_grupo[fila["grupo"]] = insertados_por_grupo.get(fila["grupo"], 0) + 1
+            actividad.registrar(TIPO_ALTA_PUBLICADOR, cantidad=len(datos))
+    
+    async def insertar_lote():
+        await insertar_filas(list(pendientes))
+        pendientes.clear()
+    
+    try:
+        async for numero, fila in filas:
+            if isinstance(fila, Exception):
+                registrar_error(numero, str(fila))
+                continue
+            try:
+                pub = Publicador(**normalizar_booleanos(fila, ["precursor", "animo"]))
+            except (ValidationError, TypeError) as e:
+                mensaje = "; ".join(
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                ) if isinstance(e, ValidationError) else str(e)
+                registrar_error(numero, mensaje)
+                continue
+            pendientes.append((numero, {**pub.model_dump(), "creado_por": current_user["id"]}))
+            if len(pendientes) >= lote:
+                await insertar_lote()
+        if pendientes:
+            await insertar_lote()
+    except ValueError as e:
+        # El archivo no se puede leer (p. ej. comillas sin cerrar): se corta la importación
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{str(e)} (insertados hasta el momento: {insertados})"
+        )
+    except Exception as e:
+        print(f"Error en importar_publicadores: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al importar publicadores (insertados hasta el momento: {insertados})"
+        )
+    
+    # Una sola notificación para toda la importación
+    if insertados:
+        # Un evento por grupo: los suscriptores con solo_mi_grupo filtran por el grupo del evento
+        for grupo, cantidad in insertados_por_grupo.items():
+            bus_eventos.publicar(
+                "publicadores", "publicadores_importados", {"insertados": cantidad, "grupo": grupo}, grupo=grupo
+            )
+        crear_notificacion(
+            "publicadores_importados",
+            f"{current_user['nombre']} importó {insertados} publicadores"
+        )
+    return {
+        "insertados": insertados,
+        "total_errores": total_errores,
+        "errores": errores
+    }
+
 @app.put("/publicadores/{publicador_id}", response_model=PublicadorResponse)
 async def editar_publicador(
     publicador_id: str,
@@ -416,7 +964,7 @@ async def editar_publicador(
     """Editar un publicador (solo ancianos)"""
     try:
         # Verificar que el publicador existe
-        existing = supabase.table("publicadores").select("*").eq("id", publicador_id).execute()
+        existing = await db.table("publicadores").select("*").eq("id", publicador_id).execute()
         if not existing.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -432,7 +980,7 @@ async def editar_publicador(
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        result = supabase.table("publicadores").update(publicador_data).eq("id", publicador_id).execute()
+        result = await db.table("publicadores").update(publicador_data).eq("id", publicador_id).execute()
         
         if not result.data:
             raise HTTPException(
@@ -440,6 +988,12 @@ async def editar_publicador(
                 detail="Error al actualizar publicador"
             )
         
+        estadisticas.quitar(existing.data[0])
+        estadisticas.agregar(result.data[0])
+        # Si cambió de grupo, el evento llega a los suscriptores de ambos grupos
+        for grupo in {existing.data[0].get("grupo"), pub.grupo}:
+            bus_eventos.publicar("publicadores", "publicador_editado", result.data[0], grupo=grupo)
+        
         # Notificación automática
         crear_notificacion(
             "publicador_editado",
@@ -463,7 +1017,7 @@ async def eliminar_publicador(
     """Eliminar un publicador (solo ancianos)"""
     try:
         # Verificar que el publicador existe
-        existing = supabase.table("publicadores").select("*").eq("id", publicador_id).execute()
+        existing = await db.table("publicadores").select("*").eq("id", publicador_id).execute()
         if not existing.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -471,7 +1025,13 @@ async def eliminar_publicador(
             )
         
         nombre_pub = existing.data[0]["nombre"]
-        supabase.table("publicadores").delete().eq("id", publicador_id).execute()
+        await db.table("publicadores").delete().eq("id", publicador_id).execute()
+        # La lápida para GET /publicadores/changes la escribe el trigger AFTER DELETE
+        # en la misma transacción del DELETE (ver update_supabase_schema.sql)
+        estadisticas.quitar(existing.data[0])
+        bus_eventos.publicar(
+            "publicadores", "publicador_eliminado", {"id": publicador_id}, grupo=existing.data[0].get("grupo")
+        )
         
         # Notificación automática
         crear_notificacion(
@@ -489,16 +1049,66 @@ async def eliminar_publicador(
         )
 
 # --- ENDPOINTS DE NOTIFICACIONES ---
-@app.get("/notificaciones/", response_model=List[NotificacionOut])
-async def listar_notificaciones(current_user: dict = Depends(allowed_roles())):
-    """Listar notificaciones globales (solo ancianos, siervos y superusuario)"""
+@app.get("/notificaciones/")
+async def listar_notificaciones(
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[str] = None,
+    since: Optional[datetime] = None,
+    current_user: dict = Depends(allowed_roles())
+):
+    """Listar notificaciones globales, más recientes primero (solo ancianos, siervos y superusuario).
+    `before` es el cursor devuelto en X-Next-Cursor; `since` devuelve solo las posteriores a esa fecha."""
     try:
-        response = supabase.table("notificaciones").select("*").order("fecha_creacion", desc=True).execute()
-        return response.data
+        # La primera página se sirve desde caché hasta que se escriba o borre una notificación
+        clave = ("pagina", limit)
+        if not before and not since:
+            cacheada = notificaciones_cache.get(clave)
+            if cacheada is not None:
+                return JSONResponse(content=cacheada[0], headers=cacheada[1])
+        
+        query = db.table("notificaciones").select("*")
+        if since:
+            query = query.gt("fecha_creacion", since.isoformat())
+        if before:
+            try:
+                fecha, id_fila = decodificar_cursor_fecha(before)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Cursor inválido")
+            query = query.despues_de("fecha_creacion", fecha, id_fila, desc=True)
+        
+        response = await query.order("fecha_creacion", desc=True).order("id", desc=True).limit(limit + 1).execute()
+        filas = response.data[:limit]
+        headers = {}
+        if len(response.data) > limit:
+            ultima = filas[-1]
+            headers["X-Next-Cursor"] = codificar_cursor(ultima["fecha_creacion"], ultima["id"])
+        if not before and not since:
+            notificaciones_cache.set(clave, (filas, headers))
+        return JSONResponse(content=filas, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al listar notificaciones: {str(e)}")
         raise HTTPException(status_code=500, detail="Error al obtener notificaciones")
 
+@app.get("/notificaciones/count")
+async def contar_notificaciones(
+    since: Optional[datetime] = None,
+    current_user: dict = Depends(allowed_roles())
+):
+    """Número de notificaciones (posteriores a `since` si se indica), para el badge"""
+    try:
+        clave = ("count", since.isoformat() if since else None)
+        total = notificaciones_cache.get(clave)
+        if total is None:
+            filtros = (lambda q: q.gt("fecha_creacion", since.isoformat())) if since else None
+            total = await db.contar("notificaciones", filtros)
+            notificaciones_cache.set(clave, total)
+        return {"count": total}
+    except Exception as e:
+        print(f"Error al contar notificaciones: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error al contar notificaciones")
+
 # Renombrar el endpoint POST para evitar conflicto de nombres
 @app.post("/notificaciones/", response_model=NotificacionOut)
 async def crear_notificacion_endpoint(data: Notificacion, superuser: dict = Depends(get_superuser)):
@@ -508,9 +1118,12 @@ async def crear_notificacion_endpoint(data: Notificacion, superuser: dict = Depe
             "tipo": data.tipo,
             "mensaje": data.mensaje
         }
-        response = supabase.table("notificaciones").insert(noti_data).execute()
+        response = await db.table("notificaciones").insert(noti_data).execute()
         if not response.data:
             raise HTTPException(status_code=400, detail="No se pudo crear la notificación")
+        actividad.registrar(data.tipo)
+        notificaciones_cache.clear()
+        bus_eventos.publicar("notificaciones", data.tipo, response.data[0])
         return response.data[0]
     except Exception as e:
         print(f"Error al crear notificación: {str(e)}")
@@ -520,14 +1133,870 @@ async def crear_notificacion_endpoint(data: Notificacion, superuser: dict = Depe
 async def eliminar_notificacion(noti_id: str, superuser: dict = Depends(get_superuser)):
     """Eliminar una notificación por ID (solo superusuario)"""
     try:
-        response = supabase.table("notificaciones").delete().eq("id", noti_id).execute()
+        response = await db.table("notificaciones").delete().eq("id", noti_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Notificación no encontrada")
+        notificaciones_cache.clear()
         return {"message": "Notificación eliminada"}
     except Exception as e:
         print(f"Error al eliminar notificación: {str(e)}")
         raise HTTPException(status_code=500, detail="Error al eliminar notificación")
 
+# --- INGESTA DE GPS ---
+@app.post("/ubicaciones/lote")
+async def ingerir_ubicaciones(lote: LoteUbicaciones, current_user: dict = Depends(map_roles())):
+    """Recibir un lote de fixes GPS del usuario actual.
+    Se filtran, se simplifican y se escriben en ubicaciones por lotes en segundo plano."""
+    ahora = datetime.now(timezone.utc)
+    fixes = []
+    for fix in lote.fixes:
+        datos = fix.model_dump()
+        fecha = datos.pop("fecha") or ahora
+        datos["fecha"] = fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+        fixes.append(datos)
+    
+    aceptados, resumen = filtro_gps.procesar(current_user["id"], fixes)
+    for fix in aceptados:
+        escritor_ubicaciones.encolar({
+            "usuario_id": current_user["id"],
+            "latitud": fix["latitud"],
+            "longitud": fix["longitud"],
+            "precision_gps": fix["precision_gps"],
+            "velocidad": fix["velocidad"],
+            "direccion": fix["direccion"],
+            "created_at": fix["fecha"].isoformat()
+        })
+    if aceptados:
+        ultimo = aceptados[-1]
+        vigente = posiciones.actualizar(current_user["id"], {
+            "nombre": current_user.get("nombre"),
+            "grupo": current_user.get("grupo_asignado"),
+            "latitud": ultimo["latitud"],
+            "longitud": ultimo["longitud"],
+            "precision_gps": ultimo["precision_gps"],
+            "velocidad": ultimo["velocidad"],
+            "direccion": ultimo["direccion"],
+            "fecha": ultimo["fecha"].astimezone(timezone.utc).isoformat()
+        })
+        if vigente:
+            indice_cercanos.actualizar(
+                current_user["id"], ultimo["latitud"], ultimo["longitud"], current_user.get("grupo_asignado")
+            )
+    return resumen
+
+# --- TERRITORIOS ---
+async def recargar_territorios():
+    territorios = [t async for t in db.iterar_keyset("territorios")]
+    indice_territorios.reconstruir(territorios)
+    geometrias.reconstruir(territorios)
+    for territorio in territorios:
+        cobertura.preparar(territorio)
+
+async def cargar_cobertura(territorio_id: Optional[str] = None):
+    """Marcar la cobertura con las marcaciones existentes (de un territorio o de todos)"""
+    filtros = (lambda q: q.eq("territorio_id", territorio_id)) if territorio_id else None
+    try:
+        marcaciones = db.iterar_keyset(
+            "marcaciones", columnas="territorio_id,latitud,longitud", filtros=filtros
+        )
+        await cobertura.cargar(marcaciones)
+    except Exception as e:
+        print(f"Error al cargar cobertura: {str(e)}")
+
+async def cargar_marcaciones_en_memoria():
+    """Una sola pasada por marcaciones al arrancar para la cobertura y los clusters"""
+    try:
+        marcaciones = db.iterar_keyset("marcaciones", columnas="territorio_id,latitud,longitud,tipo")
+        async for marcacion in marcaciones:
+            cobertura.marcar(marcacion)
+            clusters.agregar(marcacion)
+        cobertura.lista = clusters.lista = True
+    except Exception as e:
+        print(f"Error al cargar marcaciones en memoria: {str(e)}")
+
+async def registrar_territorio(territorio: dict):
+    """Mantener los índices en memoria al crear o editar un territorio"""
+    indice_territorios.actualizar(territorio)
+    geometrias.actualizar(territorio)
+    if cobertura.preparar(territorio):
+        # Grilla nueva (o geometría cambiada): se vuelven a marcar sus marcaciones
+        await cargar_cobertura(territorio["id"])
+
+def registrar_marcacion(marcacion: dict, anterior: Optional[dict] = None):
+    """Mantener los índices en memoria al crear una marcación o al editarla (`anterior`)"""
+    cobertura.marcar(marcacion)
+    clusters.agregar(marcacion)
+    teselas_marcaciones.invalidar(float(marcacion["latitud"]), float(marcacion["longitud"]))
+    if anterior is not None:
+        teselas_marcaciones.invalidar(float(anterior["latitud"]), float(anterior["longitud"]))
+        # Editar una marcación de otro día cambia el parcial de ese día en el mapa de calor
+        if anterior.get("created_at"):
+            dia = parsear_fecha(anterior["created_at"]).astimezone(timezone.utc).date()
+            mapa_calor.invalidar_dia("marcaciones", dia)
+
+def validar_territorio(territorio: Territorio) -> dict:
+    """Validar estado y polígono; devuelve las columnas derivadas de la geometría"""
+    if territorio.estado not in ESTADOS_TERRITORIO:
+        raise HTTPException(status_code=400, detail="Estado de territorio no válido")
+    try:
+        poligonos = poligonos_geojson(territorio.geojson_data)
+        validar_poligonos(poligonos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"GeoJSON no válido: {str(e)}")
+    return metadatos_poligonos(poligonos)
+
+@app.get("/territorios")
+async def listar_territorios(
+    request: Request,
+    zoom: int = Query(22, ge=0, le=22),
+    current_user: dict = Depends(map_roles())
+):
+    """Territorios como FeatureCollection, con la geometría simplificada para el zoom pedido
+    y bbox, centroide y área en las propiedades. Responde 304 si el ETag no cambió."""
+    coleccion = geometrias.coleccion(zoom)
+    headers = {"ETag": coleccion.etag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if etag_coincide(request.headers.get("if-none-match", ""), coleccion.etag):
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(
+            coleccion.gzip, media_type="application/geo+json", headers={**headers, "Content-Encoding": "gzip"}
+        )
+    return Response(coleccion.cuerpo, media_type="application/geo+json", headers=headers)
+
+@app.get("/territorios/resolver")
+async def resolver_territorio(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    current_user: dict = Depends(map_roles())
+):
+    """Territorio activo que contiene el punto (territorio_id null si ninguno)"""
+    return {"territorio_id": indice_territorios.resolver(lat, lng)}
+
+@app.post("/territorios")
+async def crear_territorio(territorio: Territorio, current_user: dict = Depends(check_role("anciano"))):
+    """Crear un territorio (solo ancianos)"""
+    metadatos = validar_territorio(territorio)
+    try:
+        result = await db.table("territorios").insert({**territorio.model_dump(), **metadatos}).execute()
+        if not result.data:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error al crear territorio"
+            )
+        await registrar_territorio(result.data[0])
+        return result.data[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error en crear_territorio: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al crear territorio"
+        )
+
+@app.put("/territorios/{territorio_id}")
+async def editar_territorio(
+    territorio_id: str,
+    territorio: Territorio,
+    current_user: dict = Depends(check_role("anciano"))
+):
+    """Editar un territorio (solo ancianos)"""
+    metadatos = validar_territorio(territorio)
+    try:
+        datos = {**territorio.model_dump(), **metadatos, "updated_at": datetime.utcnow().isoformat()}
+        result = await db.table("territorios").update(datos).eq("id", territorio_id).execute()
+        if not result.data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Territorio no encontrado"
+            )
+        await registrar_territorio(result.data[0])
+        return result.data[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error en editar_territorio: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al actualizar territorio"
+        )
+
+@app.get("/territorios/cobertura")
+async def cobertura_territorios(current_user: dict = Depends(admin_roles())):
+    """Porcentaje trabajado de cada territorio activo"""
+    return {"lista": cobertura.lista, "territorios": cobertura.resumen()}
+
+@app.get("/territorios/{territorio_id}/cobertura")
+async def cobertura_territorio(territorio_id: str, current_user: dict = Depends(admin_roles())):
+    """Porcentaje trabajado de un territorio y sus celdas sin cubrir en GeoJSON"""
+    resumen = cobertura.porcentaje(territorio_id)
+    if resumen is None:
+        raise HTTPException(status_code=404, detail="Territorio no encontrado o inactivo")
+    return {
+        **resumen,
+        "lista": cobertura.lista,
+        "sin_cubrir": {
+            "type": "Feature",
+            "properties": {"territorio_id": territorio_id},
+            "geometry": cobertura.sin_cubrir(territorio_id)
+        }
+    }
+
+# --- MARCACIONES ---
+@app.post("/marcaciones")
+async def crear_marcacion(marcacion: Marcacion, current_user: dict = Depends(map_roles())):
+    """Registrar una casa predicada; si no se indica territorio_id se calcula con el índice"""
+    if marcacion.tipo not in TIPOS_MARCACION:
+        raise HTTPException(status_code=400, detail="Tipo de marcación no válido")
+    datos = {
+        **marcacion.model_dump(),
+        "usuario_id": current_user["id"],
+        "geohash": geohash(marcacion.latitud, marcacion.longitud, PRECISION_GEOHASH)
+    }
+    if datos["territorio_id"] is None:
+        datos["territorio_id"] = indice_territorios.resolver(marcacion.latitud, marcacion.longitud)
+    try:
+        result = await db.table("marcaciones").insert(datos).execute()
+        if not result.data:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error al crear marcación"
+            )
+        registrar_marcacion(result.data[0])
+        return result.data[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error en crear_marcacion: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al crear marcación"
+        )
+
+async def buscar_claves_sync(usuario_id: str, claves) -> dict:
+    """{idempotency_key: marcación} de las claves que ya existen en la base"""
+    encontradas = {}
+    claves = list(claves)
+    for i in range(0, len(claves), 200):
+        result = await db.table("marcaciones").select("*").eq(
+            "usuario_id", usuario_id
+        ).in_("idempotency_key", claves[i:i + 200]).execute()
+        for fila in result.data:
+            encontradas[fila["idempotency_key"]] = fila
+    return encontradas
+
+async def upsert_marcaciones(filas, errores: dict) -> list:
+    """Insertar marcaciones ignorando las claves que ya existen; devuelve las creadas.
+    Si la base rechaza un grupo por su contenido (4xx) se divide en mitades hasta aislar
+    las filas malas; esas filas, y las de un grupo que falló por red o 5xx, quedan en
+    `errores` ({idempotency_key: detalle}) sin cortar el resto del lote."""
+    try:
+        # Otro request con las mismas claves pudo insertarlas antes: el conflicto se ignora
+        result = await db.table("marcaciones").upsert(
+            filas, on_conflict="usuario_id,idempotency_key", ignore_duplicates=True
+        ).execute()
+        return result.data
+    except Exception as e:
+        if not error_permanente(e):
+            print(f"Error en sincronizar_marcaciones: {str(e)}")
+            for fila in filas:
+                errores[fila["idempotency_key"]] = "Error al guardar la marcación, reintentar"
+            return []
+        if len(filas) == 1:
+            print(f"Marcación rechazada en sincronizar_marcaciones: {str(e)}")
+            errores[filas[0]["idempotency_key"]] = "La base de datos rechazó la marcación"
+            return []
+    mitad = len(filas) // 2
+    return await upsert_marcaciones(filas[:mitad], errores) + await upsert_marcaciones(filas[mitad:], errores)
+
+@app.post("/marcaciones/sync")
+async def sincronizar_marcaciones(lote: LoteMarcaciones, current_user: dict = Depends(map_roles())):
+    """Subir en un solo request las marcaciones guardadas sin conexión.
+    Cada ítem trae una idempotency_key: los reintentos devuelven la marcación ya creada
+    (estado "duplicada") en lugar de insertarla otra vez. Responde un resultado por ítem;
+    un ítem que la base rechaza queda con estado "error" sin afectar a los demás."""
+    usuario_id = current_user["id"]
+    ahora = datetime.now(timezone.utc)
+    resultados = [None] * len(lote.items)
+    primeros = {}  # {idempotency_key: índice del primer ítem con esa clave}
+    repetidos = []  # Ítems que repiten una clave dentro del mismo lote
+    nuevos = {}  # Las claves de `primeros` que aún no se sabe si existen
+    for i, item in enumerate(lote.items):
+        clave = item.idempotency_key
+        if item.tipo not in TIPOS_MARCACION:
+            resultados[i] = {"idempotency_key": clave, "estado": "error", "detalle": "Tipo de marcación no válido"}
+        elif clave in primeros:
+            repetidos.append(i)
+        else:
+            primeros[clave] = i
+            marcacion_id = claves_sync.get((usuario_id, clave))
+            if marcacion_id is not None:
+                resultados[i] = {"idempotency_key": clave, "estado": "duplicada", "id": marcacion_id}
+            else:
+                nuevos[clave] = i
+
+    # Marcaciones que ya estaban en la base sin pasar por la caché de claves: pueden venir de
+    # un request anterior que se cortó después de guardarlas, así que también se indexan
+    existentes = []
+    try:
+        # Claves que ya no están en la caché (reinicio o expulsión) se comprueban en la base
+        if nuevos:
+            for clave, fila in (await buscar_claves_sync(usuario_id, nuevos)).items():
+                resultados[nuevos.pop(clave)] = {"idempotency_key": clave, "estado": "duplicada", "id": fila["id"]}
+                existentes.append(fila)
+    except Exception as e:
+        print(f"Error en sincronizar_marcaciones: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al sincronizar marcaciones"
+        )
+
+    items = [lote.items[i] for i in nuevos.values()]
+    # Un territorio_id que no es un UUID o que no está en el índice (el dispositivo pudo
+    # guardarlo antes de que el territorio se borrara o desactivara) se vuelve a calcular
+    sin_territorio = [
+        n for n, item in enumerate(items)
+        if item.territorio_id is None or not es_uuid(item.territorio_id)
+        or (indice_territorios.lista and not indice_territorios.contiene(item.territorio_id))
+    ]
+    resueltos = indice_territorios.resolver_lote(
+        [items[n].latitud for n in sin_territorio], [items[n].longitud for n in sin_territorio]
+    )
+    territorios = {n: territorio_id for n, territorio_id in zip(sin_territorio, resueltos)}
+    filas = []
+    for n, item in enumerate(items):
+        datos = item.model_dump(exclude={"fecha"})
+        datos["usuario_id"] = usuario_id
+        datos["geohash"] = geohash(item.latitud, item.longitud, PRECISION_GEOHASH)
+        if n in territorios:
+            datos["territorio_id"] = territorios[n]
+        if item.fecha is not None:
+            fecha = item.fecha if item.fecha.tzinfo else item.fecha.replace(tzinfo=timezone.utc)
+            datos["created_at"] = min(fecha, ahora).isoformat()
+        filas.append(datos)
+
+    creadas = []
+    errores = {}
+    for i in range(0, len(filas), 200):
+        creadas.extend(await upsert_marcaciones(filas[i:i + 200], errores))
+    for clave, detalle in errores.items():
+        resultados[nuevos.pop(clave)] = {"idempotency_key": clave, "estado": "error", "detalle": detalle}
+
+    dias = set()
+    for fila in creadas + existentes:
+        clave = fila["idempotency_key"]
+        claves_sync.set((usuario_id, clave), fila["id"])
+        if clave in nuevos:
+            resultados[nuevos.pop(clave)] = {"idempotency_key": clave, "estado": "creada", "id": fila["id"]}
+        # Indexar dos veces la misma marcación no cambia nada: los índices van por id o por celda
+        registrar_marcacion(fila)
+        if fila.get("created_at"):
+            dias.add(parsear_fecha(fila["created_at"]).astimezone(timezone.utc).date())
+    # Las marcaciones con fecha de días anteriores cambian parciales ya cacheados del mapa de calor
+    for dia in dias:
+        mapa_calor.invalidar_dia("marcaciones", dia)
+    if nuevos:
+        # Claves insertadas por otro request entre la comprobación y el upsert
+        try:
+            encontradas = await buscar_claves_sync(usuario_id, nuevos)
+        except Exception as e:
+            print(f"Error en sincronizar_marcaciones: {str(e)}")
+            encontradas = {}
+        for clave, i in nuevos.items():
+            fila = encontradas.get(clave)
+            if fila is not None:
+                claves_sync.set((usuario_id, clave), fila["id"])
+            resultados[i] = {"idempotency_key": clave, "estado": "duplicada", "id": fila["id"] if fila else None}
+    for i in repetidos:
+        clave = lote.items[i].idempotency_key
+        primero = resultados[primeros[clave]]
+        if primero["estado"] == "error":
+            resultados[i] = dict(primero)
+        else:
+            resultados[i] = {"idempotency_key": clave, "estado": "duplicada", "id": primero.get("id")}
+
+    conteo = {"creada": 0, "duplicada": 0, "error": 0}
+    for resultado in resultados:
+        conteo[resultado["estado"]] += 1
+    return {
+        "creadas": conteo["creada"],
+        "duplicadas": conteo["duplicada"],
+        "errores": conteo["error"],
+        "resultados": resultados
+    }
+
+@app.put("/marcaciones/{marcacion_id}")
+async def editar_marcacion(
+    marcacion_id: str,
+    marcacion: Marcacion,
+    current_user: dict = Depends(map_roles())
+):
+    """Editar una marcación (su autor, ancianos, siervos o superusuario)"""
+    if marcacion.tipo not in TIPOS_MARCACION:
+        raise HTTPException(status_code=400, detail="Tipo de marcación no válido")
+    try:
+        existing = await db.table("marcaciones").select("*").eq("id", marcacion_id).execute()
+        if not existing.data:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Marcación no encontrada")
+        anterior = existing.data[0]
+        if (anterior["usuario_id"] != current_user["id"] and current_user["rol"] not in ["anciano", "siervo"]
+                and not current_user.get("is_superuser")):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo el autor, ancianos o siervos pueden editar esta marcación"
+            )
+        datos = {
+            **marcacion.model_dump(),
+            "geohash": geohash(marcacion.latitud, marcacion.longitud, PRECISION_GEOHASH)
+        }
+        if datos["territorio_id"] is None:
+            datos["territorio_id"] = indice_territorios.resolver(marcacion.latitud, marcacion.longitud)
+        result = await db.table("marcaciones").update(datos).eq("id", marcacion_id).execute()
+        if not result.data:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error al actualizar marcación"
+            )
+        registrar_marcacion(result.data[0], anterior)
+        return result.data[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error en editar_marcacion: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al actualizar marcación"
+        )
+
+@app.get("/marcaciones/clusters")
+async def clusters_marcaciones(
+    bbox: str = Query(..., description="min_lng,min_lat,max_lng,max_lat"),
+    zoom: int = Query(..., ge=0, le=22),
+    current_user: dict = Depends(map_roles())
+):
+    """Marcaciones agrupadas para el zoom pedido: centroide, total, conteo por tipo y zoom de expansión.
+    Las que quedan solas se devuelven como marcaciones sueltas (cluster=false)."""
+    try:
+        return {"lista": clusters.lista, "zoom": zoom, "clusters": clusters.consultar(parsear_bbox(bbox), zoom)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"bbox inválido: {str(e)}")
+
+@app.get("/marcaciones")
+async def marcaciones_en_bbox(
+    bbox: str = Query(..., description="min_lng,min_lat,max_lng,max_lat"),
+    tipo: Optional[str] = None,
+    current_user: dict = Depends(map_roles())
+):
+    """Marcaciones dentro del viewport, servidas por teselas geohash desde la caché"""
+    try:
+        filas = await teselas_marcaciones.en_bbox(parsear_bbox(bbox))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"bbox inválido: {str(e)}")
+    except Exception as e:
+        print(f"Error en marcaciones_en_bbox: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al obtener marcaciones"
+        )
+    if tipo:
+        filas = [f for f in filas if f["tipo"] == tipo]
+    return filas
+
+# --- RECORRIDOS (UBICACIONES COMPACTADAS) ---
+@app.get("/recorridos/{usuario_id}")
+async def recorridos_usuario(
+    usuario_id: str,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    puntos: bool = False,
+    current_user: dict = Depends(map_roles())
+):
+    """Recorridos diarios de un usuario en forma compacta (polilínea codificada y tiempos delta).
+    Con puntos=true se devuelven también decodificados. Cada usuario ve los suyos;
+    ancianos, siervos y superusuario ven los de todos."""
+    if (usuario_id != current_user["id"] and current_user["rol"] not in ["anciano", "siervo"]
+            and not current_user.get("is_superuser")):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo puedes ver tus propios recorridos"
+        )
+    hasta = hasta or datetime.now(timezone.utc).date()
+    desde = desde or hasta - timedelta(days=6)
+    if desde > hasta or (hasta - desde).days >= 92:
+        raise HTTPException(status_code=400, detail="Rango de fechas no válido (máximo 92 días)")
+    try:
+        response = await db.table("recorridos").select("*").eq("usuario_id", usuario_id).gte(
+            "fecha", desde.isoformat()
+        ).lte("fecha", hasta.isoformat()).order("fecha").execute()
+    except Exception as e:
+        print(f"Error en recorridos_usuario: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al obtener recorridos"
+        )
+    if puntos:
+        for recorrido in response.data:
+            recorrido["puntos"] = [
+                {"fecha": fecha.isoformat(), "latitud": lat, "longitud": lng}
+                for fecha, lat, lng in expandir_recorrido(recorrido)
+            ]
+    return response.data
+
+@app.post("/admin/ubicaciones/compactar")
+async def compactar_ubicaciones(
+    dias_crudos: int = Query(1, ge=1, le=30),
+    superuser: dict = Depends(get_superuser)
+):
+    """Compactar en recorridos las ubicaciones crudas anteriores a los últimos `dias_crudos` días
+    y borrar las filas crudas (solo superusuario)"""
+    hasta = datetime.now(timezone.utc).date() - timedelta(days=dias_crudos - 1)
+    try:
+        resultados = await compactar(db, hasta)
+    except Exception as e:
+        print(f"Error al compactar ubicaciones: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al compactar ubicaciones"
+        )
+    return {"dias": resultados}
+
+# --- MAPA DE CALOR ---
+@app.get("/mapa-calor/{z}/{x}/{y}")
+async def mapa_calor_tesela(
+    z: int,
+    x: int,
+    y: int,
+    fuentes: str = "marcaciones",
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    pesos: Optional[str] = Query(None, description="canal:peso separados por coma, p. ej. estudio:3,revisita:2"),
+    formato: str = "png",
+    current_user: dict = Depends(admin_roles())
+):
+    """Tesela del mapa de calor de actividad (marcaciones y/o ubicaciones) para un rango de fechas.
+    Devuelve un PNG o, con formato=json, la grilla en float32 codificada en base64."""
+    if not 0 <= z <= 22 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Tesela fuera de rango")
+    if formato not in ["png", "json"]:
+        raise HTTPException(status_code=400, detail="Formato no válido (png o json)")
+    lista_fuentes = [f.strip() for f in fuentes.split(",") if f.strip()]
+    if not lista_fuentes or any(f not in CANALES_CALOR for f in lista_fuentes):
+        raise HTTPException(status_code=400, detail="Fuente no válida (marcaciones o ubicaciones)")
+    hasta = hasta or datetime.now(timezone.utc).date()
+    desde = desde or hasta - timedelta(days=29)
+    if desde > hasta or (hasta - desde).days >= MAPA_CALOR_MAX_DIAS:
+        raise HTTPException(
+            status_code=400, detail=f"Rango de fechas no válido (máximo {MAPA_CALOR_MAX_DIAS} días)"
+        )
+    try:
+        dict_pesos = {
+            canal.strip(): float(peso) for canal, peso in (p.split(":") for p in pesos.split(","))
+        } if pesos else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Pesos no válidos (canal:peso,...)")
+    
+    try:
+        valores = await mapa_calor.tesela(lista_fuentes, z, x, y, desde, hasta, dict_pesos)
+    except Exception as e:
+        print(f"Error en mapa_calor_tesela: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al generar el mapa de calor"
+        )
+    if formato == "json":
+        return a_json(valores, z, x, y)
+    return Response(a_png(valores), media_type="image/png", headers={"Cache-Control": "private, max-age=60"})
+
+# --- MAPA EN VIVO ---
+@app.get("/mapa/posiciones")
+async def posiciones_mapa(
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    current_user: dict = Depends(map_roles())
+):
+    """Última posición conocida de cada usuario dentro del viewport (sin consultar ubicaciones)"""
+    if bbox is None:
+        return posiciones.todas()
+    try:
+        return posiciones.en_viewport(parsear_bbox(bbox))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"bbox inválido: {str(e)}")
+
+@app.get("/mapa/cercanos")
+async def usuarios_cercanos(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    territorio_id: Optional[str] = None,
+    k: int = Query(5, ge=1, le=100),
+    radio_m: Optional[float] = Query(None, gt=0),
+    grupo: Optional[int] = None,
+    current_user: dict = Depends(admin_roles())
+):
+    """Usuarios activos más cercanos a un punto o al centroide de un territorio,
+    según su última posición conocida (opcionalmente dentro de radio_m y de un grupo)"""
+    if territorio_id is not None:
+        centro = geometrias.centroide(territorio_id)
+        if centro is None:
+            raise HTTPException(status_code=404, detail="Territorio no encontrado")
+        lat, lng = centro
+    elif lat is None or lng is None:
+        raise HTTPException(status_code=400, detail="Indica lat y lng o territorio_id")
+    # Quitar antes de buscar las posiciones vencidas (también las saca del índice de cercanos):
+    # sin esto un usuario desconectado seguiría apareciendo como activo
+    posiciones.expirar()
+    resultado = []
+    for usuario_id, distancia in indice_cercanos.k_cercanos(lat, lng, k, radio_m, grupo):
+        posicion = posiciones.obtener(usuario_id)
+        if posicion is not None:
+            resultado.append({**posicion, "distancia_m": round(distancia, 1)})
+    return resultado
+
+@app.websocket("/ws/mapa")
+async def mapa_ws(websocket: WebSocket, token: Optional[str] = None, bbox: Optional[str] = None):
+    """Posiciones en vivo dentro de un viewport.
+    El cliente envía {"bbox": [min_lng, min_lat, max_lng, max_lat]} al mover el mapa; el servidor
+    responde con un snapshot y después envía solo los cambios (posición o salida del viewport),
+    agrupados por usuario y como mucho uno cada MAPA_INTERVALO_SEG."""
+    try:
+        await usuario_para_eventos(token, None)
+        viewport = parsear_bbox(bbox) if bbox else (-180.0, -90.0, 180.0, 90.0)
+    except (HTTPException, ValueError):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    suscriptor = posiciones.suscribir(viewport)
+    recibir = asyncio.create_task(websocket.receive())
+    try:
+        await websocket.send_text(json.dumps({"tipo": "snapshot", "posiciones": posiciones.en_viewport(viewport)}))
+        while True:
+            siguiente = asyncio.create_task(suscriptor.siguientes(EVENTOS_HEARTBEAT_SEG))
+            await asyncio.wait({recibir, siguiente}, return_when=asyncio.FIRST_COMPLETED)
+            if siguiente.done():
+                cambios = siguiente.result()
+                mensaje = {"tipo": "cambios", "cambios": cambios} if cambios else {"tipo": "heartbeat"}
+                await websocket.send_text(json.dumps(mensaje))
+            else:
+                siguiente.cancel()
+            if recibir.done():
+                mensaje = recibir.result()
+                if mensaje["type"] == "websocket.disconnect":
+                    break
+                try:
+                    nuevo = json.loads(mensaje.get("text") or "{}").get("bbox")
+                    if nuevo is not None:
+                        viewport = parsear_bbox(",".join(str(v) for v in nuevo))
+                        snapshot = posiciones.mover_viewport(suscriptor, viewport)
+                        await websocket.send_text(json.dumps({"tipo": "snapshot", "posiciones": snapshot}))
+                except (ValueError, TypeError, AttributeError) as e:
+                    await websocket.send_text(json.dumps({"tipo": "error", "detalle": f"bbox inválido: {str(e)}"}))
+                recibir = asyncio.create_task(websocket.receive())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        recibir.cancel()
+        posiciones.desuscribir(suscriptor)
+
+# --- CANAL PUSH (SSE / WEBSOCKET) ---
+async def usuario_para_eventos(token: Optional[str], credentials: Optional[HTTPAuthorizationCredentials]) -> dict:
+    token = token or (credentials.credentials if credentials else None)
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token requerido")
+    usuario = await autenticar(token)
+    if not puede_suscribirse(usuario):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo usuarios con roles activos pueden suscribirse a eventos"
+        )
+    return usuario
+
+async def revisar_permisos_suscriptor(suscriptor):
+    """En cada heartbeat se vuelve a leer el perfil (caché con TTL), para notar cambios de rol
+    hechos por fuera de la API; los hechos por la API se aplican al instante"""
+    try:
+        suscriptor.actualizar_usuario(await obtener_perfil(suscriptor.usuario["id"]))
+    except Exception as e:
+        print(f"Error al revisar permisos de suscriptor: {str(e)}")
+
+@app.get("/eventos")
+async def eventos_sse(
+    request: Request,
+    token: Optional[str] = None,
+    solo_mi_grupo: bool = False,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_opcional)
+):
+    """Server-Sent Events con los cambios de publicadores y las notificaciones"""
+    usuario = await usuario_para_eventos(token, credentials)
+    suscriptor = bus_eventos.suscribir(usuario, solo_mi_grupo)
+    
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                evento = await suscriptor.siguiente(EVENTOS_HEARTBEAT_SEG)
+                if evento is None:
+                    await revisar_permisos_suscriptor(suscriptor)
+                    if suscriptor.cerrado:
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: {evento['canal']}\ndata: {json.dumps(evento, default=str)}\n\n"
+        finally:
+            bus_eventos.desuscribir(suscriptor)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/eventos")
+async def eventos_ws(websocket: WebSocket, token: Optional[str] = None, solo_mi_grupo: bool = False):
+    """Mismo canal que /eventos sobre WebSocket"""
+    try:
+        usuario = await usuario_para_eventos(token, None)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    suscriptor = bus_eventos.suscribir(usuario, solo_mi_grupo)
+    # Se escucha al cliente en paralelo para notar el cierre sin esperar al próximo envío
+    recibir = asyncio.create_task(websocket.receive())
+    try:
+        while True:
+            siguiente = asyncio.create_task(suscriptor.siguiente(EVENTOS_HEARTBEAT_SEG))
+            await asyncio.wait({recibir, siguiente}, return_when=asyncio.FIRST_COMPLETED)
+            if siguiente.done():
+                evento = siguiente.result()
+                if evento is None:
+                    await revisar_permisos_suscriptor(suscriptor)
+                    if suscriptor.cerrado:
+                        await websocket.close(code=1008)
+                        break
+                await websocket.send_text(json.dumps(evento or {"tipo": "heartbeat"}, default=str))
+            else:
+                siguiente.cancel()
+            if recibir.done():
+                if recibir.result()["type"] == "websocket.disconnect":
+                    break
+                # Los mensajes del cliente se ignoran
+                recibir = asyncio.create_task(websocket.receive())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        recibir.cancel()
+        bus_eventos.desuscribir(suscriptor)
+
+# Cargar las estadísticas al arrancar
+@app.on_event("startup")
+async def cargar_estadisticas():
+    try:
+        await recalcular_estadisticas()
+    except Exception as e:
+        # Se reintenta en la primera consulta a /publicadores/stats
+        print(f"Error al cargar estadísticas: {str(e)}")
+    try:
+        await recargar_territorios()
+    except Exception as e:
+        # Sin índice, las marcaciones se guardan con territorio_id null
+        print(f"Error al cargar territorios: {str(e)}")
+    # Cobertura y clusters recorren todas las marcaciones: igual que actividad, no bloquean el arranque
+    app.state.tarea_marcaciones = asyncio.create_task(cargar_marcaciones_en_memoria())
+    escritor_notificaciones.iniciar()
+    escritor_ubicaciones.iniciar()
+    # La reconstrucción de actividad recorre todo el historial: no bloquea el arranque
+    app.state.tarea_actividad = asyncio.create_task(reconstruir_actividad())
+
+# Cerrar el pool de conexiones al apagar el servidor
+@app.on_event("shutdown")
+async def cerrar_conexiones():
+    # Escribir las notificaciones pendientes antes de cerrar el pool
+    await escritor_notificaciones.detener()
+    await escritor_ubicaciones.detener()
+    await db.cerrar()
+
+# --- ACTIVIDAD RECIENTE ---
+async def reconstruir_actividad():
+    desde = datetime.now(timezone.utc) - timedelta(days=ACTIVIDAD_DIAS_RETENCION)
+    try:
+        await actividad.reconstruir(eventos_historicos(db, desde))
+    except Exception as e:
+        print(f"Error al reconstruir actividad: {str(e)}")
+
+@app.get("/actividad")
+async def serie_actividad(
+    dias: int = Query(7, ge=1, le=366),
+    agrupacion: str = "dia",
+    tipos: Optional[str] = None,
+    current_user: dict = Depends(admin_roles())
+):
+    """Eventos por día o semana y por tipo (notificaciones y altas de publicadores)"""
+    if agrupacion not in ["dia", "semana"]:
+        raise HTTPException(status_code=400, detail="Agrupación no válida (dia o semana)")
+    actividad.podar()
+    hasta = datetime.now(timezone.utc).date()
+    desde = hasta - timedelta(days=dias - 1)
+    lista_tipos = [t.strip() for t in tipos.split(",") if t.strip()] if tipos else None
+    return actividad.serie(desde, hasta, agrupacion, lista_tipos)
+
+@app.post("/admin/actividad/reconstruir")
+async def reconstruir_actividad_endpoint(superuser: dict = Depends(get_superuser)):
+    """Reconstruir los rollups de actividad desde el historial (solo superusuario)"""
+    await reconstruir_actividad()
+    return {"message": "Actividad reconstruida", "reconstruido_en": actividad.reconstruido_en}
+
+# --- EXPORTACIONES ---
+# Columnas exportadas y columna de orden del cursor keyset por tabla
+EXPORTACIONES = {
+    "publicadores": (list(PublicadorResponse.model_fields), "created_at"),
+    "usuarios": (list(UsuarioResponse.model_fields) + ["created_at"], "created_at"),
+    "notificaciones": (list(NotificacionOut.model_fields), "fecha_creacion"),
+}
+
+@app.get("/export/{tabla}")
+async def exportar(
+    tabla: str,
+    formato: str = "csv",
+    current_user: dict = Depends(get_current_user)
+):
+    """Exportar una tabla completa en CSV o NDJSON, en streaming"""
+    if tabla not in EXPORTACIONES:
+        raise HTTPException(status_code=404, detail="Tabla no exportable")
+    if formato not in FORMATOS_EXPORTACION:
+        raise HTTPException(status_code=400, detail="Formato no válido (csv o ndjson)")
+    
+    # Mismos permisos que los endpoints de listado de cada tabla
+    rol = current_user["rol"]
+    superusuario = current_user.get("is_superuser")
+    permitido = {
+        "publicadores": rol in ["anciano", "siervo"] or superusuario,
+        "usuarios": superusuario,
+        "notificaciones": rol in ["anciano", "siervo", "publicador"] or superusuario,
+    }[tabla]
+    if not permitido:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"No tienes permiso para exportar {tabla}"
+        )
+    
+    columnas, columna_orden = EXPORTACIONES[tabla]
+    
+    async def filas():
+        try:
+            async for fila in db.iterar_keyset(tabla, columnas=",".join(columnas), columna_orden=columna_orden):
+                yield fila
+        except Exception as e:
+            # El status 200 ya se envió: se relanza para que el servidor aborte la conexión
+            # sin el chunk final y el cliente no tome el archivo truncado como completo
+            print(f"Error al exportar {tabla}: {str(e)}")
+            raise
+    
+    serializar = stream_csv if formato == "csv" else stream_ndjson
+    nombre = f"{tabla}_{datetime.utcnow().strftime('%Y%m%d')}.{formato}"
+    return StreamingResponse(
+        serializar(filas(), columnas),
+        media_type=FORMATOS_EXPORTACION[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+    )
+
 # Ruta de prueba
 @app.get("/")
 async def root():
@@ -0,0 +1,161 @@
+"""
+Mapa de calor por teselas (z/x/y) de marcaciones y ubicaciones.
+
+Los puntos de cada día se cargan una vez como arrays NumPy (ordenados por
+x Web Mercator) y para cada tesela se calcula un histograma parcial por
+día con np.bincount. Los parciales quedan en caché, así que un rango de
+90 días suma 90 grillas pequeñas en lugar de volver a leer filas. Los
+días pasados se guardan con un TTL largo y el día en curso con uno corto.
+"""
+import asyncio
+import base64
+import struct
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+from cache import TTLCache
+from geo import mercator_np
+
+# Canales de cada fuente: las marcaciones se binnean por tipo para poder ponderarlas
+CANALES = {
+    "marcaciones": ["predicacion", "revisita", "estudio"],
+    "ubicaciones": ["ubicaciones"],
+}
+
+
+class PuntosDia:
+    def __init__(self, filas, canales):
+        lats = np.array([float(f["latitud"]) for f in filas], dtype=np.float64)
+        lngs = np.array([float(f["longitud"]) for f in filas], dtype=np.float64)
+        canal = np.array(
+            [canales.index(f["tipo"]) if f.get("tipo") in canales else 0 for f in filas], dtype=np.int64
+        )
+        xs, ys = mercator_np(lats, lngs)
+        orden = np.argsort(xs, kind="stable")
+        self.xs, self.ys, self.canal = xs[orden], ys[orden], canal[orden]
+
+    def __len__(self):
+        return len(self.xs)
+
+
+class MapaCalor:
+    def __init__(self, cargar_dia, resolucion: int = 64, max_dias: int = 366, max_parciales: int = 50000,
+                 ttl_pasado: float = 86400.0, ttl_hoy: float = 60.0):
+        # cargar_dia(fuente, dia) -> lista de filas con latitud, longitud (y tipo en marcaciones)
+        self._cargar_dia = cargar_dia
+        self.resolucion = resolucion
+        self.ttl_pasado = ttl_pasado
+        self.ttl_hoy = ttl_hoy
+        # Entran los días del rango más largo de todas las fuentes juntas: si no, cada tesela
+        # expulsaría días que la siguiente necesita y los volvería a leer de la base
+        self.dias = TTLCache(maxsize=max_dias * len(CANALES), ttl=ttl_pasado)
+        self.parciales = TTLCache(maxsize=max_parciales, ttl=ttl_pasado)
+        # Versión por (fuente, día): editar una fila vieja deja obsoletas sus entradas en caché
+        self._versiones = {}
+        # Cargas en curso, para que las teselas pedidas en paralelo compartan la consulta
+        self._cargando = {}
+
+    def _ttl(self, dia: date) -> float:
+        return self.ttl_hoy if dia >= datetime.now(timezone.utc).date() else self.ttl_pasado
+
+    def invalidar_dia(self, fuente: str, dia: date):
+        self._versiones[(fuente, dia)] = self._versiones.get((fuente, dia), 0) + 1
+
+    async def _puntos(self, fuente: str, dia: date) -> PuntosDia:
+        clave = (fuente, dia, self._versiones.get((fuente, dia), 0))
+        puntos = self.dias.get(clave)
+        if puntos is not None:
+            return puntos
+        tarea = self._cargando.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._cargar(clave, fuente, dia))
+            self._cargando[clave] = tarea
+            tarea.add_done_callback(lambda _: self._cargando.pop(clave, None))
+        return await asyncio.shield(tarea)
+
+    async def _cargar(self, clave, fuente: str, dia: date) -> PuntosDia:
+        puntos = PuntosDia(await self._cargar_dia(fuente, dia), CANALES[fuente])
+        self.dias.set(clave, puntos, ttl=self._ttl(dia))
+        return puntos
+
+    async def _parcial(self, fuente: str, dia: date, z: int, x: int, y: int):
+        clave = (fuente, dia, self._versiones.get((fuente, dia), 0), z, x, y)
+        parcial = self.parciales.get(clave)
+        if parcial is not None:
+            return parcial
+        puntos = await self._puntos(fuente, dia)
+        n = 2 ** z
+        # Los puntos están ordenados por x: la franja de la tesela se obtiene con searchsorted
+        inicio, fin = np.searchsorted(puntos.xs, [x / n, (x + 1) / n])
+        xs, ys, canal = puntos.xs[inicio:fin], puntos.ys[inicio:fin], puntos.canal[inicio:fin]
+        dentro = (ys >= y / n) & (ys < (y + 1) / n)
+        r = self.resolucion
+        bx = ((xs[dentro] * n - x) * r).astype(np.int64).clip(0, r - 1)
+        by = ((ys[dentro] * n - y) * r).astype(np.int64).clip(0, r - 1)
+        canales = len(CANALES[fuente])
+        conteos = np.bincount((canal[dentro] * r + by) * r + bx, minlength=canales * r * r)
+        parcial = conteos.reshape(canales, r, r).astype(np.float32)
+        self.parciales.set(clave, parcial, ttl=self._ttl(dia))
+        return parcial
+
+    async def tesela(self, fuentes, z: int, x: int, y: int, desde: date, hasta: date, pesos=None):
+        """Grilla resolucion x resolucion con la suma ponderada de los parciales diarios.
+        `pesos` es {canal: peso}; los canales que no aparecen pesan 1."""
+        pesos = pesos or {}
+        dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+        total = np.zeros((self.resolucion, self.resolucion), dtype=np.float32)
+        for fuente in fuentes:
+            vector = np.array([pesos.get(c, 1.0) for c in CANALES[fuente]], dtype=np.float32)
+            parciales = await asyncio.gather(*(self._parcial(fuente, dia, z, x, y) for dia in dias))
+            for parcial in parciales:
+                total += np.tensordot(vector, parcial, axes=1)
+        return total
+
+    def metricas(self) -> dict:
+        return {"dias": self.dias.stats(), "parciales": self.parciales.stats()}
+
+
+# --- SERIALIZACIÓN ---
+def a_json(valores, z: int, x: int, y: int) -> dict:
+    """Grilla como float32 little-endian en base64 (fila 0 = borde norte de la tesela)"""
+    maximo = float(valores.max()) if valores.size else 0.0
+    return {
+        "z": z, "x": x, "y": y,
+        "resolucion": valores.shape[0],
+        "maximo": maximo,
+        "total": float(valores.sum()),
+        "valores": base64.b64encode(valores.astype("<f4").tobytes()).decode() if maximo > 0 else None,
+    }
+
+
+# Rampa de color: azul -> verde -> amarillo -> rojo
+_PARADAS = np.array([0.0, 0.33, 0.66, 1.0])
+_COLORES = np.array([[0, 0, 255], [0, 255, 0], [255, 255, 0], [255, 0, 0]], dtype=np.float64)
+
+
+def _chunk(tipo: bytes, datos: bytes) -> bytes:
+    return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos) & 0xFFFFFFFF)
+
+
+def a_png(valores, tamano: int = 256) -> bytes:
+    """PNG RGBA de la tesela (sin dependencias: zlib + struct). La intensidad usa raíz
+    cuadrada para que las zonas con poca actividad sigan siendo visibles."""
+    maximo = float(valores.max())
+    t = np.sqrt(valores / maximo) if maximo > 0 else np.zeros_like(valores)
+    rgba = np.zeros(valores.shape + (4,), dtype=np.uint8)
+    for canal in range(3):
+        rgba[..., canal] = np.interp(t, _PARADAS, _COLORES[:, canal]).astype(np.uint8)
+    rgba[..., 3] = (np.clip(t * 1.5, 0, 1) * 220).astype(np.uint8)
+    escala = max(1, tamano // valores.shape[0])
+    rgba = rgba.repeat(escala, axis=0).repeat(escala, axis=1)
+    alto, ancho = rgba.shape[:2]
+    # Cada fila va precedida del byte de filtro 0 (sin filtro)
+    crudo = np.hstack([np.zeros((alto, 1), dtype=np.uint8), rgba.reshape(alto, ancho * 4)]).tobytes()
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _chunk(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, 6, 0, 0, 0))
+        + _chunk(b"IDAT", zlib.compress(crudo, 6))
+        + _chunk(b"IEND", b"")
+    )
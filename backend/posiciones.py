@@ -0,0 +1,132 @@
+"""
+Última posición conocida de cada usuario, en memoria, con fan-out por
+viewport para el mapa en vivo.
+
+La ingesta GPS actualiza el store; cada cliente del mapa se suscribe con
+un bounding box y recibe solo los cambios dentro de él, agrupados y con
+una frecuencia máxima. Nunca hace falta consultar "la última fila por
+usuario_id" en la base de datos para dibujar el mapa.
+"""
+import asyncio
+import time
+
+
+def parsear_bbox(texto: str):
+    """'min_lng,min_lat,max_lng,max_lat' -> tupla de floats; lanza ValueError si no es válido"""
+    valores = [float(v) for v in texto.split(",")]
+    if len(valores) != 4:
+        raise ValueError("bbox debe tener 4 valores: min_lng,min_lat,max_lng,max_lat")
+    min_lng, min_lat, max_lng, max_lat = valores
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError("bbox con mínimos mayores que máximos")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def en_bbox(bbox, lat: float, lng: float) -> bool:
+    return bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3]
+
+
+class SuscriptorMapa:
+    def __init__(self, bbox, intervalo_min: float):
+        self.bbox = bbox
+        self.intervalo_min = intervalo_min
+        # Cambios pendientes por usuario: solo se envía el último de cada uno
+        self.pendientes = {}
+        self._hay_cambios = asyncio.Event()
+        self._ultimo_envio = 0.0
+
+    def registrar(self, usuario_id: str, cambio: dict):
+        self.pendientes[usuario_id] = cambio
+        self._hay_cambios.set()
+
+    async def siguientes(self, timeout: float):
+        """Esperar cambios y devolverlos respetando el intervalo mínimo entre envíos.
+        Devuelve una lista vacía si pasa `timeout` sin cambios (heartbeat)."""
+        if not self.pendientes:
+            self._hay_cambios.clear()
+            try:
+                await asyncio.wait_for(self._hay_cambios.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return []
+        espera = self._ultimo_envio + self.intervalo_min - time.monotonic()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        cambios = list(self.pendientes.values())
+        self.pendientes = {}
+        self._ultimo_envio = time.monotonic()
+        return cambios
+
+
+class PosicionesEnVivo:
+    def __init__(self, ttl_seg: float = 900, intervalo_min: float = 1.0, al_quitar=None):
+        self.ttl_seg = ttl_seg
+        self.intervalo_min = intervalo_min
+        # Callback opcional al_quitar(usuario_id) cuando una posición expira
+        self._al_quitar = al_quitar
+        # {usuario_id: dict con latitud, longitud, fecha (ISO en UTC), nombre, grupo, velocidad}
+        self._posiciones = {}
+        self._actualizado_en = {}
+        self._suscriptores = set()
+        self._expirado_en = time.monotonic()
+
+    def actualizar(self, usuario_id: str, posicion: dict) -> bool:
+        """Registrar la posición; devuelve False si es más vieja que la vigente"""
+        anterior = self._posiciones.get(usuario_id)
+        # Un lote que llega tarde no debe mover al usuario hacia atrás
+        if anterior and posicion["fecha"] < anterior["fecha"]:
+            return False
+        posicion = {**posicion, "usuario_id": usuario_id}
+        self._posiciones[usuario_id] = posicion
+        self._actualizado_en[usuario_id] = time.monotonic()
+        for suscriptor in self._suscriptores:
+            if en_bbox(suscriptor.bbox, posicion["latitud"], posicion["longitud"]):
+                suscriptor.registrar(usuario_id, {"tipo": "posicion", **posicion})
+            elif anterior and en_bbox(suscriptor.bbox, anterior["latitud"], anterior["longitud"]):
+                suscriptor.registrar(usuario_id, {"tipo": "salida", "usuario_id": usuario_id})
+        self._expirar_si_toca()
+        return True
+
+    def _expirar_si_toca(self):
+        if time.monotonic() - self._expirado_en > min(60.0, self.ttl_seg):
+            self.expirar()
+
+    def expirar(self):
+        """Quitar las posiciones sin actualizar en ttl_seg y avisar a los viewports afectados"""
+        self._expirado_en = time.monotonic()
+        limite = time.monotonic() - self.ttl_seg
+        for usuario_id in [u for u, t in self._actualizado_en.items() if t < limite]:
+            posicion = self._posiciones.pop(usuario_id)
+            del self._actualizado_en[usuario_id]
+            if self._al_quitar:
+                self._al_quitar(usuario_id)
+            for suscriptor in self._suscriptores:
+                if en_bbox(suscriptor.bbox, posicion["latitud"], posicion["longitud"]):
+                    suscriptor.registrar(usuario_id, {"tipo": "salida", "usuario_id": usuario_id})
+
+    def obtener(self, usuario_id: str):
+        return self._posiciones.get(usuario_id)
+
+    def todas(self):
+        self._expirar_si_toca()
+        return list(self._posiciones.values())
+
+    def en_viewport(self, bbox):
+        self._expirar_si_toca()
+        return [p for p in self._posiciones.values() if en_bbox(bbox, p["latitud"], p["longitud"])]
+
+    def suscribir(self, bbox) -> SuscriptorMapa:
+        suscriptor = SuscriptorMapa(bbox, self.intervalo_min)
+        self._suscriptores.add(suscriptor)
+        return suscriptor
+
+    def mover_viewport(self, suscriptor: SuscriptorMapa, bbox):
+        """Cambiar el viewport; devuelve las posiciones dentro del nuevo bbox"""
+        suscriptor.bbox = bbox
+        suscriptor.pendientes = {}
+        return self.en_viewport(bbox)
+
+    def desuscribir(self, suscriptor: SuscriptorMapa):
+        self._suscriptores.discard(suscriptor)
+
+    def metricas(self) -> dict:
+        return {"posiciones": len(self._posiciones), "suscriptores": len(self._suscriptores)}
@@ -0,0 +1,176 @@
+"""
+Compactación de ubicaciones: los fixes crudos de cada usuario y día se
+convierten en una fila de `recorridos` con la polilínea codificada
+(algoritmo de Google, precisión 1e-5 ≈ 1 m), los tiempos como deltas en
+segundos con la misma codificación y un resumen (puntos, distancia,
+duración). Después se borran las filas crudas de ese día.
+
+Un día con 8 h de fixes pasa de miles de filas anchas a unos pocos KB de
+texto en una sola fila.
+"""
+from datetime import date, datetime, time as hora, timedelta, timezone
+
+from db import parsear_fecha
+from geo import haversine_m
+
+PRECISION_POLYLINE = 1e5
+
+
+# --- CODIFICACIÓN (Google Encoded Polyline) ---
+def _codificar_valor(valor: int, salida: list):
+    valor = ~(valor << 1) if valor < 0 else valor << 1
+    while valor >= 0x20:
+        salida.append(chr((0x20 | (valor & 0x1F)) + 63))
+        valor >>= 5
+    salida.append(chr(valor + 63))
+
+
+def _decodificar_valores(texto: str):
+    valores, actual, desplazamiento = [], 0, 0
+    for caracter in texto:
+        b = ord(caracter) - 63
+        actual |= (b & 0x1F) << desplazamiento
+        desplazamiento += 5
+        if b < 0x20:
+            valores.append(~(actual >> 1) if actual & 1 else actual >> 1)
+            actual, desplazamiento = 0, 0
+    return valores
+
+
+def codificar_enteros(valores) -> str:
+    """Lista de enteros como deltas codificados"""
+    salida, anterior = [], 0
+    for valor in valores:
+        _codificar_valor(valor - anterior, salida)
+        anterior = valor
+    return "".join(salida)
+
+
+def decodificar_enteros(texto: str):
+    resultado, acumulado = [], 0
+    for delta in _decodificar_valores(texto):
+        acumulado += delta
+        resultado.append(acumulado)
+    return resultado
+
+
+def codificar_polyline(puntos) -> str:
+    """[(lat, lng), ...] -> polilínea codificada"""
+    salida, lat_anterior, lng_anterior = [], 0, 0
+    for lat, lng in puntos:
+        lat_e, lng_e = round(lat * PRECISION_POLYLINE), round(lng * PRECISION_POLYLINE)
+        _codificar_valor(lat_e - lat_anterior, salida)
+        _codificar_valor(lng_e - lng_anterior, salida)
+        lat_anterior, lng_anterior = lat_e, lng_e
+    return "".join(salida)
+
+
+def decodificar_polyline(texto: str):
+    valores = _decodificar_valores(texto)
+    puntos, lat, lng = [], 0, 0
+    for i in range(0, len(valores) - 1, 2):
+        lat += valores[i]
+        lng += valores[i + 1]
+        puntos.append((lat / PRECISION_POLYLINE, lng / PRECISION_POLYLINE))
+    return puntos
+
+
+# --- RECORRIDOS ---
+def construir_recorrido(usuario_id: str, dia: date, fixes) -> dict:
+    """fixes: [(datetime, lat, lng), ...] del mismo día -> fila de recorridos"""
+    fixes = sorted(fixes)
+    inicio = fixes[0][0]
+    distancia = sum(
+        haversine_m(a[1], a[2], b[1], b[2]) for a, b in zip(fixes, fixes[1:])
+    )
+    return {
+        "usuario_id": usuario_id,
+        "fecha": dia.isoformat(),
+        "polyline": codificar_polyline([(lat, lng) for _, lat, lng in fixes]),
+        "tiempos": codificar_enteros([round((f[0] - inicio).total_seconds()) for f in fixes]),
+        "num_puntos": len(fixes),
+        "distancia_m": round(distancia, 1),
+        "duracion_seg": round((fixes[-1][0] - inicio).total_seconds()),
+        "inicio": inicio.isoformat(),
+        "fin": fixes[-1][0].isoformat(),
+    }
+
+
+def expandir_recorrido(recorrido: dict):
+    """Fila de recorridos -> [(datetime, lat, lng), ...]"""
+    inicio = parsear_fecha(recorrido["inicio"])
+    puntos = decodificar_polyline(recorrido["polyline"])
+    segundos = decodificar_enteros(recorrido["tiempos"])
+    return [(inicio + timedelta(seconds=s), lat, lng) for s, (lat, lng) in zip(segundos, puntos)]
+
+
+def _nuevos(existentes, fixes):
+    """Fixes crudos que no están ya en el recorrido guardado. Los puntos del recorrido
+    quedaron redondeados (1e-5 grados y segundos enteros), así que se comparan con
+    esa precisión y una tolerancia de un segundo."""
+    tiempos = {}
+    for fecha, lat, lng in existentes:
+        clave = (round(lat * PRECISION_POLYLINE), round(lng * PRECISION_POLYLINE))
+        tiempos.setdefault(clave, []).append(fecha.timestamp())
+    nuevos = []
+    for fix in fixes:
+        clave = (round(fix[1] * PRECISION_POLYLINE), round(fix[2] * PRECISION_POLYLINE))
+        t = fix[0].timestamp()
+        if not any(abs(t - otro) <= 1 for otro in tiempos.get(clave, ())):
+            nuevos.append(fix)
+    return nuevos
+
+
+def _limites_dia(dia: date):
+    inicio = datetime.combine(dia, hora.min, tzinfo=timezone.utc)
+    return inicio.isoformat(), (inicio + timedelta(days=1)).isoformat()
+
+
+async def compactar_dia(db, dia: date, borrar: bool = True) -> dict:
+    """Compactar los fixes crudos de un día (UTC). Si el usuario ya tenía recorrido ese
+    día (fixes que llegaron tarde), se fusionan los puntos sin repetir los que ya tenía,
+    así que volver a compactar el mismo día (sin borrar o tras un fallo) no cambia nada."""
+    desde, hasta = _limites_dia(dia)
+    por_usuario, ids = {}, []
+    filas = db.iterar_keyset(
+        "ubicaciones", columnas="usuario_id,latitud,longitud",
+        filtros=lambda q: q.gte("created_at", desde).lt("created_at", hasta)
+    )
+    async for fila in filas:
+        ids.append(fila["id"])
+        por_usuario.setdefault(fila["usuario_id"], []).append(
+            (parsear_fecha(fila["created_at"]), float(fila["latitud"]), float(fila["longitud"]))
+        )
+    if not ids:
+        return {"fecha": dia.isoformat(), "usuarios": 0, "fixes": 0}
+
+    existentes = await db.table("recorridos").select("*").eq("fecha", dia.isoformat()).in_(
+        "usuario_id", list(por_usuario)
+    ).execute()
+    for recorrido in existentes.data:
+        anteriores = expandir_recorrido(recorrido)
+        usuario_id = recorrido["usuario_id"]
+        por_usuario[usuario_id] = anteriores + _nuevos(anteriores, por_usuario[usuario_id])
+
+    recorridos = [construir_recorrido(u, dia, fixes) for u, fixes in por_usuario.items()]
+    await db.table("recorridos").upsert(recorridos, on_conflict="usuario_id,fecha").execute()
+    if borrar:
+        # Se borran por id solo las filas leídas: un fix que llegó durante la compactación se conserva
+        for i in range(0, len(ids), 200):
+            await db.table("ubicaciones").delete().in_("id", ids[i:i + 200]).execute()
+    return {"fecha": dia.isoformat(), "usuarios": len(recorridos), "fixes": len(ids)}
+
+
+async def compactar(db, hasta: date, borrar: bool = True):
+    """Compactar todos los días anteriores a `hasta` que aún tengan fixes crudos"""
+    primera = await db.table("ubicaciones").select("created_at").order("created_at").limit(1).execute()
+    if not primera.data:
+        return []
+    dia = parsear_fecha(primera.data[0]["created_at"]).astimezone(timezone.utc).date()
+    resultados = []
+    while dia < hasta:
+        resultado = await compactar_dia(db, dia, borrar)
+        if resultado["fixes"]:
+            resultados.append(resultado)
+        dia += timedelta(days=1)
+    return resultados
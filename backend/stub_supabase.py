@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita los endpoints de Supabase usados por el backend
+(Auth y un PostgREST en memoria), para correr los benchmarks sin depender
+de un proyecto real.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from jose import jwt
+
+JWT_SECRET = "secreto-de-prueba-para-benchmarks"
+# Clave con formato JWT para que create_client la acepte
+SERVICE_KEY = jwt.encode({"role": "service_role"}, JWT_SECRET, algorithm="HS256")
+
+
+def crear_token(url: str, user_id: str, segundos: int = 3600) -> str:
+    """Crear un access token con los mismos claims que emite Supabase Auth"""
+    ahora = int(time.time())
+    return jwt.encode(
+        {
+            "sub": user_id,
+            "aud": "authenticated",
+            "iss": f"{url}/auth/v1",
+            "role": "authenticated",
+            "iat": ahora,
+            "exp": ahora + segundos,
+        },
+        JWT_SECRET,
+        algorithm="HS256",
+    )
+
+
+# --- PostgREST en memoria ---
+tablas = {}
+_lock_tablas = threading.Lock()
+
+
+def _convertir(texto: str):
+    if texto == "null":
+        return None
+    if texto in ("true", "false"):
+        return texto == "true"
+    return texto
+
+
+def _comparable(a, b):
+    """Comparar números como números y el resto como texto"""
+    if isinstance(a, bool) or isinstance(b, bool) or a is None or b is None:
+        return a, b
+    try:
+        return float(a), float(b)
+    except (TypeError, ValueError):
+        return str(a), str(b)
+
+
+def _cumple(fila: dict, columna: str, operador: str, valor: str) -> bool:
+    actual = fila.get(columna)
+    if operador == "in":
+        opciones = [v.strip('"') for v in re.findall(r'"[^"]*"|[^,()]+', valor)]
+        return str(actual) in opciones
+    esperado = _convertir(valor)
+    if operador == "is":
+        return actual is esperado
+    if operador == "eq":
+        return _comparable(actual, esperado)[0] == _comparable(actual, esperado)[1]
+    if operador == "neq":
+        return _comparable(actual, esperado)[0] != _comparable(actual, esperado)[1]
+    if operador == "like":
+        patron = "^" + re.escape(valor).replace("\\*", ".*").replace("%", ".*") + "$"
+        return actual is not None and re.match(patron, str(actual)) is not None
+    if actual is None:
+        return False
+    a, b = _comparable(actual, esperado)
+    return {"gt": a > b, "gte": a >= b, "lt": a < b, "lte": a <= b}[operador]
+
+
+def _dividir(texto: str):
+    """Dividir por comas de primer nivel"""
+    partes, nivel, actual = [], 0, ""
+    for c in texto:
+        if c == "," and nivel == 0:
+            partes.append(actual)
+            actual = ""
+            continue
+        nivel += c == "("
+        nivel -= c == ")"
+        actual += c
+    partes.append(actual)
+    return partes
+
+
+def _cumple_logico(fila: dict, expresion: str, conector) -> bool:
+    resultados = []
+    for parte in _dividir(expresion):
+        if parte.startswith("and("):
+            resultados.append(_cumple_logico(fila, parte[4:-1], all))
+        elif parte.startswith("or("):
+            resultados.append(_cumple_logico(fila, parte[3:-1], any))
+        else:
+            columna, operador, valor = parte.split(".", 2)
+            resultados.append(_cumple(fila, columna, operador, valor))
+    return conector(resultados)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latencia = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _responder(self, codigo: int, cuerpo, headers: dict = None):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        for nombre, valor in (headers or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _leer_cuerpo(self):
+        longitud = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(longitud) or b"null")
+
+    def _consulta(self):
+        partes = urlsplit(self.path)
+        tabla = partes.path[len("/rest/v1/"):]
+        return tabla, parse_qsl(partes.query, keep_blank_values=True)
+
+    def _filtrar(self, filas, params):
+        for columna, valor in params:
+            if columna in ("select", "order", "limit", "on_conflict"):
+                continue
+            if columna == "or":
+                filas = [f for f in filas if _cumple_logico(f, valor[1:-1], any)]
+            else:
+                operador, valor = valor.split(".", 1)
+                filas = [f for f in filas if _cumple(f, columna, operador, valor)]
+        return filas
+
+    def _rest(self, metodo: str):
+        tabla, params = self._consulta()
+        parametros = dict(params)
+        prefer = self.headers.get("Prefer", "")
+        # Consumir siempre el cuerpo para no corromper la conexión keep-alive
+        cuerpo = self._leer_cuerpo()
+        with _lock_tablas:
+            filas = tablas.setdefault(tabla, [])
+            if metodo == "POST":
+                nuevas = cuerpo if isinstance(cuerpo, list) else [cuerpo]
+                ahora = datetime.now(timezone.utc).isoformat()
+                insertadas = []
+                conflicto = parametros.get("on_conflict")
+                for nueva in nuevas:
+                    fila = {"id": str(uuid.uuid4()), "created_at": ahora, "updated_at": ahora,
+                            "fecha_creacion": ahora, **nueva}
+                    if conflicto:
+                        claves = conflicto.split(",")
+                        existente = next((f for f in filas if all(f.get(c) == fila.get(c) for c in claves)), None)
+                        if existente is not None:
+                            if "merge-duplicates" in prefer:
+                                existente.update(nueva)
+                                insertadas.append(existente)
+                            continue
+                    filas.append(fila)
+                    insertadas.append(fila)
+                return self._responder(201, insertadas if "return=representation" in prefer else [])
+
+            seleccion = self._filtrar(filas, params)
+            if metodo == "PATCH":
+                for fila in seleccion:
+                    fila.update(cuerpo)
+                return self._responder(200, seleccion)
+            if metodo == "DELETE":
+                tablas[tabla] = [f for f in filas if f not in seleccion]
+                return self._responder(200, seleccion)
+
+            for orden in reversed(parametros.get("order", "").split(",") if "order" in parametros else []):
+                columna, _, direccion = orden.partition(".")
+                seleccion = sorted(seleccion, key=lambda f: str(f.get(columna) or ""), reverse=direccion == "desc")
+            total = len(seleccion)
+            if "limit" in parametros:
+                seleccion = seleccion[:int(parametros["limit"])]
+            columnas = parametros.get("select", "*")
+            if columnas != "*":
+                nombres = [c.strip() for c in columnas.split(",")]
+                seleccion = [{c: f.get(c) for c in nombres} for f in seleccion]
+            headers = {"Content-Range": f"0-{max(len(seleccion) - 1, 0)}/{total}"} if "count=" in prefer else {}
+            return self._responder(200, seleccion, headers)
+
+    def do_GET(self):
+        time.sleep(self.latencia)
+        if self.path.startswith("/rest/v1/"):
+            return self._rest("GET")
+        if self.path.startswith("/auth/v1/user"):
+            token = self.headers.get("Authorization", "").replace("Bearer ", "")
+            try:
+                claims = jwt.decode(token, JWT_SECRET, algorithms=["HS256"], audience="authenticated")
+            except Exception:
+                return self._responder(401, {"message": "invalid JWT"})
+            return self._responder(200, {
+                "id": claims["sub"],
+                "aud": "authenticated",
+                "role": "authenticated",
+                "email": f"{claims['sub']}@example.com",
+                "app_metadata": {},
+                "user_metadata": {},
+                "created_at": "2024-01-01T00:00:00Z",
+            })
+        if self.path.startswith("/auth/v1/.well-known/jwks.json"):
+            return self._responder(200, {"keys": []})
+        self._responder(404, {"message": "not found"})
+
+    def do_POST(self):
+        time.sleep(self.latencia)
+        self._rest("POST")
+
+    def do_PATCH(self):
+        time.sleep(self.latencia)
+        self._rest("PATCH")
+
+    def do_DELETE(self):
+        time.sleep(self.latencia)
+        self._rest("DELETE")
+
+
+def iniciar_stub(latencia: float = 0.0, handler=StubHandler):
+    """Levantar el stub en un puerto libre; devuelve (servidor, url)"""
+    clase = type("Handler", (handler,), {"latencia": latencia})
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), clase)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, puerto = servidor.server_address
+    return servidor, f"http://{host}:{puerto}"
@@ -0,0 +1,120 @@
+"""
+Índice espacial en memoria de los territorios activos.
+
+Cada territorio se registra en las celdas de una grilla regular que toca
+su bounding box; para ubicar un punto solo se prueban (con ray casting)
+los territorios de su celda cuyo bbox lo contiene. El índice se mantiene
+incrementalmente al crear o editar territorios y se reconstruye completo
+solo al arrancar.
+"""
+import json
+import math
+import time
+
+import numpy as np
+
+from geo import bbox_poligonos, poligonos_geojson, punto_en_poligonos, puntos_en_poligonos
+
+
+class IndiceTerritorios:
+    def __init__(self, celda_grados: float = 0.01):
+        self.celda_grados = celda_grados
+        # {territorio_id: (bbox, poligonos)}
+        self._territorios = {}
+        # {(columna, fila): set de territorio_id}
+        self._celdas = {}
+        self.lista = False
+        self.reconstruido_en = None
+
+    def _celda(self, lat: float, lng: float):
+        return math.floor(lng / self.celda_grados), math.floor(lat / self.celda_grados)
+
+    def _celdas_bbox(self, bbox):
+        min_col, min_fila = self._celda(bbox[1], bbox[0])
+        max_col, max_fila = self._celda(bbox[3], bbox[2])
+        for columna in range(min_col, max_col + 1):
+            for fila in range(min_fila, max_fila + 1):
+                yield columna, fila
+
+    def actualizar(self, territorio: dict):
+        """Registrar o reemplazar un territorio; los que no están activos salen del índice"""
+        self.quitar(territorio["id"])
+        if territorio.get("estado", "activo") != "activo":
+            return
+        try:
+            poligonos = poligonos_geojson(territorio["geojson_data"])
+            bbox = bbox_poligonos(poligonos)
+        except (ValueError, json.JSONDecodeError) as e:
+            print(f"Territorio {territorio['id']} con GeoJSON no válido: {str(e)}")
+            return
+        self._territorios[territorio["id"]] = (bbox, poligonos)
+        for celda in self._celdas_bbox(bbox):
+            self._celdas.setdefault(celda, set()).add(territorio["id"])
+
+    def quitar(self, territorio_id: str):
+        anterior = self._territorios.pop(territorio_id, None)
+        if anterior is None:
+            return
+        for celda in self._celdas_bbox(anterior[0]):
+            ids = self._celdas.get(celda)
+            if ids is not None:
+                ids.discard(territorio_id)
+                if not ids:
+                    del self._celdas[celda]
+
+    def reconstruir(self, territorios):
+        """Reemplazar el índice completo con la lista de territorios"""
+        nuevo = IndiceTerritorios(self.celda_grados)
+        for fila in territorios:
+            nuevo.actualizar(fila)
+        self._territorios = nuevo._territorios
+        self._celdas = nuevo._celdas
+        self.lista = True
+        self.reconstruido_en = time.time()
+
+    def contiene(self, territorio_id: str) -> bool:
+        return territorio_id in self._territorios
+
+    def _ordenar(self, ids):
+        # Si hay territorios superpuestos gana el más pequeño (el más específico)
+        def area_bbox(territorio_id):
+            b = self._territorios[territorio_id][0]
+            return (b[2] - b[0]) * (b[3] - b[1]), territorio_id
+        return sorted(ids, key=area_bbox)
+
+    def resolver(self, lat: float, lng: float):
+        """territorio_id que contiene el punto, o None"""
+        for territorio_id in self._ordenar(self._celdas.get(self._celda(lat, lng), ())):
+            bbox, poligonos = self._territorios[territorio_id]
+            if bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3] and punto_en_poligonos(lat, lng, poligonos):
+                return territorio_id
+        return None
+
+    def resolver_lote(self, lats, lngs):
+        """territorio_id (o None) de cada punto, evaluando cada territorio candidato
+        sobre todos sus puntos a la vez"""
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        resultado = [None] * len(lats)
+        if not len(lats):
+            return resultado
+        columnas = np.floor(lngs / self.celda_grados).astype(np.int64)
+        filas = np.floor(lats / self.celda_grados).astype(np.int64)
+        candidatos = set()
+        for celda in set(zip(columnas.tolist(), filas.tolist())):
+            candidatos.update(self._celdas.get(celda, ()))
+        pendientes = np.ones(len(lats), dtype=bool)
+        for territorio_id in self._ordenar(candidatos):
+            bbox, poligonos = self._territorios[territorio_id]
+            mascara = pendientes & (lngs >= bbox[0]) & (lngs <= bbox[2]) & (lats >= bbox[1]) & (lats <= bbox[3])
+            indices = np.flatnonzero(mascara)
+            if not len(indices):
+                continue
+            dentro = indices[puntos_en_poligonos(lats[indices], lngs[indices], poligonos)]
+            for i in dentro.tolist():
+                resultado[i] = territorio_id
+            pendientes[dentro] = False
+        return resultado
+
+    def metricas(self) -> dict:
+        return {"territorios": len(self._territorios), "celdas": len(self._celdas), "lista": self.lista}
@@ -0,0 +1,68 @@
+"""
+Caché de marcaciones por tesela geohash para las consultas por viewport.
+
+Cada marcación guarda su geohash (columna indexada), así que una tesela
+se carga con un `like 'prefijo%'`. Las teselas cargadas quedan en un LRU
+y se invalidan una a una cuando se crea o edita una marcación dentro de
+ellas; al desplazar el mapa casi todas las teselas salen de memoria.
+"""
+import asyncio
+
+from cache import TTLCache
+from geo import geohash, geohashes_bbox
+from posiciones import en_bbox
+
+PRECISION_GEOHASH = 8
+
+
+class CacheTeselas:
+    def __init__(self, cargar, precision: int = 6, maxsize: int = 2048, ttl: float = 600.0,
+                 max_teselas: int = 100):
+        # cargar(prefijo) -> lista de marcaciones de la tesela
+        self._cargar = cargar
+        self.precision = precision
+        self.max_teselas = max_teselas
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # {tesela: [cargas en curso, versión]}: una carga que se cruzó con una escritura no se
+        # guarda. Solo hay entradas mientras la tesela se está cargando, así que el tamaño queda
+        # acotado por las cargas simultáneas y no por las teselas que alguna vez se escribieron.
+        self._cargando = {}
+
+    def tesela(self, lat: float, lng: float) -> str:
+        return geohash(lat, lng, self.precision)
+
+    async def _tesela(self, clave: str):
+        filas = self.cache.get(clave)
+        if filas is None:
+            estado = self._cargando.setdefault(clave, [0, 0])
+            estado[0] += 1
+            version = estado[1]
+            try:
+                filas = await self._cargar(clave)
+            finally:
+                estado[0] -= 1
+                vigente = estado[1] == version
+                if estado[0] == 0:
+                    del self._cargando[clave]
+            if vigente:
+                self.cache.set(clave, filas)
+        return filas
+
+    async def en_bbox(self, bbox):
+        """Marcaciones dentro del bbox; lanza ValueError si el bbox cubre demasiadas teselas"""
+        claves = geohashes_bbox(bbox, self.precision, self.max_teselas)
+        teselas = await asyncio.gather(*(self._tesela(clave) for clave in claves))
+        return [
+            fila for filas in teselas for fila in filas
+            if en_bbox(bbox, float(fila["latitud"]), float(fila["longitud"]))
+        ]
+
+    def invalidar(self, lat: float, lng: float):
+        clave = self.tesela(lat, lng)
+        estado = self._cargando.get(clave)
+        if estado is not None:
+            estado[1] += 1
+        self.cache.invalidate(clave)
+
+    def metricas(self) -> dict:
+        return {**self.cache.stats(), "cargas_en_curso": len(self._cargando)}
@@ -0,0 +1,57 @@
+"""
+Fixtures comunes: la API se levanta contra el stub local de Supabase
+(stub_supabase.py), sin depender de un proyecto real.
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import stub_supabase  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def stub():
+    _, url = stub_supabase.iniciar_stub()
+    os.environ.update(
+        SUPABASE_URL=url,
+        SUPABASE_ANON_KEY=stub_supabase.SERVICE_KEY,
+        SUPABASE_SERVICE_KEY=stub_supabase.SERVICE_KEY,
+        SUPABASE_JWT_SECRET=stub_supabase.JWT_SECRET,
+    )
+    return url
+
+
+@pytest.fixture
+def tablas(stub):
+    stub_supabase.tablas.clear()
+    return stub_supabase.tablas
+
+
+@pytest.fixture(scope="session")
+def main(stub):
+    import main as modulo
+    return modulo
+
+
+@pytest.fixture
+def superusuario(stub, tablas):
+    """Headers de un anciano superusuario registrado en la tabla usuarios"""
+    usuario_id = str(uuid.uuid4())
+    tablas["usuarios"] = [{
+        "id": usuario_id, "email": "admin@ejemplo.com", "nombre": "Admin",
+        "rol": "anciano", "is_superuser": True, "grupo_asignado": 1,
+    }]
+    return {"Authorization": "Bearer " + stub_supabase.crear_token(stub, usuario_id)}
+
+
+@pytest.fixture(scope="session")
+def cliente(main):
+    # Una sola instancia para toda la sesión: el shutdown cierra el pool de conexiones
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as cliente:
+        yield cliente
@@ -0,0 +1,44 @@
+def _esperar_reconstruccion_inicial(main, cliente):
+    async def esperar():
+        await main.app.state.tarea_actividad
+    cliente.portal.call(esperar)
+
+
+def test_alta_e_importacion_cuentan_una_vez_por_publicador(main, cliente, tablas, superusuario):
+    tablas["publicadores"] = []
+    tablas["notificaciones"] = []
+    _esperar_reconstruccion_inicial(main, cliente)
+    main.actividad._dias.clear()
+    fila = {"nombre": "Ana", "numero": "1", "grupo": 1, "precursor": False, "animo": True}
+
+    assert cliente.post("/publicadores", json=fila, headers=superusuario).status_code == 200
+    cuerpo = '{"nombre": "Luis", "numero": "2", "grupo": 1, "precursor": false, "animo": true}\n'
+    respuesta = cliente.post("/publicadores/import?formato=ndjson", content=cuerpo.encode(), headers=superusuario)
+    assert respuesta.json()["insertados"] == 1
+
+    serie = cliente.get("/actividad?dias=1", headers=superusuario).json()
+    assert serie["total"] == [2]
+    assert serie["series"] == {"alta_publicador": [2]}
+
+
+def test_reconstruir_conserva_eventos_registrados_durante_la_lectura():
+    import asyncio
+    from datetime import datetime, timedelta, timezone
+
+    from actividad import RollupActividad
+
+    rollup = RollupActividad()
+    ayer = datetime.now(timezone.utc) - timedelta(days=1)
+
+    async def historial():
+        yield "rol_cambiado", ayer
+        # Dos eventos llegan mientras se lee el historial: la fila del primero ya aparece en
+        # la lectura (no debe contarse dos veces) y la del segundo todavía no
+        rollup.registrar("rol_cambiado")
+        rollup.registrar("rol_cambiado")
+        await asyncio.sleep(0)
+        yield "rol_cambiado", datetime.now(timezone.utc)
+
+    asyncio.run(rollup.reconstruir(historial()))
+    serie = rollup.serie(ayer.date(), datetime.now(timezone.utc).date())
+    assert serie["series"] == {"rol_cambiado": [1, 2]}
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from auth_jwt import VerificadorJWT
+
+URL = "http://supabase.test"
+
+
+def _token_rs256(clave_privada, kid):
+    ahora = int(time.time())
+    claims = {"sub": "u1", "aud": "authenticated", "iss": f"{URL}/auth/v1", "iat": ahora, "exp": ahora + 60}
+    return jwt.encode(claims, clave_privada, algorithm="RS256", headers={"kid": kid})
+
+
+def test_jwks_se_descarga_una_vez_con_verificaciones_concurrentes():
+    privada = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem_privada = privada.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    pem_publica = privada.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    publica = jwk.construct(pem_publica, "RS256").to_dict()
+    publica["kid"] = "k1"
+    descargas = []
+
+    async def responder(request):
+        descargas.append(request.url)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"keys": [publica]})
+
+    async def correr():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(responder)) as http:
+            verificador = VerificadorJWT(URL, http=http)
+            token = _token_rs256(pem_privada, "k1")
+            return await asyncio.gather(*(verificador.verificar(token) for _ in range(5)))
+
+    resultados = asyncio.run(correr())
+    assert [c["sub"] for c in resultados] == ["u1"] * 5
+    assert len(descargas) == 1
+
+
+def test_sin_jwt_secret_los_tokens_hs256_se_verifican_con_supabase_auth(main, cliente, superusuario, monkeypatch):
+    monkeypatch.setattr(main.verificador_jwt, "jwt_secret", None)
+    monkeypatch.setattr(main, "AUTH_FALLBACK_REMOTO", False)
+    main.perfil_cache.clear()
+    assert cliente.get("/admin/users", headers=superusuario).status_code == 200
@@ -0,0 +1,20 @@
+import time
+
+
+def _ubicar(main, usuario_id, lat, lng):
+    main.posiciones.actualizar(usuario_id, {
+        "nombre": usuario_id, "grupo": 1, "latitud": lat, "longitud": lng, "fecha": "2026-01-01T00:00:00+00:00",
+    })
+    main.indice_cercanos.actualizar(usuario_id, lat, lng, 1)
+
+
+def test_posicion_vencida_no_aparece_en_cercanos(main, cliente, superusuario):
+    _ubicar(main, "activo", -34.6001, -58.4)
+    _ubicar(main, "desconectado", -34.6, -58.4)
+    # La última posición del segundo usuario tiene más de POSICIONES_TTL_SEG
+    main.posiciones._actualizado_en["desconectado"] = time.monotonic() - main.POSICIONES_TTL_SEG - 1
+
+    respuesta = cliente.get("/mapa/cercanos?lat=-34.6&lng=-58.4&k=5", headers=superusuario)
+    assert respuesta.status_code == 200
+    assert [p["usuario_id"] for p in respuesta.json()] == ["activo"]
+    assert main.posiciones.obtener("desconectado") is None
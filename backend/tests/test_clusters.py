@@ -0,0 +1,51 @@
+from clusters import ClustersMarcaciones
+
+TIPOS = ["predicacion", "revisita"]
+
+
+def _clusters(puntos):
+    clusters = ClustersMarcaciones(TIPOS, zoom_max=16)
+    for i, (lat, lng, tipo) in enumerate(puntos):
+        clusters.agregar({"id": f"m{i}", "latitud": lat, "longitud": lng, "tipo": tipo})
+    return clusters
+
+
+def test_zoom_expansion_es_el_primero_en_que_el_cluster_se_divide():
+    clusters = _clusters([(-34.6, -58.4, "predicacion"), (-34.601, -58.401, "revisita"), (-31.4, -64.2, "predicacion")])
+    mundo = (-180, -85, 180, 85)
+    juntas = next(c for c in clusters.consultar(mundo, 3) if c["cluster"])
+    assert juntas["total"] == 2 and juntas["por_tipo"] == {"predicacion": 1, "revisita": 1}
+
+    zoom = juntas["zoom_expansion"]
+    assert zoom is not None and 3 < zoom <= 16
+    antes = clusters.consultar((-58.5, -34.7, -58.3, -34.5), zoom - 1)
+    assert [c["total"] for c in antes] == [2]
+    despues = clusters.consultar((-58.5, -34.7, -58.3, -34.5), zoom)
+    assert sorted(c["id"] for c in despues) == ["m0", "m1"]
+    assert all(not c["cluster"] for c in despues)
+
+
+def test_puntos_en_el_mismo_lugar_no_se_expanden():
+    clusters = _clusters([(-34.6, -58.4, "predicacion")] * 3)
+    (cluster,) = clusters.consultar((-180, -85, 180, 85), 16)
+    assert cluster["total"] == 3 and cluster["zoom_expansion"] is None
+
+
+def test_bbox_chico_y_grande_devuelven_cada_celda_una_vez():
+    puntos = [(-34.6 + i * 0.01, -58.4 + j * 0.01, "predicacion") for i in range(5) for j in range(5)]
+    clusters = _clusters(puntos)
+    for zoom in (8, 12, 16):
+        # En zoom 8 el bbox ajustado recorre sus celdas; en el resto se filtran las celdas ocupadas
+        ajustado = clusters.consultar((-58.45, -34.65, -58.3, -34.5), zoom)
+        mundo = clusters.consultar((-180, -85, 180, 85), zoom)
+        ids = [c["id"] for c in ajustado]
+        assert len(ids) == len(set(ids))
+        assert sorted(ids) == sorted(c["id"] for c in mundo)
+        assert sum(c.get("total", 1) for c in ajustado) == len(puntos)
+
+
+def test_quitar_actualiza_todos_los_niveles():
+    clusters = _clusters([(-34.6, -58.4, "predicacion"), (-34.6001, -58.4001, "revisita")])
+    clusters.quitar("m1")
+    for zoom in (0, 8, 16):
+        assert [(c["cluster"], c["id"]) for c in clusters.consultar((-180, -85, 180, 85), zoom)] == [(False, "m0")]
@@ -0,0 +1,38 @@
+from cobertura import MotorCobertura
+
+# Cuadrado de ~111 x ~91 m cerca de -34.6
+TERRITORIO = {
+    "id": "t1",
+    "geojson_data": {"type": "Polygon", "coordinates": [[
+        [-58.4, -34.6], [-58.399, -34.6], [-58.399, -34.599], [-58.4, -34.599], [-58.4, -34.6],
+    ]]},
+}
+
+
+def test_porcentaje_cuenta_cada_celda_una_vez():
+    motor = MotorCobertura(celda_m=25)
+    assert motor.preparar(TERRITORIO)
+    inicial = motor.porcentaje("t1")
+    assert inicial["cubiertas"] == 0 and inicial["porcentaje"] == 0.0 and inicial["celdas"] > 0
+
+    marcacion = {"territorio_id": "t1", "latitud": -34.5995, "longitud": -58.3995}
+    assert motor.marcar(marcacion)
+    assert not motor.marcar(marcacion)  # La misma celda no suma dos veces
+    assert not motor.marcar({**marcacion, "latitud": -34.5})  # Fuera del territorio
+    assert not motor.marcar({**marcacion, "territorio_id": "otro"})
+
+    resultado = motor.porcentaje("t1")
+    assert resultado["cubiertas"] == 1
+    assert resultado["porcentaje"] == round(100 / resultado["celdas"], 1)
+    assert motor.porcentaje("otro") is None
+
+
+def test_geojson_sin_cambios_conserva_lo_cubierto():
+    motor = MotorCobertura(celda_m=25)
+    motor.preparar(TERRITORIO)
+    motor.marcar({"territorio_id": "t1", "latitud": -34.5995, "longitud": -58.3995})
+    assert not motor.preparar(dict(TERRITORIO))
+    assert motor.porcentaje("t1")["cubiertas"] == 1
+
+    motor.preparar({**TERRITORIO, "estado": "inactivo"})
+    assert motor.porcentaje("t1") is None
@@ -0,0 +1,27 @@
+def _listar(cliente, headers, etag=None):
+    extra = {"If-None-Match": etag} if etag else {}
+    return cliente.get("/publicadores", headers={**headers, **extra})
+
+
+def test_escritura_directa_en_la_base_invalida_el_etag(cliente, tablas, superusuario):
+    tablas["publicadores"] = [{
+        "id": "a", "nombre": "Ana", "numero": "1", "grupo": 1, "precursor": False, "animo": True,
+        "created_at": "2026-01-01T00:00:00+00:00", "updated_at": "2026-01-01T00:00:00+00:00",
+    }]
+    primera = _listar(cliente, superusuario)
+    assert primera.status_code == 200
+    etag = primera.headers["etag"]
+    assert _listar(cliente, superusuario, etag).status_code == 304
+
+    # Edición por fuera de la API (otro worker o SQL directo)
+    tablas["publicadores"][0].update(nombre="Ana María", updated_at="2026-01-02T00:00:00+00:00")
+    editada = _listar(cliente, superusuario, etag)
+    assert editada.status_code == 200
+    assert editada.json()[0]["nombre"] == "Ana María"
+
+    # Baja por fuera de la API: no mueve el máximo, sí la cantidad
+    etag = editada.headers["etag"]
+    tablas["publicadores"].append({**tablas["publicadores"][0], "id": "b", "updated_at": "2025-12-31T00:00:00+00:00"})
+    etag = _listar(cliente, superusuario, etag).headers["etag"]
+    tablas["publicadores"].pop()
+    assert _listar(cliente, superusuario, etag).status_code == 200
@@ -0,0 +1,50 @@
+from db import ConsultaAsync
+
+
+def _uuid(n):
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+def test_despues_de_arma_el_filtro_keyset():
+    consulta = ConsultaAsync(None, "publicadores")
+    consulta.despues_de("created_at", "2026-01-01T00:00:00+00:00", _uuid(7))
+    consulta.despues_de("fecha", 3, _uuid(1), desc=False)
+    assert consulta._params == [
+        ("or", f"(created_at.lt.2026-01-01T00:00:00+00:00,and(created_at.eq.2026-01-01T00:00:00+00:00,id.lt.{_uuid(7)}))"),
+        ("or", f"(fecha.gt.3,and(fecha.eq.3,id.gt.{_uuid(1)}))"),
+    ]
+
+
+def test_paginas_keyset_con_fechas_repetidas_no_pierden_ni_repiten_filas(main, cliente, tablas):
+    # Tres filas comparten created_at: el id desempata el orden
+    tablas["publicadores"] = [
+        {"id": _uuid(n), "grupo": n % 2, "created_at": f"2026-01-01T00:00:0{min(n, 3)}+00:00"} for n in range(6)
+    ]
+
+    async def paginar():
+        vistos = []
+        cursor = None
+        while True:
+            consulta = main.db.table("publicadores").select("id,created_at")
+            if cursor:
+                consulta = consulta.despues_de("created_at", cursor["created_at"], cursor["id"])
+            pagina = (await consulta.order("created_at", desc=True).order("id", desc=True).limit(2).execute()).data
+            if not pagina:
+                return vistos
+            vistos += [f["id"] for f in pagina]
+            cursor = pagina[-1]
+
+    assert cliente.portal.call(paginar) == [_uuid(n) for n in (5, 4, 3, 2, 1, 0)]
+
+
+def test_contar_con_y_sin_filtros(main, cliente, tablas):
+    tablas["publicadores"] = [{"id": _uuid(n), "grupo": n % 3} for n in range(7)]
+
+    async def contar():
+        return (
+            await main.db.contar("publicadores"),
+            await main.db.contar("publicadores", lambda q: q.eq("grupo", 1)),
+            await main.db.contar("territorios"),
+        )
+
+    assert cliente.portal.call(contar) == (7, 2, 0)
@@ -0,0 +1,63 @@
+import asyncio
+
+from db import ErrorDB, RespuestaDB
+from escritor_lotes import EscritorPorLotes
+
+
+class ConsultaFalsa:
+    def __init__(self, db, filas):
+        self.db = db
+        self.filas = filas
+
+    async def execute(self):
+        self.db.intentos += 1
+        if self.db.caida:
+            raise ErrorDB(503, "Service Unavailable")
+        if any(f["velocidad"] > 999.99 for f in self.filas):
+            raise ErrorDB(400, "numeric field overflow")
+        self.db.escritas.extend(self.filas)
+        return RespuestaDB(self.filas)
+
+
+class DBFalsa:
+    def __init__(self):
+        self.escritas = []
+        self.intentos = 0
+        self.caida = False
+
+    def table(self, nombre):
+        return self
+
+    def insert(self, filas):
+        return ConsultaFalsa(self, filas)
+
+
+def test_fila_mala_se_descarta_sin_bloquear_la_cola():
+    db = DBFalsa()
+    escritor = EscritorPorLotes(db, "ubicaciones", max_lote=8)
+    for i in range(8):
+        escritor.encolar({"n": i, "velocidad": 5000 if i == 3 else 10})
+    escritor.encolar({"n": 8, "velocidad": 10})
+
+    assert asyncio.run(escritor.vaciar()) is True
+    assert [f["n"] for f in db.escritas] == [0, 1, 2, 4, 5, 6, 7]
+    assert escritor.rechazadas == 1
+    # La fila que llegó después sigue en cola y se escribe en el siguiente lote
+    assert asyncio.run(escritor.vaciar()) is True
+    assert [f["n"] for f in db.escritas][-1] == 8
+    assert escritor.metricas()["profundidad"] == 0
+
+
+def test_error_transitorio_devuelve_el_lote_a_la_cola():
+    db = DBFalsa()
+    db.caida = True
+    escritor = EscritorPorLotes(db, "ubicaciones", max_lote=4)
+    for i in range(4):
+        escritor.encolar({"n": i, "velocidad": 10})
+
+    assert asyncio.run(escritor.vaciar()) is False
+    assert db.intentos == 1
+    assert escritor.errores == 1 and escritor.rechazadas == 0
+    db.caida = False
+    assert asyncio.run(escritor.vaciar()) is True
+    assert [f["n"] for f in db.escritas] == [0, 1, 2, 3]
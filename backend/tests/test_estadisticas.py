@@ -0,0 +1,15 @@
+def test_desviacion_en_agregados_con_el_mismo_total_se_corrige(main, cliente, tablas, superusuario):
+    tablas["publicadores"] = [
+        {"id": "a", "nombre": "Ana", "numero": "1", "grupo": 1, "precursor": True, "animo": False},
+        {"id": "b", "nombre": "Luis", "numero": "2", "grupo": 2, "precursor": False, "animo": True},
+    ]
+    main.estadisticas.verificado_en = 0.0
+    assert cliente.get("/publicadores/stats", headers=superusuario).json()["precursores"] == 1
+
+    # Cambio directo en la base: la cantidad de filas no cambia
+    tablas["publicadores"][1].update(grupo=1, precursor=True)
+    main.estadisticas.verificado_en = 0.0
+    resumen = cliente.get("/publicadores/stats", headers=superusuario).json()
+    assert resumen["total"] == 2
+    assert resumen["precursores"] == 2
+    assert [g["grupo"] for g in resumen["porGrupo"]] == [1]
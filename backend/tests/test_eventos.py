@@ -0,0 +1,65 @@
+import uuid
+
+
+def _usuario(tablas, rol, grupo):
+    usuario = {
+        "id": str(uuid.uuid4()), "email": "u@ejemplo.com", "nombre": "Siervo",
+        "rol": rol, "is_superuser": False, "grupo_asignado": grupo,
+    }
+    tablas["usuarios"].append(usuario)
+    return dict(usuario)
+
+
+def test_importacion_llega_a_suscriptores_de_su_grupo(main, cliente, tablas, superusuario):
+    tablas["publicadores"] = []
+    suscriptor = main.bus_eventos.suscribir(_usuario(tablas, "siervo", 2), solo_mi_grupo=True)
+    try:
+        cuerpo = (
+            '{"nombre": "Ana", "numero": "1", "grupo": 2, "precursor": false, "animo": true}\n'
+            '{"nombre": "Luis", "numero": "2", "grupo": 3, "precursor": false, "animo": true}\n'
+        )
+        cliente.post("/publicadores/import?formato=ndjson", content=cuerpo.encode(), headers=superusuario)
+        importados = [e for e in suscriptor.cola if e["canal"] == "publicadores"]
+        assert [(e["grupo"], e["datos"]["insertados"]) for e in importados] == [(2, 1)]
+    finally:
+        main.bus_eventos.desuscribir(suscriptor)
+
+
+def test_rol_revocado_cierra_la_suscripcion(main, cliente, tablas, superusuario):
+    usuario = _usuario(tablas, "siervo", 1)
+    suscriptor = main.bus_eventos.suscribir(usuario)
+    try:
+        respuesta = cliente.put(
+            f"/admin/users/{usuario['id']}/role", json={"user_id": usuario["id"], "rol": "pendiente"},
+            headers=superusuario
+        )
+        assert respuesta.status_code == 200
+        assert suscriptor.cerrado
+        main.bus_eventos.publicar("publicadores", "publicador_editado", {}, grupo=1)
+        assert not [e for e in suscriptor.cola if e["canal"] == "publicadores"]
+    finally:
+        main.bus_eventos.desuscribir(suscriptor)
+
+
+def test_cambio_directo_en_la_base_se_nota_en_el_heartbeat(main, cliente, tablas, superusuario):
+    usuario = _usuario(tablas, "anciano", 1)
+    suscriptor = main.bus_eventos.suscribir(usuario)
+    try:
+        # Rol quitado por SQL, sin pasar por la API; el perfil en caché ya venció
+        tablas["usuarios"][-1]["rol"] = "publicador"
+        main.perfil_cache.invalidate(usuario["id"])
+
+        async def heartbeat():
+            await main.revisar_permisos_suscriptor(suscriptor)
+        cliente.portal.call(heartbeat)
+
+        assert not suscriptor.cerrado
+        main.bus_eventos.publicar("publicadores", "publicador_editado", {}, grupo=1)
+        assert not suscriptor.cola
+
+        tablas["usuarios"].pop()
+        main.perfil_cache.invalidate(usuario["id"])
+        cliente.portal.call(heartbeat)
+        assert suscriptor.cerrado
+    finally:
+        main.bus_eventos.desuscribir(suscriptor)
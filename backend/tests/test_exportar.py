@@ -0,0 +1,13 @@
+import pytest
+
+from db import ErrorDB
+
+
+def test_error_a_mitad_del_export_aborta_la_respuesta(main, cliente, superusuario, monkeypatch):
+    async def iterar_keyset(tabla, **kwargs):
+        yield {"id": "1", "nombre": "Ana"}
+        raise ErrorDB(503, "conexión perdida")
+
+    monkeypatch.setattr(main.db, "iterar_keyset", iterar_keyset)
+    with pytest.raises(ErrorDB):
+        cliente.get("/export/publicadores?formato=ndjson", headers=superusuario)
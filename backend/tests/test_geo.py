@@ -0,0 +1,30 @@
+import pytest
+
+from geo import validar_poligonos
+
+
+def cuadrado(x0, y0, lado):
+    return [(x0, y0), (x0 + lado, y0), (x0 + lado, y0 + lado), (x0, y0 + lado), (x0, y0)]
+
+
+def test_poligono_con_hueco_e_isla_valido():
+    validar_poligonos([
+        [cuadrado(0, 0, 10), cuadrado(2, 2, 2), cuadrado(6, 6, 2)],
+        # Isla dentro del primer hueco
+        [cuadrado(2.5, 2.5, 1)],
+        [cuadrado(20, 0, 5)],
+    ])
+
+
+@pytest.mark.parametrize("poligonos, mensaje", [
+    ([[cuadrado(0, 0, 10), cuadrado(8, 8, 4)]], "se cortan"),
+    ([[cuadrado(0, 0, 10), cuadrado(0, 2, 2)]], "se tocan"),
+    ([[cuadrado(0, 0, 10), cuadrado(20, 20, 2)]], "no está dentro del anillo exterior"),
+    ([[cuadrado(0, 0, 10), cuadrado(2, 2, 6), cuadrado(3, 3, 1)]], "dentro del anillo 2"),
+    ([[cuadrado(0, 0, 10)], [cuadrado(5, 5, 10)]], "se cortan"),
+    ([[cuadrado(0, 0, 10)], [cuadrado(2, 2, 2)]], "dentro del polígono 1"),
+    ([[[(0, 0), (4, 4), (4, 0), (0, 4), (0, 0)]]], "se corta a sí mismo"),
+])
+def test_anillos_invalidos(poligonos, mensaje):
+    with pytest.raises(ValueError, match=mensaje):
+        validar_poligonos(poligonos)
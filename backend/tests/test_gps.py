@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+from gps import FiltroGPS
+
+INICIO = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _fix(segundos, lat, lng, precision=5.0):
+    return {"latitud": lat, "longitud": lng, "precision_gps": precision, "fecha": INICIO + timedelta(seconds=segundos)}
+
+
+def test_descarta_mala_precision_y_fixes_sin_movimiento():
+    filtro = FiltroGPS(precision_max_m=50, distancia_min_m=5, tolerancia_m=10, intervalo_max_seg=300)
+    aceptados, resumen = filtro.procesar("u1", [
+        _fix(0, -34.6, -58.4),
+        _fix(10, -34.60001, -58.4),  # ~1 m: sin movimiento
+        _fix(20, -34.601, -58.4, precision=80),
+        _fix(400, -34.60001, -58.4),  # Sin movimiento, pero pasó el intervalo máximo
+    ])
+    assert [f["fecha"] for f in aceptados] == [INICIO, INICIO + timedelta(seconds=400)]
+    assert resumen["descartados_precision"] == 1 and resumen["descartados_sin_movimiento"] == 1
+
+    # El último fix aceptado se recuerda entre lotes
+    aceptados, resumen = filtro.procesar("u1", [_fix(410, -34.60002, -58.4)])
+    assert aceptados == [] and resumen["descartados_sin_movimiento"] == 1
+
+
+def test_track_recto_se_simplifica():
+    filtro = FiltroGPS(distancia_min_m=5, tolerancia_m=10)
+    fixes = [_fix(i * 10, -34.6 + i * 0.001, -58.4) for i in range(10)]
+    aceptados, resumen = filtro.procesar("u1", fixes)
+    assert [f["fecha"] for f in aceptados] == [fixes[0]["fecha"], fixes[-1]["fecha"]]
+    assert resumen["simplificados"] == 8 and resumen["aceptados"] == 2
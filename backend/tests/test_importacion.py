@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+import importacion
+from db import ConsultaAsync, ErrorDB
+from importacion import filas_ndjson
+
+
+async def _stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _leer(stream):
+    return [fila async for fila in filas_ndjson(stream)]
+
+
+def test_ndjson_rechaza_lineas_que_no_son_objetos():
+    filas = asyncio.run(_leer(_stream(b'"hola"\n[1]\n3\n{"nombre": "Ana"}\n{malo\n')))
+    assert [n for n, _ in filas] == [1, 2, 3, 4, 5]
+    for _, fila in filas[:3]:
+        assert isinstance(fila, ValueError) and "objeto JSON" in str(fila)
+    assert filas[3][1] == {"nombre": "Ana"}
+    assert isinstance(filas[4][1], ValueError)
+
+
+def test_importacion_ndjson_con_linea_no_objeto_reporta_error_de_fila(cliente, tablas, superusuario):
+    tablas["publicadores"] = []
+    cuerpo = '"hola"\n{"nombre": "Ana", "numero": "1", "grupo": 1, "precursor": false, "animo": true}\n'
+    respuesta = cliente.post(
+        "/publicadores/import?formato=ndjson", content=cuerpo.encode(), headers=superusuario
+    )
+    assert respuesta.status_code == 200
+    datos = respuesta.json()
+    assert datos["insertados"] == 1
+    assert datos["total_errores"] == 1 and datos["errores"][0]["fila"] == 1
+
+
+def _fila(nombre, grupo=1):
+    return json.dumps({"nombre": nombre, "numero": "1", "grupo": grupo, "precursor": False, "animo": False})
+
+
+def test_fila_rechazada_por_la_base_no_tumba_el_lote(cliente, tablas, superusuario, monkeypatch):
+    tablas["publicadores"] = []
+    original = ConsultaAsync.execute
+
+    async def execute(self):
+        if self._tabla == "publicadores" and self._metodo == "POST":
+            if any(f["nombre"] == "Mala" for f in self._cuerpo):
+                raise ErrorDB(409, "duplicate key value")
+        return await original(self)
+
+    monkeypatch.setattr(ConsultaAsync, "execute", execute)
+    cuerpo = "\n".join(_fila(n) for n in ("Ana", "Beto", "Mala", "Caro", "Dani", "Mala"))
+    respuesta = cliente.post(
+        "/publicadores/import?formato=ndjson&lote=10", content=cuerpo.encode(), headers=superusuario
+    )
+    assert respuesta.status_code == 200
+    datos = respuesta.json()
+    assert datos["insertados"] == 4
+    assert [e["fila"] for e in datos["errores"]] == [3, 6]
+    assert sorted(p["nombre"] for p in tablas["publicadores"]) == ["Ana", "Beto", "Caro", "Dani"]
+
+
+def test_csv_con_comillas_sin_cerrar_se_rechaza(monkeypatch):
+    monkeypatch.setattr(importacion, "MAX_REGISTRO", 100)
+
+    async def leer():
+        return [f async for f in importacion.filas_csv(_stream(b'nombre,numero\n"abierta,1\n', *[b"x" * 50 + b"\n"] * 10))]
+
+    with pytest.raises(ValueError, match="comillas"):
+        asyncio.run(leer())
+
+
+def test_importacion_csv_con_comillas_sin_cerrar_responde_400(cliente, tablas, superusuario, monkeypatch):
+    tablas["publicadores"] = []
+    monkeypatch.setattr(importacion, "MAX_REGISTRO", 100)
+    cuerpo = 'nombre,numero,grupo\n"abierta,1,1\n' + ("x" * 50 + "\n") * 10
+    respuesta = cliente.post("/publicadores/import?formato=csv", content=cuerpo.encode(), headers=superusuario)
+    assert respuesta.status_code == 400
+    assert tablas["publicadores"] == []
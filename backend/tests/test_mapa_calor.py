@@ -0,0 +1,25 @@
+import asyncio
+from collections import Counter
+from datetime import date, timedelta
+
+from mapa_calor import MapaCalor
+
+
+def test_dos_teselas_del_mismo_rango_cargan_cada_dia_una_vez():
+    cargas = Counter()
+
+    async def cargar_dia(fuente, dia):
+        cargas[(fuente, dia)] += 1
+        return [{"latitud": -34.6, "longitud": -58.4, "tipo": "predicacion"}]
+
+    mapa = MapaCalor(cargar_dia, resolucion=8)
+    hasta = date(2026, 6, 30)
+    desde = hasta - timedelta(days=365)
+
+    async def correr():
+        for x in (0, 1):
+            await mapa.tesela(["marcaciones", "ubicaciones"], 1, x, 1, desde, hasta)
+
+    asyncio.run(correr())
+    assert len(cargas) == 2 * 366
+    assert set(cargas.values()) == {1}
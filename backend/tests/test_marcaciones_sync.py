@@ -0,0 +1,64 @@
+import uuid
+
+from db import ConsultaAsync, ErrorDB
+
+
+def _item(clave, **extra):
+    return {"latitud": -34.6, "longitud": -58.4, "tipo": "predicacion", "idempotency_key": clave, **extra}
+
+
+def _fallar_upsert(monkeypatch, decidir):
+    """`decidir(filas)` devuelve el ErrorDB a lanzar (después de escribir si es un 503) o None"""
+    original = ConsultaAsync.execute
+
+    async def execute(self):
+        if self._tabla == "marcaciones" and self._metodo == "POST":
+            error = decidir(self._cuerpo)
+            if error is not None and error.status_code < 500:
+                raise error
+            respuesta = await original(self)
+            if error is not None:
+                raise error
+            return respuesta
+        return await original(self)
+
+    monkeypatch.setattr(ConsultaAsync, "execute", execute)
+
+
+def test_fila_rechazada_no_tumba_el_lote(cliente, tablas, superusuario, monkeypatch):
+    tablas["marcaciones"] = []
+    _fallar_upsert(monkeypatch, lambda filas: (
+        ErrorDB(400, "violates foreign key") if any(f.get("observaciones") == "mala" for f in filas) else None
+    ))
+    items = [_item(f"k{i}") for i in range(5)]
+    items[2]["observaciones"] = "mala"
+    respuesta = cliente.post("/marcaciones/sync", json={"items": items}, headers=superusuario)
+    assert respuesta.status_code == 200
+    datos = respuesta.json()
+    assert datos["creadas"] == 4 and datos["errores"] == 1
+    assert datos["resultados"][2]["estado"] == "error"
+    assert len(tablas["marcaciones"]) == 4
+
+
+def test_territorio_desconocido_se_recalcula(cliente, tablas, superusuario):
+    tablas["marcaciones"] = []
+    items = [_item("t1", territorio_id="no-es-un-uuid"), _item("t2", territorio_id=str(uuid.uuid4()))]
+    respuesta = cliente.post("/marcaciones/sync", json={"items": items}, headers=superusuario)
+    assert respuesta.json()["creadas"] == 2
+    assert [f["territorio_id"] for f in tablas["marcaciones"]] == [None, None]
+
+
+def test_filas_guardadas_en_un_intento_fallido_se_indexan_al_reintentar(main, cliente, tablas, superusuario, monkeypatch):
+    tablas["marcaciones"] = []
+    _fallar_upsert(monkeypatch, lambda filas: ErrorDB(503, "timeout"))
+    items = [_item("r1"), _item("r2")]
+    primera = cliente.post("/marcaciones/sync", json={"items": items}, headers=superusuario).json()
+    # La base guardó las filas pero la respuesta se perdió
+    assert primera["errores"] == 2 and len(tablas["marcaciones"]) == 2
+    ids = [f["id"] for f in tablas["marcaciones"]]
+    assert not any(i in main.clusters._puntos for i in ids)
+
+    monkeypatch.undo()
+    segunda = cliente.post("/marcaciones/sync", json={"items": items}, headers=superusuario).json()
+    assert segunda["duplicadas"] == 2
+    assert all(i in main.clusters._puntos for i in ids)
@@ -0,0 +1,36 @@
+import base64
+import json
+
+
+def _cursor(valor):
+    return base64.urlsafe_b64encode(json.dumps(valor).encode()).decode().rstrip("=")
+
+
+def test_cursor_mal_formado_responde_400(cliente, tablas, superusuario):
+    tablas["notificaciones"] = []
+    for valor in (
+        ["2026-01-01T00:00:00+00:00", "no-es-uuid"],
+        ["ayer", "11111111-1111-1111-1111-111111111111"],
+        [1, "11111111-1111-1111-1111-111111111111"],
+        "texto",
+    ):
+        respuesta = cliente.get(f"/notificaciones/?before={_cursor(valor)}", headers=superusuario)
+        assert respuesta.status_code == 400, valor
+
+
+def test_paginas_con_since_llegan_hasta_la_fecha_pedida(cliente, tablas, superusuario):
+    tablas["notificaciones"] = [
+        {"id": f"00000000-0000-0000-0000-{n:012d}", "tipo": "rol_cambiado", "mensaje": str(n),
+         "fecha_creacion": f"2026-01-01T00:00:{n:02d}+00:00"}
+        for n in range(25)
+    ]
+    params = {"since": "2026-01-01T00:00:02+00:00", "limit": 10}
+    vistas = []
+    while True:
+        respuesta = cliente.get("/notificaciones/", params=params, headers=superusuario)
+        assert respuesta.status_code == 200
+        vistas += [n["mensaje"] for n in respuesta.json()]
+        if "x-next-cursor" not in respuesta.headers:
+            break
+        params["before"] = respuesta.headers["x-next-cursor"]
+    assert vistas == [str(n) for n in range(24, 2, -1)]
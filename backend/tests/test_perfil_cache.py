@@ -0,0 +1,53 @@
+import asyncio
+import uuid
+
+import stub_supabase
+from db import ConsultaAsync
+
+
+def _agregar_usuario(stub, tablas, rol):
+    usuario_id = str(uuid.uuid4())
+    tablas["usuarios"].append({
+        "id": usuario_id, "email": f"{usuario_id}@ejemplo.com", "nombre": "Siervo",
+        "rol": rol, "is_superuser": False, "grupo_asignado": 1,
+    })
+    return usuario_id, {"Authorization": "Bearer " + stub_supabase.crear_token(stub, usuario_id)}
+
+
+def test_cambio_de_rol_quita_permisos_en_el_siguiente_request(main, cliente, stub, tablas, superusuario):
+    tablas["publicadores"] = []
+    usuario_id, headers = _agregar_usuario(stub, tablas, "siervo")
+    assert cliente.get("/publicadores", headers=headers).status_code == 200
+
+    respuesta = cliente.put(
+        f"/admin/users/{usuario_id}/role", json={"user_id": usuario_id, "rol": "pendiente"}, headers=superusuario
+    )
+    assert respuesta.status_code == 200
+    assert cliente.get("/publicadores", headers=headers).status_code == 403
+
+
+def test_perfil_invalidado_durante_la_lectura_no_se_guarda(main, stub, tablas, superusuario, monkeypatch):
+    usuario_id, _ = _agregar_usuario(stub, tablas, "siervo")
+    main.perfil_cache.clear()
+    original = ConsultaAsync.execute
+
+    async def execute(self):
+        respuesta = await original(self)
+        if self._tabla == "usuarios":
+            # El rol cambia mientras la lectura está en vuelo
+            main.perfil_cache.invalidate(usuario_id)
+        return respuesta
+
+    monkeypatch.setattr(ConsultaAsync, "execute", execute)
+
+    async def leer():
+        from db import ClienteDB
+        db = ClienteDB(stub, stub_supabase.SERVICE_KEY)
+        monkeypatch.setattr(main, "db", db)
+        try:
+            return await main.obtener_perfil(usuario_id)
+        finally:
+            await db.cerrar()
+
+    assert asyncio.run(leer())["rol"] == "siervo"
+    assert main.perfil_cache.get(usuario_id) is None
@@ -0,0 +1,33 @@
+import pytest
+
+from posiciones import PosicionesEnVivo, parsear_bbox
+
+VIEWPORT = (-58.5, -34.7, -58.3, -34.5)
+
+
+def _posicion(lat, lng, fecha="2026-01-01T00:00:00+00:00"):
+    return {"latitud": lat, "longitud": lng, "fecha": fecha, "nombre": "Ana", "grupo": 1}
+
+
+def test_viewport_recibe_entradas_salidas_y_descarta_posiciones_viejas():
+    posiciones = PosicionesEnVivo(ttl_seg=900)
+    suscriptor = posiciones.suscribir(VIEWPORT)
+    posiciones.actualizar("u1", _posicion(-34.6, -58.4))
+    posiciones.actualizar("u2", _posicion(-31.4, -64.2))
+    assert list(suscriptor.pendientes) == ["u1"]
+    assert [p["usuario_id"] for p in posiciones.en_viewport(VIEWPORT)] == ["u1"]
+
+    # Un fix atrasado no mueve al usuario
+    assert not posiciones.actualizar("u1", _posicion(-31.4, -64.2, fecha="2025-12-31T00:00:00+00:00"))
+    assert posiciones.obtener("u1")["latitud"] == -34.6
+
+    posiciones.actualizar("u1", _posicion(-31.4, -64.2, fecha="2026-01-01T00:01:00+00:00"))
+    assert suscriptor.pendientes["u1"] == {"tipo": "salida", "usuario_id": "u1"}
+    assert posiciones.mover_viewport(suscriptor, (-64.3, -31.5, -64.1, -31.3)) != []
+    assert suscriptor.pendientes == {}
+
+
+@pytest.mark.parametrize("texto", ["1,2,3", "a,b,c,d", "10,0,0,1"])
+def test_parsear_bbox_invalido(texto):
+    with pytest.raises(ValueError):
+        parsear_bbox(texto)
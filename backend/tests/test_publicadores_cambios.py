@@ -0,0 +1,35 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+from db import ConsultaAsync
+
+UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+
+
+def test_cursor_de_cambios_usa_ids_validos(main, cliente, tablas, superusuario, monkeypatch):
+    ahora = datetime.now(timezone.utc)
+    tablas["publicadores"] = [{
+        "id": "11111111-1111-1111-1111-111111111111", "nombre": "Ana", "numero": "1", "grupo": 1,
+        "precursor": False, "animo": True,
+        "created_at": (ahora - timedelta(minutes=5)).isoformat(), "updated_at": ahora.isoformat(),
+    }]
+    tablas["publicadores_eliminados"] = []
+    filtros = []
+    original = ConsultaAsync.or_
+
+    def registrar(self, condiciones):
+        filtros.append(condiciones)
+        return original(self, condiciones)
+
+    monkeypatch.setattr(ConsultaAsync, "or_", registrar)
+
+    respuesta = cliente.get("/publicadores/changes", headers=superusuario)
+    assert respuesta.status_code == 200
+    # La fila es más reciente que el margen: el cursor queda en (límite, id inicial)
+    cursor = respuesta.json()["cursor"]
+    assert cliente.get(f"/publicadores/changes?since={cursor}", headers=superusuario).status_code == 200
+
+    assert filtros
+    for condiciones in filtros:
+        ids = re.findall(r"id\.gt\.([^)]*)\)", condiciones)
+        assert ids and all(re.fullmatch(UUID, i) for i in ids), condiciones
@@ -0,0 +1,29 @@
+import base64
+import json
+
+
+def test_listado_paginado_por_cursor(cliente, tablas, superusuario):
+    tablas["publicadores"] = [
+        {"id": f"00000000-0000-0000-0000-{n:012d}", "nombre": f"P{n}", "numero": str(n), "grupo": 1,
+         "precursor": False, "animo": False, "created_at": f"2026-01-01T00:00:{n:02d}+00:00"}
+        for n in range(5)
+    ]
+    nombres = []
+    params = {"limit": 2}
+    while True:
+        respuesta = cliente.get("/publicadores", params=params, headers=superusuario)
+        assert respuesta.status_code == 200
+        nombres += [p["nombre"] for p in respuesta.json()]
+        if "x-next-cursor" not in respuesta.headers:
+            break
+        params["cursor"] = respuesta.headers["x-next-cursor"]
+    assert nombres == ["P4", "P3", "P2", "P1", "P0"]
+
+
+def test_cursor_mal_formado_responde_400(cliente, tablas, superusuario):
+    tablas["publicadores"] = []
+    for valor in (["2026-01-01T00:00:00+00:00", "1),id.gt.(0"], ["no-es-fecha", "00000000-0000-0000-0000-000000000000"]):
+        cursor = base64.urlsafe_b64encode(json.dumps(valor).encode()).decode().rstrip("=")
+        respuesta = cliente.get(f"/publicadores?cursor={cursor}", headers=superusuario)
+        assert respuesta.status_code == 400, valor
+    assert cliente.get("/publicadores?cursor=%%%", headers=superusuario).status_code == 400
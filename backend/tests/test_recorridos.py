@@ -0,0 +1,32 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+import stub_supabase
+from db import ClienteDB
+from recorridos import compactar_dia, expandir_recorrido
+
+
+def test_compactar_dos_veces_no_duplica_puntos(stub, tablas):
+    inicio = datetime(2026, 3, 2, 8, 0, 0, 250000, tzinfo=timezone.utc)
+    tablas["ubicaciones"] = [{
+        "id": f"00000000-0000-0000-0000-{i:012d}", "usuario_id": "u1",
+        "latitud": 4.6 + i * 0.000123456, "longitud": -74.1 + i * 0.0000987,
+        "created_at": (inicio + timedelta(seconds=7.6 * i)).isoformat(),
+    } for i in range(10)]
+    tablas["recorridos"] = []
+
+    async def compactar_dos_veces():
+        db = ClienteDB(stub, stub_supabase.SERVICE_KEY)
+        try:
+            primero = await compactar_dia(db, date(2026, 3, 2), borrar=False)
+            segundo = await compactar_dia(db, date(2026, 3, 2), borrar=False)
+        finally:
+            await db.cerrar()
+        return primero, segundo
+
+    primero, segundo = asyncio.run(compactar_dos_veces())
+    assert primero["fixes"] == segundo["fixes"] == 10
+    assert len(tablas["recorridos"]) == 1
+    recorrido = tablas["recorridos"][0]
+    assert recorrido["num_puntos"] == 10
+    assert len(expandir_recorrido(recorrido)) == 10
@@ -0,0 +1,40 @@
+from territorios import IndiceTerritorios
+
+
+def test_etag_debil_compartido_por_gzip_e_identidad(cliente, superusuario):
+    gzip = cliente.get("/territorios", headers={**superusuario, "Accept-Encoding": "gzip"})
+    identidad = cliente.get("/territorios", headers={**superusuario, "Accept-Encoding": "identity"})
+    assert gzip.status_code == identidad.status_code == 200
+    etag = gzip.headers["etag"]
+    assert etag.startswith('W/"') and identidad.headers["etag"] == etag
+    assert "Accept-Encoding" in identidad.headers["vary"]
+
+    for valor in (etag, etag.removeprefix("W/"), f'"otro", {etag}'):
+        respuesta = cliente.get("/territorios", headers={**superusuario, "If-None-Match": valor})
+        assert respuesta.status_code == 304
+
+
+def _territorio(territorio_id, lng0, lat0, lado, hueco=None, estado="activo"):
+    def anillo(x, y, l):
+        return [[x, y], [x + l, y], [x + l, y + l], [x, y + l], [x, y]]
+    anillos = [anillo(lng0, lat0, lado)] + ([anillo(*hueco)] if hueco else [])
+    return {"id": territorio_id, "estado": estado, "geojson_data": {"type": "Polygon", "coordinates": anillos}}
+
+
+def test_resolver_con_superposicion_huecos_y_territorios_inactivos():
+    indice = IndiceTerritorios(celda_grados=0.01)
+    indice.reconstruir([
+        _territorio("grande", -58.5, -34.7, 0.2, hueco=(-58.45, -34.65, 0.01)),
+        _territorio("chico", -58.42, -34.62, 0.02),
+        _territorio("inactivo", -58.3, -34.7, 0.1, estado="inactivo"),
+    ])
+    assert indice.resolver(-34.61, -58.41) == "chico"  # El más específico gana
+    assert indice.resolver(-34.55, -58.35) == "grande"
+    assert indice.resolver(-34.645, -58.445) is None  # Dentro del hueco
+    assert indice.resolver(-34.65, -58.25) is None
+    assert indice.resolver(-34.0, -58.0) is None
+
+    indice.quitar("chico")
+    assert indice.resolver(-34.61, -58.41) == "grande"
+    lats, lngs = [-34.61, -34.645, -34.55], [-58.41, -58.445, -58.35]
+    assert indice.resolver_lote(lats, lngs) == [indice.resolver(la, ln) for la, ln in zip(lats, lngs)]
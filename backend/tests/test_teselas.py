@@ -0,0 +1,39 @@
+import asyncio
+
+from teselas import CacheTeselas
+
+
+def test_escritura_durante_la_carga_no_deja_la_tesela_vieja_en_cache():
+    async def correr():
+        liberar = asyncio.Event()
+        cargas = []
+
+        async def cargar(prefijo):
+            cargas.append(prefijo)
+            await liberar.wait()
+            return [len(cargas)]
+
+        teselas = CacheTeselas(cargar)
+        clave = teselas.tesela(-34.6, -58.4)
+        carga = asyncio.create_task(teselas._tesela(clave))
+        await asyncio.sleep(0)
+        teselas.invalidar(-34.6, -58.4)
+        liberar.set()
+        await carga
+        assert teselas.cache.get(clave) is None
+        assert await teselas._tesela(clave) == [2]
+        assert teselas.cache.get(clave) == [2]
+
+    asyncio.run(correr())
+
+
+def test_invalidaciones_no_acumulan_estado():
+    async def cargar(prefijo):
+        return []
+
+    teselas = CacheTeselas(cargar, maxsize=4)
+    for i in range(1000):
+        teselas.invalidar(-34 + i * 0.01, -58 + i * 0.01)
+    asyncio.run(teselas._tesela(teselas.tesela(-34, -58)))
+    assert teselas._cargando == {}
+    assert teselas.metricas()["cargas_en_curso"] == 0
@@ -203,4 +203,153 @@ INSERT INTO territorios (nombre, descripcion, geojson_data) VALUES (
       "name": "Territorio Centro"
     }
   }'::jsonb
-); 
\ No newline at end of file
+); 
+-- ========================================
+-- ÍNDICES DE RENDIMIENTO PARA LA API
+-- ========================================
+
+-- Paginación por cursor (keyset) de publicadores sobre (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_publicadores_created_id ON publicadores(created_at DESC, id DESC);
+
+-- Filtros del listado de publicadores
+CREATE INDEX IF NOT EXISTS idx_publicadores_grupo ON publicadores(grupo, created_at DESC, id DESC);
+
+-- Paginación de notificaciones por (fecha_creacion, id) y conteo desde una fecha
+CREATE INDEX IF NOT EXISTS idx_notificaciones_fecha_id ON notificaciones(fecha_creacion DESC, id DESC);
+
+-- ========================================
+-- ÍNDICE ESPACIAL DE MARCACIONES (GEOHASH)
+-- ========================================
+
+-- Geohash de 8 caracteres (~38 m) calculado por la API al insertar o editar.
+-- Las filas existentes se completan con: python backend/backfill.py geohash
+ALTER TABLE marcaciones ADD COLUMN IF NOT EXISTS geohash TEXT;
+
+-- Consultas por tesela con prefijo (geohash LIKE 'd2g61v%')
+CREATE INDEX IF NOT EXISTS idx_marcaciones_geohash ON marcaciones(geohash text_pattern_ops);
+
+-- ========================================
+-- RECORRIDOS (UBICACIONES COMPACTADAS)
+-- ========================================
+
+-- Un recorrido por usuario y día: polilínea codificada (Google, precisión 1e-5)
+-- y tiempos en segundos desde `inicio` como deltas con la misma codificación.
+-- Se generan con: python backend/compactar_ubicaciones.py (borra las filas crudas)
+CREATE TABLE IF NOT EXISTS recorridos (
+  id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+  usuario_id UUID NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+  fecha DATE NOT NULL,
+  polyline TEXT NOT NULL,
+  tiempos TEXT NOT NULL,
+  num_puntos INTEGER NOT NULL,
+  distancia_m REAL NOT NULL,
+  duracion_seg INTEGER NOT NULL,
+  inicio TIMESTAMP WITH TIME ZONE NOT NULL,
+  fin TIMESTAMP WITH TIME ZONE NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  UNIQUE (usuario_id, fecha)
+);
+
+CREATE INDEX IF NOT EXISTS idx_recorridos_fecha ON recorridos(fecha);
+
+-- La compactación y el mapa de calor leen un día completo por páginas keyset sobre
+-- (created_at, id), sin filtrar por usuario: idx_ubicaciones_usuario_fecha no sirve
+-- para eso y cada página sería un recorrido completo de la tabla más un ordenamiento
+CREATE INDEX IF NOT EXISTS idx_ubicaciones_fecha_id ON ubicaciones(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_marcaciones_fecha_id ON marcaciones(created_at, id);
+
+-- Sin políticas: solo la API (service key) lee y escribe recorridos
+ALTER TABLE recorridos ENABLE ROW LEVEL SECURITY;
+
+-- ========================================
+-- METADATOS DE GEOMETRÍA DE TERRITORIOS
+-- ========================================
+
+-- Calculados por la API al crear o editar un territorio (después de validar el
+-- polígono), para no volver a procesar el GeoJSON en cada lectura.
+-- Las filas existentes se completan con: python backend/backfill.py territorios
+ALTER TABLE territorios ADD COLUMN IF NOT EXISTS min_lng DOUBLE PRECISION;
+ALTER TABLE territorios ADD COLUMN IF NOT EXISTS min_lat DOUBLE PRECISION;
+ALTER TABLE territorios ADD COLUMN IF NOT EXISTS max_lng DOUBLE PRECISION;
+ALTER TABLE territorios ADD COLUMN IF NOT EXISTS max_lat DOUBLE PRECISION;
+ALTER TABLE territorios ADD COLUMN IF NOT EXISTS area_m2 DOUBLE PRECISION;
+ALTER TABLE territorios ADD COLUMN IF NOT EXISTS centroide_lat DOUBLE PRECISION;
+ALTER TABLE territorios ADD COLUMN IF NOT EXISTS centroide_lng DOUBLE PRECISION;
+ALTER TABLE territorios ADD COLUMN IF NOT EXISTS num_vertices INTEGER;
+
+-- Búsqueda de territorios que tocan un rectángulo sin leer geojson_data
+CREATE INDEX IF NOT EXISTS idx_territorios_bbox ON territorios(min_lat, max_lat, min_lng, max_lng);
+
+-- ========================================
+-- SINCRONIZACIÓN OFFLINE DE MARCACIONES
+-- ========================================
+
+-- Clave generada por el cliente para cada marcación guardada sin conexión.
+-- POST /marcaciones/sync inserta con ON CONFLICT DO NOTHING sobre esta restricción,
+-- así un reintento del mismo lote no duplica filas.
+ALTER TABLE marcaciones ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_marcaciones_idempotency
+  ON marcaciones(usuario_id, idempotency_key);
+
+-- ========================================
+-- SINCRONIZACIÓN INCREMENTAL DE PUBLICADORES
+-- ========================================
+
+-- GET /publicadores/changes recorre publicadores por (updated_at, id)
+ALTER TABLE publicadores ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+UPDATE publicadores SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+ALTER TABLE publicadores ALTER COLUMN updated_at SET NOT NULL;
+
+DROP TRIGGER IF EXISTS update_publicadores_updated_at ON publicadores;
+CREATE TRIGGER update_publicadores_updated_at
+    BEFORE UPDATE ON publicadores
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS idx_publicadores_updated_id ON publicadores(updated_at, id);
+
+-- Lápidas de publicadores eliminados, para que los clientes quiten su copia
+CREATE TABLE IF NOT EXISTS publicadores_eliminados (
+  id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+  publicador_id UUID NOT NULL,
+  grupo INTEGER,
+  eliminado_en TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_publicadores_eliminados_en ON publicadores_eliminados(eliminado_en, id);
+
+-- La lápida se escribe en la misma transacción que el DELETE: no puede haber
+-- un publicador borrado sin lápida, venga el DELETE de la API o de otro lado
+CREATE OR REPLACE FUNCTION registrar_publicador_eliminado()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO publicadores_eliminados (publicador_id, grupo) VALUES (OLD.id, OLD.grupo);
+    RETURN OLD;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS registrar_publicadores_eliminados ON publicadores;
+CREATE TRIGGER registrar_publicadores_eliminados
+    AFTER DELETE ON publicadores
+    FOR EACH ROW EXECUTE FUNCTION registrar_publicador_eliminado();
+
+-- Sin políticas: solo la API (service key) lee y escribe las lápidas
+ALTER TABLE publicadores_eliminados ENABLE ROW LEVEL SECURITY;
+
+-- ========================================
+-- GET CONDICIONAL DE LISTADOS
+-- ========================================
+
+-- El ETag de /admin/users se deriva de max(updated_at) y la cantidad de usuarios
+ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+UPDATE usuarios SET updated_at = NOW() WHERE updated_at IS NULL;
+ALTER TABLE usuarios ALTER COLUMN updated_at SET NOT NULL;
+
+DROP TRIGGER IF EXISTS update_usuarios_updated_at ON usuarios;
+CREATE TRIGGER update_usuarios_updated_at
+    BEFORE UPDATE ON usuarios
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Índices para leer el máximo sin recorrer la tabla
+CREATE INDEX IF NOT EXISTS idx_usuarios_updated_at ON usuarios(updated_at);
+CREATE INDEX IF NOT EXISTS idx_notificaciones_fecha_creacion ON notificaciones(fecha_creacion);